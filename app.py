@@ -2,21 +2,33 @@
 # coding:utf-8
 import sys
 
+'''
+系统入口，启动web server
+以gevent协程方式运行时，在导入其它模块（dbutils的连接池、pymysql）之前monkey patch，
+使数据库等网络读写在等待时切换到其它协程，一个耗时的请求（如导出）不会阻塞其它请求
+'''
+debug = len(sys.argv) == 2 and sys.argv[1] == 'debug'
+if __name__ == '__main__' and not debug:
+    from gevent import monkey
+
+    monkey.patch_all()
+
+from gevent.pool import Pool
 from gevent.pywsgi import WSGIServer
 
 from instance.config import ProductionConfig
+from nemo.core.database import dbutils
 from nemo.web.flask_app import web_app
 
-'''
-系统入口，启动web server
-'''
-
 host = ProductionConfig.WEB_HOST
 port = ProductionConfig.WEB_PORT
 
 
 def web_server():
-    http_server = WSGIServer((host, port), web_app)
+    # 连接池的最大连接数不超过协程数，连接数已满时协程等待空闲的连接
+    pool_size = min(ProductionConfig.DB_POOL_SIZE, ProductionConfig.WEB_GREENLETS)
+    dbutils.configure_pool(maxconnections=pool_size, maxcached=pool_size, blocking=True)
+    http_server = WSGIServer((host, port), web_app, spawn=Pool(ProductionConfig.WEB_GREENLETS))
     http_server.serve_forever()
 
 
@@ -25,7 +37,7 @@ def main_debug():
 
 
 if __name__ == '__main__':
-    if len(sys.argv) == 2 and sys.argv[1] == 'debug':
+    if debug:
         main_debug()
     else:
         web_server()
@@ -13,6 +13,8 @@ class Config:
     SECRET_KEY = os.urandom(16)
     WEB_HOST = '0.0.0.0'
     WEB_PORT = 5000
+    # web server（gevent）同时处理请求的协程数
+    WEB_GREENLETS = 100
     VERSION = '1.0.0'
 
 
@@ -20,18 +22,33 @@ class ProductionConfig(Config):
     def __init__(self):
         super().__init__()
 
-    # database
+    # database：DB_BACKEND为mysql或sqlite（本地测试，DB_SQLITE_PATH为数据库文件，':memory:'为内存数据库）
+    DB_BACKEND = 'mysql'
+    DB_SQLITE_PATH = ':memory:'
     DB_HOST = '127.0.0.1'
     DB_PORT = 3306
     DB_NAME = 'nemo'
     DB_USERNAME = 'nemo'
     DB_PASSWORD = 'nemo2020'
+    # web server的数据库连接池最大连接数，协程数超过连接数时等待空闲连接
+    DB_POOL_SIZE = 20
+    # web请求中查询语句的最长执行时间（秒），导出及统计的请求使用DB_EXPORT_TIMEOUT，0为不限制
+    DB_QUERY_TIMEOUT = 10
+    DB_EXPORT_TIMEOUT = 600
+    # 只读的从库：web的查询、统计及导出使用从库，DB_REPLICA_HOST为空时不使用（用户名及密码与主库相同）
+    DB_REPLICA_HOST = ''
+    DB_REPLICA_PORT = 3306
+    # 从库的复制延迟超过该值（秒）时查询主库；写操作后该时间内的查询也使用主库
+    DB_REPLICA_MAX_LAG = 5
 
     # rabbitmq
     MQ_HOST = 'localhost'
     MQ_PORT = 5672
     MQ_USERNAME = 'guest'
     MQ_PASSWORD = 'guest'
+    # celery的任务结果存储：为空时为rpc://；分片的端口扫描（chord）需要worker之间共享结果，不能使用rpc://
+    # 'mysql'为使用上面的MySQL数据库（db+mysql+pymysql://，需安装sqlalchemy），也可以为redis://等celery支持的地址
+    MQ_RESULT_BACKEND = ''
 
     # flower
     FLOWER_BIND_ADDR = '127.0.0.1'
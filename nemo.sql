@@ -16,6 +16,20 @@
 
 SET NAMES utf8mb4;
 SET FOREIGN_KEY_CHECKS = 0;
+-- ngram全文索引不使用停用词
+SET SESSION innodb_ft_enable_stopword = 0;
+
+-- ----------------------------
+-- Table structure for cache_generation
+-- ----------------------------
+DROP TABLE IF EXISTS `cache_generation`;
+CREATE TABLE `cache_generation` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `table_name` varchar(64) NOT NULL,
+  `generation` bigint(20) unsigned NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_cache_generation_table_name` (`table_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ----------------------------
 -- Table structure for domain
@@ -30,6 +44,7 @@ CREATE TABLE `domain` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `index_domain_domain` (`domain`) USING BTREE,
   KEY `fk_domain_org_id` (`org_id`),
+  KEY `index_domain_update_datetime` (`update_datetime`),
   CONSTRAINT `fk_domain_org_id` FOREIGN KEY (`org_id`) REFERENCES `organization` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=1796 DEFAULT CHARSET=utf8mb4;
 
@@ -49,6 +64,7 @@ CREATE TABLE `domain_attr` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `index_domain_attr_hash` (`hash`) USING BTREE,
   KEY `index_domain_attr_ip_id` (`r_id`),
+  KEY `index_domain_attr_tag_content` (`tag`,`content`(255)),
   CONSTRAINT `domain_attr_ibfk_1` FOREIGN KEY (`r_id`) REFERENCES `domain` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=3272 DEFAULT CHARSET=utf8mb4;
 
@@ -80,9 +96,30 @@ CREATE TABLE `domain_memo` (
   `update_datetime` datetime DEFAULT NULL,
   PRIMARY KEY (`id`),
   UNIQUE KEY `fk_domain_memo_rid_unique` (`r_id`),
+  FULLTEXT KEY `ft_domain_memo_content` (`content`) WITH PARSER ngram,
   CONSTRAINT `fk_domain_memo_rid` FOREIGN KEY (`r_id`) REFERENCES `domain` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=4 DEFAULT CHARSET=utf8mb4;
 
+-- ----------------------------
+-- Table structure for domain_summary
+-- ----------------------------
+DROP TABLE IF EXISTS `domain_summary`;
+CREATE TABLE `domain_summary` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `r_id` int(10) unsigned NOT NULL,
+  `ip` text,
+  `port` text,
+  `title` text,
+  `banner` text,
+  `vulnerability` text,
+  `vulnerability_count` int(10) unsigned NOT NULL DEFAULT '0',
+  `create_datetime` datetime NOT NULL,
+  `update_datetime` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_domain_summary_rid` (`r_id`),
+  CONSTRAINT `fk_domain_summary_rid` FOREIGN KEY (`r_id`) REFERENCES `domain` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- ----------------------------
 -- Table structure for ip
 -- ----------------------------
@@ -90,7 +127,8 @@ DROP TABLE IF EXISTS `ip`;
 CREATE TABLE `ip` (
   `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
   `ip` varchar(128) CHARACTER SET utf8 NOT NULL,
-  `ip_int` bigint(11) NOT NULL,
+  `ip_int` bigint(11) DEFAULT NULL,
+  `ip_bin` binary(16) NOT NULL,
   `org_id` int(10) unsigned DEFAULT NULL,
   `location` varchar(200) CHARACTER SET utf8 DEFAULT NULL,
   `status` varchar(20) CHARACTER SET utf8 DEFAULT NULL,
@@ -99,7 +137,9 @@ CREATE TABLE `ip` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `index_ip_ip` (`ip`) USING BTREE,
   UNIQUE KEY `index_ip_ip_int` (`ip_int`) USING BTREE,
+  UNIQUE KEY `index_ip_ip_bin` (`ip_bin`) USING BTREE,
   KEY `index_ip_org_id` (`org_id`),
+  KEY `index_ip_update_datetime` (`update_datetime`),
   CONSTRAINT `fk_ip_org_id` FOREIGN KEY (`org_id`) REFERENCES `organization` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=635 DEFAULT CHARSET=utf8mb4;
 
@@ -150,9 +190,31 @@ CREATE TABLE `ip_memo` (
   `update_datetime` datetime DEFAULT NULL,
   PRIMARY KEY (`id`),
   UNIQUE KEY `fk_ip_memo_rid_unqie` (`r_id`),
+  FULLTEXT KEY `ft_ip_memo_content` (`content`) WITH PARSER ngram,
   CONSTRAINT `fk_ip_memo_rid` FOREIGN KEY (`r_id`) REFERENCES `ip` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=7 DEFAULT CHARSET=utf8mb4;
 
+-- ----------------------------
+-- Table structure for ip_summary
+-- ----------------------------
+DROP TABLE IF EXISTS `ip_summary`;
+CREATE TABLE `ip_summary` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `r_id` int(10) unsigned NOT NULL,
+  `port` text,
+  `port_status` text,
+  `title` text,
+  `banner` text,
+  `domain` text,
+  `vulnerability` text,
+  `vulnerability_count` int(10) unsigned NOT NULL DEFAULT '0',
+  `create_datetime` datetime NOT NULL,
+  `update_datetime` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_ip_summary_rid` (`r_id`),
+  CONSTRAINT `fk_ip_summary_rid` FOREIGN KEY (`r_id`) REFERENCES `ip` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- ----------------------------
 -- Table structure for organization
 -- ----------------------------
@@ -199,9 +261,26 @@ CREATE TABLE `port_attr` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `index_port_attr_hash` (`hash`),
   KEY `fk_port_attr_r_id` (`r_id`),
+  FULLTEXT KEY `ft_port_attr_content` (`content`) WITH PARSER ngram,
   CONSTRAINT `fk_port_attr_r_id` FOREIGN KEY (`r_id`) REFERENCES `port` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=2597 DEFAULT CHARSET=utf8mb4;
 
+-- ----------------------------
+-- Table structure for schema_version
+-- ----------------------------
+DROP TABLE IF EXISTS `schema_version`;
+CREATE TABLE `schema_version` (
+  `version` int(10) unsigned NOT NULL,
+  `name` varchar(100) NOT NULL,
+  `applied_datetime` datetime NOT NULL,
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ----------------------------
+-- Records of schema_version: nemo.sql已包含的数据库升级
+-- ----------------------------
+INSERT INTO `schema_version` VALUES (1, 'fulltext', NOW()), (2, 'summary', NOW()), (3, 'index_pack', NOW()), (4, 'ipv6', NOW()), (5, 'task_unique', NOW()), (6, 'vulnerability_unique', NOW()), (7, 'cache_generation', NOW());
+
 -- ----------------------------
 -- Table structure for task
 -- ----------------------------
@@ -224,7 +303,10 @@ CREATE TABLE `task` (
   `progress_message` varchar(100) DEFAULT NULL,
   `create_datetime` datetime NOT NULL,
   `update_datetime` datetime NOT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_task_task_id` (`task_id`),
+  KEY `index_task_state` (`state`),
+  KEY `index_task_update_datetime` (`update_datetime`)
 ) ENGINE=InnoDB AUTO_INCREMENT=89 DEFAULT CHARSET=utf8mb4;
 
 -- ----------------------------
@@ -241,7 +323,10 @@ CREATE TABLE `vulnerability` (
   `hash` char(32) NOT NULL,
   `create_datetime` datetime NOT NULL,
   `update_datetime` datetime NOT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_vulnerability_hash` (`hash`),
+  KEY `index_vulnerability_target` (`target`),
+  KEY `index_vulnerability_update_datetime` (`update_datetime`)
 ) ENGINE=InnoDB AUTO_INCREMENT=15 DEFAULT CHARSET=utf8mb4;
 
 SET FOREIGN_KEY_CHECKS = 1;
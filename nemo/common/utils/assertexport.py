@@ -1,168 +1,174 @@
 #!/usr/bin/env python3
 # coding:utf-8
+import time
 import traceback
-from copy import copy
 from tempfile import NamedTemporaryFile
 
-from openpyxl import load_workbook
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.styles import Alignment, Border, Color, Font, NamedStyle, PatternFill, Side
 
 from nemo.common.utils.assertinfoparser import AssertInfoParser
 from nemo.common.utils.loggerutils import logger
-from nemo.core.database.attr import DomainAttr
+from nemo.core.database import dbutils
 from nemo.core.database.domain import Domain
 from nemo.core.database.ip import Ip
-from nemo.core.database.organization import Organization
 
-template_path = 'nemo/web/templates'
-template_file_domain = '{}/domain-export.xlsx'.format(template_path)
-template_file_ip = '{}/ip-export.xlsx'.format(template_path)
+# 每次从数据库读取的记录数
+fetch_size = 500
+# 输出到客户端的每块数据大小
+chunk_size = 64 * 1024
+
+# 导出文件的表头及列宽
+ip_columns = (('序号', 6.2), ('IP', 21.2), ('关联域名', 30.7), ('归属地', 20.3), ('端口', 10.5),
+              ('来源', 10.3), ('属性', 11.5), ('内容', 91.8), ('更新时间', 21.5))
+domain_columns = (('序号', 5.7), ('域名', 30.7), ('IP', 20.2), ('端口', 23.2), ('标题', 55), ('Banners', 64))
 
 
 def _get_domains(org_id, domain_address, ip_address, color_tag, memo_content, date_delta):
-    '''获取域名
+    '''获取域名（生成器）：使用服务器端游标读取域名，每批域名的聚合信息批量读取
     '''
     domain_app = Domain()
-    domain_attr_app = DomainAttr()
-    org_app = Organization()
     api = AssertInfoParser()
 
-    domain_list = []
-    domains = domain_app.gets_by_search(
-        org_id, domain_address, ip_address, color_tag, memo_content, date_delta, page=1, rows_per_page=100000)
-    if domains:
-        for index, domain_row in enumerate(domains):
-            ips = domain_attr_app.gets(
-                query={'tag': 'A', 'r_id': domain_row['id']})
-            domain_info = api.get_domain_info(domain_row['id'])
-            domain_list.append({
+    index = 0
+    domain_rows = domain_app.iter_by_search(org_id, domain_address, ip_address, color_tag, memo_content, date_delta,
+                                            fetch_size=fetch_size)
+    for domains in dbutils.chunks(domain_rows, fetch_size):
+        domains_summary = api.get_domains_summary(domains)
+        for domain_row in domains:
+            summary = domains_summary[domain_row['id']]
+            index += 1
+            yield {
                 'id': domain_row['id'],
-                "index": index + 1,
+                "index": index,
                 "domain": domain_row['domain'],
-                "ip": ', '.join(set([ip_row['content'] for ip_row in ips])),
-                "org_name": org_app.get(int(domain_row['org_id']))['org_name'] if domain_row['org_id'] else '',
+                "ip": ', '.join(set(summary['ip'])),
                 "create_time": str(domain_row['create_datetime']),
                 "update_time": str(domain_row['update_datetime']),
-                'port': ', '.join([str(x) for x in domain_info['port']]),
-                'title': '\n'.join(domain_info['title']),
-                'banner': '\n'.join(domain_info['banner'])
-            })
-
-    return domain_list
+                'port': ', '.join([str(x) for x in summary['port']]),
+                'title': '\n'.join(summary['title']),
+                'banner': '\n'.join(summary['banner'])
+            }
 
 
 def _get_ips(org_id, domain_address, ip_address, port, content, iplocation, port_status, color_tag, memo_content,
              date_delta):
-    '''获取IP
+    '''获取IP（生成器）：使用服务器端游标读取IP，每批IP的端口属性及聚合信息（关联域名）批量查询
     '''
     ip_table = Ip()
     aip = AssertInfoParser()
 
-    ip_list = []
-    ips = ip_table.gets_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port, content=content,
-                                  iplocation=iplocation,
-                                  port_status=port_status, color_tag=color_tag, memo_content=memo_content,
-                                  date_delta=date_delta,
-                                  page=1, rows_per_page=100000)
-    if ips:
-        for i, ip_row in enumerate(ips):
-            ip_info = aip.get_ip_info(ip_row['id'])
-            ip_info.update(index=i + 1)
-            ip_list.append(ip_info)
+    index = 0
+    ip_rows = ip_table.iter_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port,
+                                      content=content, iplocation=iplocation,
+                                      port_status=port_status, color_tag=color_tag, memo_content=memo_content,
+                                      date_delta=date_delta, fetch_size=fetch_size)
+    for ips in dbutils.chunks(ip_rows, fetch_size):
+        ips_port_info = aip.get_ips_port_info(ips)
+        ips_summary = aip.get_ips_summary(ips)
+        for ip_row in ips:
+            index += 1
+            yield {'index': index, 'ip': ip_row['ip'], 'location': ip_row['location'],
+                   'domain': ips_summary[ip_row['id']]['domain'], 'port_attr': ips_port_info[ip_row['id']][3]}
+
+
+def _create_workbook(columns):
+    '''创建write-only模式的工作簿：只定义一次表头和单元格的样式
+    '''
+    wb = Workbook(write_only=True)
+    side = Side(style='thin')
+    border = Border(left=side, right=side, top=side, bottom=side)
+    header_style = NamedStyle(name='export_header', font=Font(name='等线', size=12, bold=True),
+                              fill=PatternFill(fill_type='solid', fgColor=Color(theme=2, tint=-0.1)),
+                              border=border, alignment=Alignment(horizontal='center', vertical='center'))
+    cell_style = NamedStyle(name='export_cell', font=Font(name='等线', size=12), border=border,
+                            alignment=Alignment(vertical='center', wrap_text=True))
+    wb.add_named_style(header_style)
+    wb.add_named_style(cell_style)
+
+    ws = wb.create_sheet()
+    for i, (_, width) in enumerate(columns):
+        ws.column_dimensions[chr(ord('A') + i)].width = width
+    ws.row_dimensions[1].height = 25
+    ws.append([_style_cell(ws, title, 'export_header') for title, _ in columns])
+
+    return wb, ws
+
+
+def _style_cell(ws, value, style='export_cell'):
+    '''生成指定样式的单元格
+    '''
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
 
-    return ip_list
+    return cell
 
 
-def _copy_cell_style(ws, src_row, dst_row, col_from, col_to):
-    '''复制单元格格式
+def _save_workbook(wb, export_name, start_time, rows):
+    '''保存工作簿到临时文件，再分块读取输出
+    write-only模式只减少生成时的内存占用；xlsx为zip格式，文件全部写入后才开始输出
     '''
-    for i in range(col_from, col_to + 1):
-        ws.cell(column=i, row=dst_row).border = copy(
-            ws.cell(column=i, row=src_row).border)
-        ws.cell(column=i, row=dst_row).font = copy(
-            ws.cell(column=i, row=src_row).font)
-        ws.cell(column=i, row=dst_row).fill = copy(
-            ws.cell(column=i, row=src_row).fill)
-        ws.cell(column=i, row=dst_row).alignment = copy(
-            ws.cell(column=i, row=src_row).alignment)
+    with NamedTemporaryFile() as tmp:
+        wb.save(tmp.name)
+        elapsed = time.time() - start_time
+        logger.info('{} export {} rows in {:.1f}s, {:.1f} rows/s'.format(
+            export_name, rows, elapsed, rows / elapsed if elapsed > 0 else rows))
+        tmp.seek(0)
+        while True:
+            data = tmp.read(chunk_size)
+            if not data:
+                break
+            yield data
 
 
 def export_domains(org_id=None, domain_address=None, ip_address=None, color_tag=None, memo_content=None,
                    date_delta=None):
-    '''导出域名为excel文件
+    '''导出域名为excel文件（生成器，生成文件后分块输出文件内容）
     '''
-    wb = load_workbook(template_file_domain)
-    ws = wb.active
-    domains = _get_domains(org_id, domain_address,
-                           ip_address, color_tag, memo_content, date_delta)
-    row_start = 2
-    for domain in domains:
-        _copy_cell_style(ws, 2, row_start, 1, 7)
-        ws.cell(column=1, row=row_start, value="{0}".format(domain['index']))
-        ws.cell(column=2, row=row_start, value="{0}".format(domain['domain']))
-        ws.cell(column=3, row=row_start, value="{0}".format(domain['ip']))
-        ws.cell(column=4, row=row_start, value="{0}".format(domain['port']))
-        ws.cell(column=5, row=row_start, value="{0}".format(domain['title']))
-        ws.cell(column=6, row=row_start, value="{0}".format(domain['banner']))
-        row_start += 1
+    start_time = time.time()
+    wb, ws = _create_workbook(domain_columns)
+    rows = 0
+    for domain in _get_domains(org_id, domain_address, ip_address, color_tag, memo_content, date_delta):
+        ws.append([_style_cell(ws, "{0}".format(domain[key]))
+                   for key in ('index', 'domain', 'ip', 'port', 'title', 'banner')])
+        rows += 1
 
-    with NamedTemporaryFile() as tmp:
-        wb.save(tmp.name)
-        tmp.seek(0)
-        data = tmp.read()
-        return data
+    yield from _save_workbook(wb, 'domain', start_time, rows)
 
 
 def export_ips(org_id=None, domain_address=None, ip_address=None, port=None, content=None, iplocation=None,
                port_status=None, color_tag=None, memo_content=None, date_delta=None):
-    '''导出IP为excel文件
+    '''导出IP为excel文件（生成器，生成文件后分块输出文件内容）
+    每个IP的每个端口属性为一行，IP相关的列合并显示
     '''
-    wb = load_workbook(template_file_ip)
-    ws = wb.active
-    ips = _get_ips(org_id, domain_address, ip_address,
-                   port, content, iplocation, port_status, color_tag, memo_content, date_delta)
+    start_time = time.time()
+    wb, ws = _create_workbook(ip_columns)
     row_start = 2
-    for ip in ips:
+    # 合并的单元格最后一次设置：逐个add时每次都检查与已有合并区域的包含关系（O(n²)）
+    merged_ranges = []
+    for ip in _get_ips(org_id, domain_address, ip_address,
+                       port, content, iplocation, port_status, color_tag, memo_content, date_delta):
         merged_row_start = row_start
-        _copy_cell_style(ws, 2, row_start, 1, 9)
-        if ip['port_attr']:
-            for port in ip['port_attr']:
-                try:
-                    _copy_cell_style(ws, 2, row_start, 1, 9)
-                    ws.cell(column=5, row=row_start,
-                            value="{0}".format(port['port']))
-                    ws.cell(column=6, row=row_start,
-                            value="{0}".format(port['source']))
-                    ws.cell(column=7, row=row_start,
-                            value="{0}".format(port['tag']))
-                    ws.cell(column=8, row=row_start,
-                            value="{0}".format(port['content']))
-                    ws.cell(column=9, row=row_start,
-                            value="{0}".format(port['update_datetime']))
-                except:
-                    logger.error(traceback.format_exc())
-                finally:
-                    row_start += 1
-        else:
-            row_start += 1
-
-        ws.merge_cells(start_row=merged_row_start, start_column=1,
-                       end_row=row_start - 1, end_column=1)
-        ws.merge_cells(start_row=merged_row_start, start_column=2,
-                       end_row=row_start - 1, end_column=2)
-        ws.merge_cells(start_row=merged_row_start, start_column=3,
-                       end_row=row_start - 1, end_column=3)
-        ws.merge_cells(start_row=merged_row_start, start_column=4,
-                       end_row=row_start - 1, end_column=4)
-        ws.cell(column=1, row=merged_row_start,
-                value="{0}".format(ip['index']))
-        ws.cell(column=2, row=merged_row_start, value="{0}".format(ip['ip']))
-        ws.cell(column=3, row=merged_row_start,
-                value="{0}".format('\n'.join(ip['domain'])))
-        ws.cell(column=4, row=merged_row_start, value="{0}".format(
-            ip['location'] if ip['location'] else ''))
-
-    with NamedTemporaryFile() as tmp:
-        wb.save(tmp.name)
-        tmp.seek(0)
-        data = tmp.read()
-        return data
+        ip_cells = ["{0}".format(ip['index']), "{0}".format(ip['ip']), "{0}".format('\n'.join(ip['domain'])),
+                    "{0}".format(ip['location'] if ip['location'] else '')]
+        for port in ip['port_attr'] if ip['port_attr'] else [None]:
+            try:
+                row = ip_cells if row_start == merged_row_start else [None] * len(ip_cells)
+                if port:
+                    row = row + ["{0}".format(port[key]) for key in
+                                 ('port', 'source', 'tag', 'content', 'update_datetime')]
+                else:
+                    row = row + [None] * 5
+                ws.append([_style_cell(ws, value) for value in row])
+            except:
+                logger.error(traceback.format_exc())
+            finally:
+                row_start += 1
+        if row_start - 1 > merged_row_start:
+            for column in 'ABCD':
+                merged_ranges.append(CellRange('{0}{1}:{0}{2}'.format(column, merged_row_start, row_start - 1)))
+    ws.merged_cells = MultiCellRange(merged_ranges)
+
+    yield from _save_workbook(wb, 'ip', start_time, row_start - 2)
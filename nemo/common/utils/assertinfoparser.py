@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # coding:utf-8
-from collections import defaultdict
+from collections import OrderedDict
 
+from nemo.common.utils.iputils import prefix_to_network
+from nemo.core.database import dbutils
 from nemo.core.database.attr import DomainAttr, PortAttr
 from nemo.core.database.colortag import IpColorTag, DomainColorTag
 from nemo.core.database.domain import Domain
@@ -9,9 +11,26 @@ from nemo.core.database.ip import Ip
 from nemo.core.database.memo import IpMemo, DomainMemo
 from nemo.core.database.organization import Organization
 from nemo.core.database.port import Port
+from nemo.core.database.summary import DomainSummary, IpSummary
 from nemo.core.database.vulnerability import Vulnerability
 
 
+def _group_rows(rows, key, limit=None):
+    '''将批量查询的记录按关联字段分组（保持查询结果的顺序）
+    rows:   查询的记录列表
+    key:    分组的字段，字符串类型的值忽略大小写
+    limit:  每组保留的最大记录数
+    '''
+    groups = {}
+    for row in rows:
+        k = row[key].lower() if isinstance(row[key], str) else row[key]
+        group = groups.setdefault(k, [])
+        if not limit or len(group) < limit:
+            group.append(row)
+
+    return groups
+
+
 class AssertInfoParser():
     '''资产信息（IP、域名）聚合
     '''
@@ -19,58 +38,263 @@ class AssertInfoParser():
     def __init__(self):
         super().__init__()
 
-    def __get_ip_domain(self, ip):
-        '''查询IP关联的域名
+    def get_ips_domain(self, ip_rows):
+        '''批量查询多个IP关联的域名
+        返回值：以ip_id为key的字典，值为域名的集合
         '''
-        domain_set = set()
-        domain_attrs_obj = DomainAttr().gets(query={'tag': 'A', 'content': ip})
-        for domain_attr_obj in domain_attrs_obj:
-            domain_obj = Domain().get(domain_attr_obj['r_id'])
-            if domain_attr_obj:
-                domain_set.add(domain_obj['domain'])
+        domain_attr_app = DomainAttr()
+        domain_attrs_dict = _group_rows(
+            domain_attr_app.gets_in('content', list(set([ip_row['ip'] for ip_row in ip_rows])), query={'tag': 'A'}),
+            'content', domain_attr_app.rows_per_page)
+        domain_ids = set([domain_attr_obj['r_id'] for domain_attrs_obj in domain_attrs_dict.values()
+                          for domain_attr_obj in domain_attrs_obj])
+        domain_dict = _group_rows(Domain().gets_in('id', list(domain_ids)), 'id')
+
+        ips_domain = {}
+        for ip_row in ip_rows:
+            domain_set = set()
+            for domain_attr_obj in domain_attrs_dict.get(ip_row['ip'].lower(), []):
+                if domain_attr_obj['r_id'] in domain_dict:
+                    domain_set.add(domain_dict[domain_attr_obj['r_id']][0]['domain'])
+            ips_domain[ip_row['id']] = domain_set
 
-        return domain_set
+        return ips_domain
 
     def get_ip_port_info(self, ip, ip_id):
         '''获取IP端口属性，并生成port、title、banner聚合信息
         '''
-        port_list = []  # 端口列表
-        port_status_dict = {}  # 端口对应的状态字典
-        title_set = set()  # 标题聚合
-        banner_set = set()  # banner聚合
-        ports_attr_info = []  # 每一个端口的详细属性
-
-        ports_obj = Port().gets(query={'ip_id': ip_id})
-        for port_obj in ports_obj:
-            port_list.append(port_obj['port'])
-            if port_obj['status']:
-                port_status_dict[str(port_obj['port'])] = port_obj['status']
-            # 获取端口属性
-            port_attrs_obj = PortAttr().gets(query={'r_id': port_obj['id']})
-            FIRST_ROW = True
-            # 每个端口的一个属性生成一行记录
-            # 第一行记录显示IP和PORT，其它行保持为空（方便查看）
-            for port_attr_obj in port_attrs_obj:
-                pai = {}
-                if FIRST_ROW:
-                    pai.update(ip=ip, port=port_obj['port'])
-                    FIRST_ROW = False
-                else:
-                    pai.update(ip='', port='')
-                pai.update(id=port_attr_obj['id'], tag=port_attr_obj['tag'], content=port_attr_obj['content'],
-                           source=port_attr_obj['source'],
-                           update_datetime=port_attr_obj['update_datetime'].strftime('%Y-%m-%d %H:%M'))
-                # 更新集合
-                if port_attr_obj['tag'] == 'title':
-                    title_set.add(port_attr_obj['content'])
-                elif port_attr_obj['tag'] in ('banner', 'tag', 'server'):
-                    if port_attr_obj['content'] and port_attr_obj['content'] != 'unknown':
-                        banner_set.add(port_attr_obj['content'])
-
-                ports_attr_info.append(pai)
-
-        return port_list, title_set, banner_set, ports_attr_info, port_status_dict
+        return self.get_ips_port_info([{'id': ip_id, 'ip': ip}])[ip_id]
+
+    def get_ips_port_info(self, ip_rows):
+        '''批量获取多个IP的端口属性（端口、端口属性各一次查询）
+        ip_rows: IP记录的列表，每条记录包含id和ip
+        返回值：以ip_id为key的字典，值与get_ip_port_info的返回值相同
+        '''
+        port_app = Port()
+        port_attr_app = PortAttr()
+        # 每个IP（端口）的记录数与逐条查询时的分页数量保持一致
+        ports_dict = _group_rows(port_app.gets_in('ip_id', [ip_row['id'] for ip_row in ip_rows]), 'ip_id',
+                                 port_app.rows_per_page)
+        port_ids = [port_obj['id'] for ports_obj in ports_dict.values() for port_obj in ports_obj]
+        port_attrs_dict = _group_rows(port_attr_app.gets_in('r_id', port_ids), 'r_id', port_attr_app.rows_per_page)
+
+        ips_port_info = {}
+        for ip_row in ip_rows:
+            ip = ip_row['ip']
+            port_list = []  # 端口列表
+            port_status_dict = {}  # 端口对应的状态字典
+            title_set = set()  # 标题聚合
+            banner_set = set()  # banner聚合
+            ports_attr_info = []  # 每一个端口的详细属性
+
+            for port_obj in ports_dict.get(ip_row['id'], []):
+                port_list.append(port_obj['port'])
+                if port_obj['status']:
+                    port_status_dict[str(port_obj['port'])] = port_obj['status']
+                FIRST_ROW = True
+                # 每个端口的一个属性生成一行记录
+                # 第一行记录显示IP和PORT，其它行保持为空（方便查看）
+                for port_attr_obj in port_attrs_dict.get(port_obj['id'], []):
+                    pai = {}
+                    if FIRST_ROW:
+                        pai.update(ip=ip, port=port_obj['port'])
+                        FIRST_ROW = False
+                    else:
+                        pai.update(ip='', port='')
+                    pai.update(id=port_attr_obj['id'], tag=port_attr_obj['tag'], content=port_attr_obj['content'],
+                               source=port_attr_obj['source'],
+                               update_datetime=port_attr_obj['update_datetime'].strftime('%Y-%m-%d %H:%M'))
+                    # 更新集合
+                    if port_attr_obj['tag'] == 'title':
+                        title_set.add(port_attr_obj['content'])
+                    elif port_attr_obj['tag'] in ('banner', 'tag', 'server'):
+                        if port_attr_obj['content'] and port_attr_obj['content'] != 'unknown':
+                            banner_set.add(port_attr_obj['content'])
+
+                    ports_attr_info.append(pai)
+            ips_port_info[ip_row['id']] = (port_list, title_set, banner_set, ports_attr_info, port_status_dict)
+
+        return ips_port_info
+
+    def get_ips_relation_info(self, ip_rows):
+        '''批量获取多个IP的颜色标记、备忘录及组织名称（每类一次查询）
+        返回值：以ip_id为key的字典，{'color_tag':'','memo':'','org_name':''}
+        '''
+        ip_ids = [ip_row['id'] for ip_row in ip_rows]
+        color_tag_dict = _group_rows(IpColorTag().gets_in('r_id', ip_ids), 'r_id')
+        memo_dict = _group_rows(IpMemo().gets_in('r_id', ip_ids), 'r_id')
+        org_dict = _group_rows(Organization().gets_in('id', list(
+            set([ip_row['org_id'] for ip_row in ip_rows if ip_row['org_id']]))), 'id')
+
+        ips_relation_info = {}
+        for ip_row in ip_rows:
+            color_tag_obj = color_tag_dict.get(ip_row['id'])
+            memo_obj = memo_dict.get(ip_row['id'])
+            org_obj = org_dict.get(ip_row['org_id']) if ip_row['org_id'] else None
+            ips_relation_info[ip_row['id']] = {
+                'color_tag': color_tag_obj[0]['color'] if color_tag_obj else '',
+                'memo': memo_obj[0]['content'] if memo_obj else '',
+                'org_name': org_obj[0]['org_name'] if org_obj else ''
+            }
+
+        return ips_relation_info
+
+    def get_domains_relation_info(self, domain_rows):
+        '''批量获取多个DOMAIN的颜色标记、备忘录及组织名称（每类一次查询）
+        返回值：以domain_id为key的字典，{'color_tag':'','memo':'','org_name':''}
+        '''
+        domain_ids = [domain_row['id'] for domain_row in domain_rows]
+        color_tag_dict = _group_rows(DomainColorTag().gets_in('r_id', domain_ids), 'r_id')
+        memo_dict = _group_rows(DomainMemo().gets_in('r_id', domain_ids), 'r_id')
+        org_dict = _group_rows(Organization().gets_in('id', list(
+            set([domain_row['org_id'] for domain_row in domain_rows if domain_row['org_id']]))), 'id')
+
+        domains_relation_info = {}
+        for domain_row in domain_rows:
+            color_tag_obj = color_tag_dict.get(domain_row['id'])
+            memo_obj = memo_dict.get(domain_row['id'])
+            org_obj = org_dict.get(domain_row['org_id']) if domain_row['org_id'] else None
+            domains_relation_info[domain_row['id']] = {
+                'color_tag': color_tag_obj[0]['color'] if color_tag_obj else '',
+                'memo': memo_obj[0]['content'] if memo_obj else '',
+                'org_name': org_obj[0]['org_name'] if org_obj else ''
+            }
+
+        return domains_relation_info
+
+    def get_ips_summary(self, ip_rows):
+        '''批量读取多个IP的聚合信息（ip_summary），没有聚合信息的IP即时计算（不保存，聚合信息由写入时的refresh更新）
+        ip_rows: IP记录的列表，每条记录包含id和ip
+        返回值：以ip_id为key的字典，{'port':[],'port_status':{},'title':[],'banner':[],'domain':[],'vulnerability':[]}
+        '''
+        summary_dict = IpSummary().gets_by_rid([ip_row['id'] for ip_row in ip_rows])
+        missing_rows = [ip_row for ip_row in ip_rows if ip_row['id'] not in summary_dict]
+        if missing_rows:
+            for row in self.__ips_summary(missing_rows):
+                summary_dict[row['r_id']] = row
+
+        return summary_dict
+
+    def get_domains_summary(self, domain_rows):
+        '''批量读取多个DOMAIN的聚合信息（domain_summary），没有聚合信息的DOMAIN即时计算（不保存，聚合信息由写入时的refresh更新）
+        domain_rows: DOMAIN记录的列表
+        返回值：以domain_id为key的字典，{'ip':[],'port':[],'title':[],'banner':[],'vulnerability':[]}
+        '''
+        summary_dict = DomainSummary().gets_by_rid([domain_row['id'] for domain_row in domain_rows])
+        missing_rows = [domain_row for domain_row in domain_rows if domain_row['id'] not in summary_dict]
+        if missing_rows:
+            for row in self.__domains_summary(missing_rows):
+                summary_dict[row['r_id']] = row
+
+        return summary_dict
+
+    def __ips_summary(self, ip_rows):
+        '''计算多个IP的聚合信息：端口、端口状态、标题、banner、关联的域名及漏洞
+        '''
+        vul_app = Vulnerability()
+        ips_port_info = self.get_ips_port_info(ip_rows)
+        ips_domain = self.get_ips_domain(ip_rows)
+        ips = list(set([ip_row['ip'] for ip_row in ip_rows]))
+        vul_dict = _group_rows(vul_app.gets_in('target', ips), 'target', vul_app.rows_per_page)
+        # 漏洞列表只保留分页数量的记录，数量单独统计
+        vul_count_dict = vul_app.count_by_targets(ips)
+
+        summary_rows = []
+        for ip_row in ip_rows:
+            port_list, title_set, banner_set, _, port_status_dict = ips_port_info[ip_row['id']]
+            vul_info = ['{}/{}'.format(v['poc_file'], v['source']) for v in vul_dict.get(ip_row['ip'].lower(), [])]
+            summary_rows.append({'r_id': ip_row['id'], 'port': port_list, 'port_status': port_status_dict,
+                                 'title': list(title_set), 'banner': list(banner_set),
+                                 'domain': list(ips_domain[ip_row['id']]), 'vulnerability': vul_info,
+                                 'vulnerability_count': vul_count_dict.get(ip_row['ip'].lower(), 0)})
+
+        return summary_rows
+
+    def __domains_summary(self, domain_rows):
+        '''计算多个DOMAIN的聚合信息：A记录、关联IP的端口、标题、banner及漏洞
+        '''
+        domains_info = self.get_domains_info(domain_rows)
+        # 漏洞列表只保留分页数量的记录，数量单独统计
+        vul_count_dict = Vulnerability().count_by_targets(list(set([domain_row['domain'] for domain_row in domain_rows])))
+
+        summary_rows = []
+        for domain_row in domain_rows:
+            domain_info = domains_info[domain_row['id']]
+            vul_info = ['{}/{}'.format(v['poc_file'], v['source']) for v in domain_info['vulnerability'] or []]
+            summary_rows.append({'r_id': domain_row['id'], 'ip': domain_info['a_record'], 'port': domain_info['port'],
+                                 'title': domain_info['title'], 'banner': domain_info['banner'],
+                                 'vulnerability': vul_info,
+                                 'vulnerability_count': vul_count_dict.get(domain_row['domain'].lower(), 0)})
+
+        return summary_rows
+
+    def get_ips_linked_domain_ids(self, ips):
+        '''A记录为指定IP的域名id
+        '''
+        return list(set([row['r_id'] for row in DomainAttr().gets_in(
+            'content', list(set(ips)), query={'tag': 'A'}, fields=('id', 'r_id'))]))
 
+    def get_domains_linked_ip_ids(self, domain_ids):
+        '''域名的A记录对应的IP的id
+        '''
+        ips = set([row['content'] for row in DomainAttr().gets_in(
+            'r_id', list(set(domain_ids)), query={'tag': 'A'}, fields=('id', 'content'))])
+
+        return list(set([row['id'] for row in Ip().gets_in('ip', list(ips), fields=('id', 'ip'))]))
+
+    def refresh_ips_summary(self, ip_ids, linked=True):
+        '''IP的端口、端口属性或漏洞变化后，重新计算IP的聚合信息
+        linked: 是否同时更新A记录为这些IP的域名的聚合信息（域名的端口、标题等来自于IP）
+        '''
+        ip_rows = Ip().gets_in('id', list(set(ip_ids)), fields=('id', 'ip'))
+        summary_app = IpSummary()
+        for rows in dbutils.chunks(ip_rows, 500):
+            # 多个worker同时更新同一IP时，读取与写入聚合信息串行执行，避免较早读取的结果覆盖较新的结果
+            with dbutils.advisory_lock([dbutils.lock_name('ip', row['ip']) for row in rows]):
+                summary_rows = self.__ips_summary(rows)
+                with dbutils.session():
+                    summary_app.save_many(summary_rows)
+        if linked and ip_rows:
+            self.refresh_domains_summary(self.get_ips_linked_domain_ids([row['ip'] for row in ip_rows]), False)
+
+    def refresh_domains_summary(self, domain_ids, linked=True):
+        '''DOMAIN的属性或漏洞变化后，重新计算DOMAIN的聚合信息
+        linked: 是否同时更新A记录对应的IP的聚合信息（IP关联的域名）
+        '''
+        domain_rows = Domain().gets_in('id', list(set(domain_ids)))
+        summary_app = DomainSummary()
+        for rows in dbutils.chunks(domain_rows, 500):
+            with dbutils.advisory_lock([dbutils.lock_name('domain', row['domain']) for row in rows]):
+                summary_rows = self.__domains_summary(rows)
+                with dbutils.session():
+                    summary_app.save_many(summary_rows)
+        if linked and domain_rows:
+            self.refresh_ips_summary(self.get_domains_linked_ip_ids(domain_ids), False)
+
+    def refresh_targets_summary(self, targets):
+        '''漏洞变化后，重新计算漏洞目标（IP或DOMAIN）的聚合信息
+        '''
+        targets = list(set(targets))
+        self.refresh_ips_summary([row['id'] for row in Ip().gets_in('ip', targets, fields=('id', 'ip'))], False)
+        self.refresh_domains_summary(
+            [row['id'] for row in Domain().gets_in('domain', targets, fields=('id', 'domain'))], False)
+
+    def rebuild_summary(self):
+        '''重新计算所有IP和DOMAIN的聚合信息（用于升级后的数据初始化或修复）
+        '''
+        ip_count = domain_count = 0
+        for rows in dbutils.chunks(Ip().iter_by_search(fields=('id', 'ip'), order_by='id'), 500):
+            with dbutils.session():
+                IpSummary().save_many(self.__ips_summary(rows))
+            ip_count += len(rows)
+        for rows in dbutils.chunks(Domain().iter_by_search(order_by='id'), 500):
+            with dbutils.session():
+                DomainSummary().save_many(self.__domains_summary(rows))
+            domain_count += len(rows)
+
+        return ip_count, domain_count
+
+    @dbutils.session(readonly=True)
     def get_ip_info(self, Id):
         '''聚合一个IP的详情
         '''
@@ -97,8 +321,7 @@ class AssertInfoParser():
         ip_info.update(banner=list(banner_set))
         ip_info.update(port=port_list)
         # IP关联的域名
-        domain_set = self.__get_ip_domain(ip_obj['ip'])
-        ip_info.update(domain=list(domain_set))
+        ip_info.update(domain=self.get_ips_summary([ip_obj])[ip_obj['id']]['domain'])
         # 获取标记颜色：
         color_tag_obj = IpColorTag().get(ip_obj['id'])
         ip_info.update(
@@ -121,129 +344,153 @@ class AssertInfoParser():
 
         return ip_info
 
+    @dbutils.session(readonly=True)
     def get_domain_info(self, Id):
         '''聚合一个DOMAIN的详情
         '''
-        domain_info = {}
         # 获取DOMAIN
         domain_obj = Domain().get(Id)
         if not domain_obj:
             return None
-        domain_info.update(id=domain_obj['id'],
-                           domain=domain_obj['domain'],
-                           create_datetime=domain_obj['create_datetime'].strftime('%Y-%m-%d %H:%M'),
-                           update_datetime=domain_obj['update_datetime'].strftime('%Y-%m-%d %H:%M'))
-        # 获取组织名称
-        if domain_obj['org_id']:
-            organziation__obj = Organization().get(domain_obj['org_id'])
-            if organziation__obj:
-                domain_info.update(organization=organziation__obj['org_name'])
-        else:
-            domain_info.update(organization='')
-        domain_attrs_obj = DomainAttr().gets(query={'r_id': domain_obj['id']})
-        # 获取域名的属性信息：title和ip,whatweb
-        title_set = set()
-        banner_set = set()
-        ip_set = set()
-        whatweb_set = set()
-        httpx_set = set()
-        for domain_attr_obj in domain_attrs_obj:
-            if domain_attr_obj['tag'] == 'title':
-                title_set.add(domain_attr_obj['content'])
-            elif domain_attr_obj['tag'] == 'A':
-                ip_set.add(domain_attr_obj['content'])
-            elif domain_attr_obj['tag'] == 'whatweb':
-                whatweb_set.add(domain_attr_obj['content'])
-            elif domain_attr_obj['tag'] == 'server':
-                banner_set.add(domain_attr_obj['content'])
-            elif domain_attr_obj['tag'] == 'httpx':
-                httpx_set.add(domain_attr_obj['content'])
+
+        return self.get_domains_info([domain_obj])[domain_obj['id']]
+
+    def get_domains_info(self, domain_rows):
+        '''批量聚合多个DOMAIN的详情：域名属性、关联IP的端口及属性、颜色标记、备忘录、漏洞和组织名称各一次查询
+        domain_rows: DOMAIN记录的列表
+        返回值：以domain_id为key的字典，值与get_domain_info的返回值相同，
+               另外a_record为域名的A记录（与单独查询A记录时的分页数量一致）
+        '''
+        domain_attr_app = DomainAttr()
+        vul_app = Vulnerability()
+        domain_ids = [domain_row['id'] for domain_row in domain_rows]
+        # 获取域名的属性信息：每个域名的记录数与逐条查询时的分页数量保持一致
+        domain_attrs_all = _group_rows(domain_attr_app.gets_in('r_id', domain_ids), 'r_id')
+        domain_attrs_dict = {}
+        a_record_dict = {}
+        ip_all_set = set()
+        for domain_id, domain_attrs_obj in domain_attrs_all.items():
+            domain_attrs_dict[domain_id] = domain_attrs_obj[:domain_attr_app.rows_per_page]
+            a_record_dict[domain_id] = [domain_attr_obj['content'] for domain_attr_obj in domain_attrs_obj
+                                        if domain_attr_obj['tag'] == 'A'][:domain_attr_app.rows_per_page]
+            ip_all_set.update([domain_attr_obj['content'] for domain_attr_obj in domain_attrs_dict[domain_id]
+                               if domain_attr_obj['tag'] == 'A'])
         # 获取域名关联的IP端口详情：
-        port_set = set()
-
-        ip_port_list = []
-        for domain_ip in ip_set:
-            ip_obj = Ip().gets(query={'ip': domain_ip})
-            if ip_obj and len(ip_obj) > 0:
-                # port_list, title_set, banner_set, ports_attr_info
-                p, t, b, pai, ps = self.get_ip_port_info(
-                    ip_obj[0]['ip'], ip_obj[0]['id'])
-                port_set.update(p)
-                title_set.update(t)
-                banner_set.update(b)
-                ip_port_list.extend(pai)
-        domain_info.update(ip=list(ip_set))
-        domain_info.update(port=list(port_set))
-        domain_info.update(title=list(title_set))
-        domain_info.update(whatweb=list(whatweb_set))
-        domain_info.update(httpx=list(httpx_set))
-        domain_info.update(banner=list(banner_set))
-        domain_info.update(port_attr=ip_port_list)
-        # 获取标记颜色：
-        color_tag_obj = DomainColorTag().get(domain_obj['id'])
-        domain_info.update(
-            color_tag=color_tag_obj['color'] if color_tag_obj else '')
-        # 获取备忘录信息：
-        memo_obj = DomainMemo().get(domain_obj['id'])
-        domain_info.update(memo=memo_obj['content'] if memo_obj else '')
-        # 获取关联的漏洞信息：
-        vul_results = Vulnerability().gets({'target': domain_obj['domain']})
-        if vul_results and len(vul_results) > 0:
-            vul_info = []
-            for v in vul_results:
-                vul_info.append(
-                    {'id': v['id'], 'target': v['target'], 'url': v['url'], 'poc_file': v['poc_file'],
-                     'source': v['source'],
-                     'update_datetime': v['update_datetime'].strftime('%Y-%m-%d %H:%M')})
-            domain_info.update(vulnerability=vul_info)
-        else:
-            domain_info.update(vulnerability=None)
+        ip_dict = {}
+        for ip_obj in Ip().gets_in('ip', list(ip_all_set)):
+            ip_dict.setdefault(ip_obj['ip'].lower(), ip_obj)
+        ips_port_info = self.get_ips_port_info(list(ip_dict.values()))
+        # 颜色标记、备忘录、漏洞和组织名称
+        color_tag_dict = _group_rows(DomainColorTag().gets_in('r_id', domain_ids), 'r_id')
+        memo_dict = _group_rows(DomainMemo().gets_in('r_id', domain_ids), 'r_id')
+        vul_dict = _group_rows(vul_app.gets_in('target', list(set([domain_row['domain'] for domain_row in domain_rows]))),
+                               'target', vul_app.rows_per_page)
+        org_dict = _group_rows(Organization().gets_in('id', list(
+            set([domain_row['org_id'] for domain_row in domain_rows if domain_row['org_id']]))), 'id')
 
-        return domain_info
+        domains_info = {}
+        for domain_obj in domain_rows:
+            domain_info = {}
+            domain_info.update(id=domain_obj['id'],
+                               domain=domain_obj['domain'],
+                               create_datetime=domain_obj['create_datetime'].strftime('%Y-%m-%d %H:%M'),
+                               update_datetime=domain_obj['update_datetime'].strftime('%Y-%m-%d %H:%M'))
+            # 获取组织名称
+            if domain_obj['org_id']:
+                if domain_obj['org_id'] in org_dict:
+                    domain_info.update(organization=org_dict[domain_obj['org_id']][0]['org_name'])
+            else:
+                domain_info.update(organization='')
+            # 获取域名的属性信息：title和ip,whatweb
+            title_set = set()
+            banner_set = set()
+            ip_set = set()
+            whatweb_set = set()
+            httpx_set = set()
+            for domain_attr_obj in domain_attrs_dict.get(domain_obj['id'], []):
+                if domain_attr_obj['tag'] == 'title':
+                    title_set.add(domain_attr_obj['content'])
+                elif domain_attr_obj['tag'] == 'A':
+                    ip_set.add(domain_attr_obj['content'])
+                elif domain_attr_obj['tag'] == 'whatweb':
+                    whatweb_set.add(domain_attr_obj['content'])
+                elif domain_attr_obj['tag'] == 'server':
+                    banner_set.add(domain_attr_obj['content'])
+                elif domain_attr_obj['tag'] == 'httpx':
+                    httpx_set.add(domain_attr_obj['content'])
+            # 获取域名关联的IP端口详情：
+            port_set = set()
+            ip_port_list = []
+            for domain_ip in ip_set:
+                ip_obj = ip_dict.get(domain_ip.lower())
+                if ip_obj:
+                    # port_list, title_set, banner_set, ports_attr_info
+                    p, t, b, pai, ps = ips_port_info[ip_obj['id']]
+                    port_set.update(p)
+                    title_set.update(t)
+                    banner_set.update(b)
+                    ip_port_list.extend(pai)
+            domain_info.update(ip=list(ip_set))
+            domain_info.update(port=list(port_set))
+            domain_info.update(title=list(title_set))
+            domain_info.update(whatweb=list(whatweb_set))
+            domain_info.update(httpx=list(httpx_set))
+            domain_info.update(banner=list(banner_set))
+            domain_info.update(port_attr=ip_port_list)
+            domain_info.update(a_record=a_record_dict.get(domain_obj['id'], []))
+            # 获取标记颜色：
+            color_tag_obj = color_tag_dict.get(domain_obj['id'])
+            domain_info.update(
+                color_tag=color_tag_obj[0]['color'] if color_tag_obj else '')
+            # 获取备忘录信息：
+            memo_obj = memo_dict.get(domain_obj['id'])
+            domain_info.update(memo=memo_obj[0]['content'] if memo_obj else '')
+            # 获取关联的漏洞信息：
+            vul_results = vul_dict.get(domain_obj['domain'].lower())
+            if vul_results and len(vul_results) > 0:
+                vul_info = []
+                for v in vul_results:
+                    vul_info.append(
+                        {'id': v['id'], 'target': v['target'], 'url': v['url'], 'poc_file': v['poc_file'],
+                         'source': v['source'],
+                         'update_datetime': v['update_datetime'].strftime('%Y-%m-%d %H:%M')})
+                domain_info.update(vulnerability=vul_info)
+            else:
+                domain_info.update(vulnerability=None)
+            domains_info[domain_obj['id']] = domain_info
+
+        return domains_info
 
     def statistics_ip(self, org_id=None, domain_address=None, ip_address=None, port=None, content=None, iplocation=None,
                       port_status=None, color_tag=None, memo_content=None, date_delta=None):
         '''根据查询条件，统计IP、IP的C段地址和相关的所有端口
+        统计由数据库聚合完成，IP及ip:port列表为生成器，逐批从数据库读取
         '''
         ip_table = Ip()
-        port_table = Port()
-
-        ip_list = []
-        ip_port_list = []
-        ip_c_set = set()
-        port_set = set()
-        location_dict = {}
-        # 统计每个端口出现的次数
-        port_count_dict = defaultdict(lambda: 0)
-        ips = ip_table.gets_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port, content=content,
-                                      iplocation=iplocation, port_status=port_status, color_tag=color_tag,
-                                      memo_content=memo_content, date_delta=date_delta, page=1, rows_per_page=100000)
-        if ips:
-            for ip_row in ips:
-                # ip
-                ip_list.append(ip_row['ip'])
-                # C段
-                ip_c = ip_row['ip'].split('.')[0:3]
-                ip_c.append('0/24')
-                ip_c_set.add('.'.join(ip_c))
-                # location
-                if ip_row['location']:
-                    try:
-                        location = (ip_row['location'].split(',')[0]).split(' ')[0].strip()
-                        if location:
-                            location_count = location_dict.get(location, 0)
-                            location_dict[location] = location_count + 1
-                    except:
-                        pass
-                # port
-                ports_obj = port_table.gets(query={'ip_id': ip_row['id']})
-                for port_obj in ports_obj:
-                    port_set.add(port_obj['port'])
-                    port_count_dict[str(port_obj['port'])] += 1
-                    ip_port_list.append('{}:{}'.format(
-                        ip_row['ip'], port_obj['port']))
-
-        return ip_list, ip_c_set, port_set, port_count_dict, ip_port_list, location_dict
+        search = dict(org_id=org_id, domain=domain_address, ip=ip_address, port=port, content=content,
+                      iplocation=iplocation, port_status=port_status, color_tag=color_tag,
+                      memo_content=memo_content, date_delta=date_delta)
+
+        port_count_rows, network_list, location_rows = ip_table.statistics_by_search(**search)
+        # 端口及每个端口出现的次数
+        port_count_dict = OrderedDict()
+        for row in port_count_rows:
+            port_count_dict[str(row['port'])] = row['port_count']
+        port_set = set([row['port'] for row in port_count_rows])
+        # C段（IPv6为/64）
+        ip_c_set = set([prefix_to_network(bytes(n)) for n in network_list])
+        # location
+        location_dict = OrderedDict()
+        for row in location_rows:
+            if row['location']:
+                location_dict[row['location']] = row['location_count']
+        # ip及ip:port
+        ip_count = ip_table.count_by_search(**search)
+        ip_list = ip_table.iter_ip_by_search(**search)
+        ip_port_count = sum(port_count_dict.values())
+        ip_port_list = ip_table.iter_target_by_search(**search)
+
+        return ip_count, ip_list, ip_c_set, port_set, port_count_dict, ip_port_count, ip_port_list, location_dict
 
     def export_ip_memo(self, org_id=None, domain_address=None, ip_address=None, port=None, content=None,
                        iplocation=None, port_status=None, color_tag=None, memo_content=None, date_delta=None):
@@ -253,13 +500,14 @@ class AssertInfoParser():
         memo_table = IpMemo()
 
         memo_list = []
-        ips = ip_table.gets_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port, content=content,
-                                      iplocation=iplocation, port_status=port_status, color_tag=color_tag,
-                                      memo_content=memo_content, date_delta=date_delta, page=1, rows_per_page=100000)
-        if ips:
+        ip_rows = ip_table.iter_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port,
+                                          content=content, iplocation=iplocation, port_status=port_status,
+                                          color_tag=color_tag, memo_content=memo_content, date_delta=date_delta,
+                                          fields=('id', 'ip'))
+        for ips in dbutils.chunks(ip_rows):
+            memo_dict = _group_rows(memo_table.gets_in('r_id', [ip_row['id'] for ip_row in ips]), 'r_id')
             for ip_row in ips:
-                memo_obj = memo_table.get(ip_row['id'])
-                if memo_obj:
+                for memo_obj in memo_dict.get(ip_row['id'], []):
                     memo_list.append('[+]{}'.format(ip_row['ip']))
                     memo_list.append(memo_obj['content'])
                     memo_list.append("")
@@ -274,14 +522,20 @@ class AssertInfoParser():
         memo_table = DomainMemo()
 
         memo_list = []
-        domains = domain_table.gets_by_search(org_id, domain_address,
-                                              ip_address, color_tag, memo_content, date_delta)
-        if domains:
+        domain_rows = domain_table.iter_by_search(org_id, domain_address, ip_address, color_tag, memo_content,
+                                                  date_delta, fields=('id', 'domain'))
+        for domains in dbutils.chunks(domain_rows):
+            memo_dict = _group_rows(memo_table.gets_in('r_id', [domain_row['id'] for domain_row in domains]),
+                                    'r_id')
             for domain_row in domains:
-                memo_obj = memo_table.get(domain_row['id'])
-                if memo_obj:
+                for memo_obj in memo_dict.get(domain_row['id'], []):
                     memo_list.append('[+]{}'.format(domain_row['domain']))
                     memo_list.append(memo_obj['content'])
                     memo_list.append("")
 
         return memo_list
+
+
+if __name__ == '__main__':
+    # 重新计算所有资产的聚合信息：python3 -m nemo.common.utils.assertinfoparser
+    print('rebuild summary: ip {}, domain {}'.format(*AssertInfoParser().rebuild_summary()))
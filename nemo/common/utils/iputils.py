@@ -3,6 +3,212 @@
 import ipaddress
 import re
 
+# IPv6的网段、范围展开为IP列表的最大地址数（/120），更大的网段（如/64）不展开
+MAX_EXPAND_IPV6 = 256
+# IPv4地址在128位地址空间中的前缀（IPv4映射地址::ffff:a.b.c.d）
+IPV4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+# 128位地址的最大值
+MAX_IP_VALUE = (1 << 128) - 1
+
+
+def _ipv6_address(ip):
+    '''解析IPv6地址，不是IPv6地址返回None
+    '''
+    if ':' not in ip:
+        return None
+    try:
+        return ipaddress.IPv6Address(ip.strip().strip('[]'))
+    except ValueError:
+        return None
+
+
+def is_ipv6(ip_or_ips):
+    '''是否是IPv6的地址、网段或范围
+    '''
+    return _ipv6_address(re.split(r'[\/\-]', ip_or_ips, 1)[0]) is not None
+
+
+def normalize_ip(ip):
+    '''IP地址的规范格式：IPv6为小写的压缩格式，IPv4映射的IPv6地址转换为IPv4
+    不是IP地址时原样返回
+    '''
+    try:
+        address = ipaddress.ip_address(ip.strip().strip('[]'))
+    except ValueError:
+        return ip
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+
+    return str(address)
+
+
+def ip_to_bin(ip):
+    '''IP地址转换为16字节（128位，大端）的值，用于索引及范围查询
+    IPv4转换为IPv4映射地址(::ffff:a.b.c.d)，IPv4与IPv6在同一个地址空间中排序
+    '''
+    address = ipaddress.ip_address(ip.strip().strip('[]'))
+    if address.version == 4:
+        return IPV4_MAPPED_PREFIX + address.packed
+
+    return address.packed
+
+
+def network_range(network):
+    '''IP网段（IP/掩码）的起始及结束地址，返回值为16字节的值(start, end)，网段不展开
+    '''
+    network = ipaddress.ip_network(network.strip(), strict=False)
+
+    return ip_to_bin(str(network.network_address)), ip_to_bin(str(network.broadcast_address))
+
+
+def ip_to_int(ip):
+    '''IP地址转换为128位的整数值（与ip_to_bin的排序一致）
+    '''
+    return int.from_bytes(ip_to_bin(ip), 'big')
+
+
+def int_to_bin(value):
+    '''128位的整数值转换为16字节的值（ip_bin）
+    '''
+    return value.to_bytes(16, 'big')
+
+
+def _parse_interval(item):
+    '''IP、IP/掩码或IP范围转换为128位地址的区间(start, end)
+    '''
+    if '/' in item:
+        start, end = network_range(item)
+        return int.from_bytes(start, 'big'), int.from_bytes(end, 'big')
+    if '-' in item:
+        ip_start, ip_end = item.split('-', 1)
+        start, end = ip_to_int(ip_start), ip_to_int(ip_end)
+    else:
+        start = end = ip_to_int(item)
+    if start > end:
+        raise ValueError('invalid ip range:{}'.format(item))
+
+    return start, end
+
+
+def merge_intervals(intervals):
+    '''合并重叠及相邻的区间，返回值：有序、不相交的区间列表[(start, end),...]
+    '''
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return [tuple(i) for i in merged]
+
+
+def subtract_intervals(intervals, excludes):
+    '''从有序、不相交的区间中去除排除的区间（均为merge_intervals的结果）
+    '''
+    result = []
+    for start, end in intervals:
+        for ex_start, ex_end in excludes:
+            if ex_end < start or ex_start > end:
+                continue
+            if ex_start > start:
+                result.append((start, ex_start - 1))
+            start = ex_end + 1
+            if start > end:
+                break
+        if start <= end:
+            result.append((start, end))
+
+    return result
+
+
+def parse_ip_intervals(ip_or_ips):
+    '''解析以逗号、分号或空白分隔的多个IP、IP/掩码、IP范围（IPv4或IPv6），以!开头的为排除的地址，如：
+    192.168.1.0/24,10.0.0.1-10.0.0.100 !192.168.1.128/25
+    只有排除的地址时，从所有地址中排除
+    返回值：合并后有序、不相交的128位地址区间列表[(start, end),...]，网段不展开；不是IP地址时抛出ValueError
+    '''
+    includes = []
+    excludes = []
+    for item in re.split(r'[\s,;]+', ip_or_ips.strip()):
+        if not item:
+            continue
+        if item.startswith('!'):
+            excludes.append(_parse_interval(item[1:]))
+        else:
+            includes.append(_parse_interval(item))
+    if not includes and not excludes:
+        raise ValueError('empty ip list')
+    if not includes:
+        includes.append((0, MAX_IP_VALUE))
+
+    return subtract_intervals(merge_intervals(includes), merge_intervals(excludes))
+
+
+def prefix_to_network(prefix):
+    '''ip_bin的前缀转换为网段：15字节为IPv4的C段(/24)，8字节为IPv6的/64
+    '''
+    if len(prefix) == 15 and prefix.startswith(IPV4_MAPPED_PREFIX):
+        return '{}/24'.format(ipaddress.IPv4Address(prefix[12:] + b'\x00'))
+
+    return '{}/{}'.format(ipaddress.IPv6Address(prefix.ljust(16, b'\x00')), len(prefix) * 8)
+
+
+def format_host_port(ip, port):
+    '''ip:port的格式，IPv6地址加[]，如[2001:db8::1]:80
+    '''
+    if ':' in ip:
+        return '[{}]:{}'.format(ip, port)
+
+    return '{}:{}'.format(ip, port)
+
+
+def split_host_port(host_port):
+    '''解析host:port、[IPv6]:port或不带端口的地址，返回值：(host, port)，没有端口时port为None
+    '''
+    m = re.match(r'^\[([0-9a-fA-F:.]+)\](?::(\d+))?$', host_port)
+    if m:
+        return m.group(1), m.group(2)
+    # 不带[]的IPv6地址没有端口
+    if _ipv6_address(host_port):
+        return host_port, None
+    host, _, port = host_port.partition(':')
+
+    return host, port if port else None
+
+
+def split_by_version(targets):
+    '''将扫描目标（IP、网段、范围）按IPv4、IPv6分组，返回值：(ipv4_list, ipv6_list)
+    '''
+    ipv4_list = []
+    ipv6_list = []
+    for t in targets:
+        if is_ipv6(t):
+            ipv6_list.append(t)
+        else:
+            ipv4_list.append(t)
+
+    return ipv4_list, ipv6_list
+
+
+def _parse_ipv6(ip_or_ips):
+    '''解析IPv6的地址、网段或范围，网段或范围的地址数超过MAX_EXPAND_IPV6时不展开（返回空列表）
+    '''
+    try:
+        if '/' in ip_or_ips:
+            network = ipaddress.IPv6Network(ip_or_ips, strict=False)
+            if network.num_addresses > MAX_EXPAND_IPV6:
+                return []
+            return [str(i) for i in network]
+        if '-' in ip_or_ips:
+            ip_start, ip_end = [int(ipaddress.IPv6Address(i)) for i in ip_or_ips.split('-')]
+            if ip_end - ip_start + 1 > MAX_EXPAND_IPV6:
+                return []
+            return [str(ipaddress.IPv6Address(i)) for i in range(ip_start, ip_end + 1)]
+        return normalize_ip(ip_or_ips)
+    except ValueError:
+        return []
+
 
 def parse_ip(ip_or_ips):
     '''解析IP或IP段
@@ -10,6 +216,10 @@ def parse_ip(ip_or_ips):
     192.168.1.1
     192.168.1.0/24
     192.168.1.1-192.168.2.1
+    IPv6同样支持三种方式，但不展开大的网段（见MAX_EXPAND_IPV6）
+    2001:db8::1
+    2001:db8::/120
+    2001:db8::1-2001:db8::ff
     '''
     # 单个IP
     p1 = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$'
@@ -36,6 +246,9 @@ def parse_ip(ip_or_ips):
             return ips
         except:
             return []
+    # IPv6
+    if is_ipv6(ip_or_ips):
+        return _parse_ipv6(ip_or_ips)
 
     return None
 
@@ -45,9 +258,10 @@ def check_ip_or_domain(ip_or_domain):
     192.168.1.1
     192.168.1.0/24
     192.168.1.1-192.168.2.1
+    2001:db8::1、2001:db8::/64、2001:db8::1-2001:db8::ff
     '''
     p1 = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$'
     p2 = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}[\/\-]{1}'
     m = re.match(p1, ip_or_domain) or re.match(p2, ip_or_domain)
 
-    return True if m else False
+    return True if m or is_ipv6(ip_or_domain) else False
@@ -21,3 +21,15 @@ _web_log_file = 'instance/nemo.web.log'
 _web_log_fmt = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
 web_handler = logging.handlers.RotatingFileHandler(_web_log_file, maxBytes=1024 * 1024, backupCount=5)
 web_handler.setFormatter(logging.Formatter(_web_log_fmt))
+
+'''
+数据库慢查询日志（超过阈值的语句及耗时），参考nemo.core.database.sqlmetrics
+'''
+_slow_log_file = 'instance/nemo.slow.log'
+_slow_log_fmt = '%(asctime)s - %(process)d - %(message)s'
+_slow_handler = logging.handlers.RotatingFileHandler(_slow_log_file, maxBytes=1024 * 1024, backupCount=5)
+_slow_handler.setFormatter(logging.Formatter(_slow_log_fmt))
+slow_logger = logging.getLogger("slow_sql")
+slow_logger.addHandler(_slow_handler)
+slow_logger.setLevel(logging.INFO)
+slow_logger.propagate = False
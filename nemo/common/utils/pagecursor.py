@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# coding:utf-8
+import base64
+import hashlib
+import json
+
+from nemo.common.utils.loggerutils import logger
+
+
+def _search_hash(search):
+    '''查询条件的hash，用于校验游标是否属于当前的查询
+    '''
+    return hashlib.md5(json.dumps(search, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def _json_default(value):
+    '''排序字段值的JSON编码：bytes（如ip的ip_bin）编码为{'bytes': 十六进制}，其它类型（如datetime）转换为字符串
+    '''
+    if isinstance(value, (bytes, bytearray)):
+        return {'bytes': bytes(value).hex()}
+
+    return str(value)
+
+
+def _json_object_hook(obj):
+    '''解码_json_default编码的bytes
+    '''
+    if len(obj) == 1 and 'bytes' in obj:
+        return bytes.fromhex(obj['bytes'])
+
+    return obj
+
+
+def encode_cursor(start, key, search):
+    '''生成DataTables分页的游标（不透明的字符串）
+    start:  游标对应的下一页的起始位置
+    key:    本页最后一条记录的排序字段值（DAOBase.keyset_value）
+    search: 查询条件，字典格式
+    '''
+    data = {'start': start, 'key': key, 'search': _search_hash(search)}
+
+    return base64.urlsafe_b64encode(json.dumps(data, default=_json_default).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, start, search):
+    '''解析DataTables分页的游标
+    只有游标的起始位置与查询条件都与本次请求一致时才返回排序字段值，否则返回None（使用limit offset分页）
+    '''
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'),
+                          object_hook=_json_object_hook)
+        if data['start'] == start and data['search'] == _search_hash(search) and isinstance(data['key'], list):
+            return data['key']
+    except Exception:
+        logger.error('invalid page cursor:{}'.format(cursor))
+
+    return None
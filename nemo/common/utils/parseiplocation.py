@@ -2,7 +2,7 @@
 # coding:utf-8
 import traceback
 
-from nemo.common.utils.iputils import check_ip_or_domain
+from nemo.common.utils.iputils import check_ip_or_domain, is_ipv6
 from nemo.common.utils.loggerutils import logger
 
 
@@ -41,11 +41,13 @@ class IPLocationCustom():
 
     def get_iplocation(self, ip):
         '''获取IP地址
-        先查C段，如果没有C段则查B段
+        先查C段，如果没有C段则查B段；自定义的归属地只有IPv4网段，IPv6地址返回空
         '''
-        if not check_ip_or_domain:
+        if not check_ip_or_domain(ip):
             logger.error('check ip fail:{}'.format(ip))
             return ''
+        if is_ipv6(ip):
+            return ''
         datas = ip.split('.')
         c_data = '{}.0/24'.format('.'.join(datas[0:3]))
         location = self.ip_location_dict.get(c_data)
@@ -23,6 +23,13 @@ class AttrBase(daobase.DAOBase):
         data['hash'] = self.attr_hash(data)
         return super().add(data)
 
+    def upsert_many(self, rows, key_columns=('hash',), update_columns=None, batch_size=500):
+        '''批量增加或更新记录：计算hash
+        '''
+        for data in rows:
+            data['hash'] = self.attr_hash(data)
+        return super().upsert_many(rows, key_columns, update_columns, batch_size)
+
     def update(self, Id, data):
         '''更新一条记录：如果hash需要更新，重新计算
         '''
@@ -35,19 +42,10 @@ class AttrBase(daobase.DAOBase):
         新增或更新一条数据
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.gets({'hash': self.attr_hash(data)})
-        # 如果该已存在，则更新记录
-        if obj and len(obj) > 0:
-            data_update = {}
-            # 只更新update_datetime
-            self.update(obj[0]['id'], data_update)
-            return obj[0]['id']
-        # 如果不存在，则生成新记录
-        else:
-            data_new = {'r_id': data['r_id'], 'tag': data['tag'],
-                        'source': data['source'], 'content': data['content']}
-            return self.add(data_new)
+        # 以hash的唯一索引upsert，已存在时只更新update_datetime
+        data_new = {'r_id': data['r_id'], 'tag': data['tag'],
+                    'source': data['source'], 'content': data['content']}
+        return self.upsert(data_new, ('hash',))
 
 
 class IpAttr(AttrBase):
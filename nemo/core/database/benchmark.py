@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+本地的性能测试：生成可重现的模拟资产数据，统计查询、统计及导出的耗时
+1. 默认使用SQLite内存数据库（不需要MySQL服务器），也可以指定SQLite数据库文件或使用配置的MySQL数据库（会写入测试数据）
+2. 数据由固定的随机数种子生成：IP、端口及端口属性、域名及A记录、备忘录、颜色标记、漏洞，通过IngestWriter写入
+3. 统计DAO的查询（count/gets_by_search）、AssertInfoParser的统计、导出，及web的列表、统计、导出请求的耗时
+   每次查询前清空查询缓存（searchcache），统计的是数据库查询的耗时
+用法：python3 -m nemo.core.database.benchmark [IP数量] [sqlite数据库文件|mysql]
+"""
+import random
+import sys
+import time
+
+from . import dbutils
+from . import searchcache
+from . import sqlmetrics
+
+# 模拟数据的内容
+PORTS = (21, 22, 80, 443, 3306, 6379, 8080, 8443, 9200)
+TITLES = ('nginx', 'Apache Tomcat/8.5.32', 'Microsoft-IIS/10.0', '后台管理系统', '用户登录', 'Welcome to CentOS',
+          'Jenkins', 'phpMyAdmin', '404 Not Found', 'Index of /')
+SERVERS = ('nginx/1.18.0', 'Apache/2.4.6 (CentOS)', 'Microsoft-IIS/10.0', 'openresty', 'Jetty(9.4.z-SNAPSHOT)')
+LOCATIONS = ('北京 联通', '上海 电信', '广东省广州市 电信', '浙江省杭州市 阿里云', '美国 亚马逊')
+COLORS = ('red', 'yellow', 'green', 'blue')
+
+
+def generate_data(ips=10000, domains=2000, seed=2021):
+    '''生成模拟数据
+    返回值：(ip列表, domain列表)，格式与扫描任务的结果一致
+    '''
+    rnd = random.Random(seed)
+    ip_list = []
+    for i in range(ips):
+        ip = {'ip': '10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255), 'status': 'alive',
+              'location': rnd.choice(LOCATIONS), 'port': []}
+        for port in rnd.sample(PORTS, rnd.randint(1, 4)):
+            ip['port'].append({'port': port, 'status': 'open', 'title': '{} {}'.format(rnd.choice(TITLES), i),
+                               'server': rnd.choice(SERVERS), 'banner': 'banner-{}-{}'.format(port, rnd.randint(0, 99))})
+        ip_list.append(ip)
+    domain_list = []
+    for i in range(domains):
+        domain = {'domain': 'www{}.example{}.com'.format(i, i % 100),
+                  'A': list(set([rnd.choice(ip_list)['ip'] for _ in range(rnd.randint(1, 3))])),
+                  'title': [rnd.choice(TITLES)]}
+        domain_list.append(domain)
+
+    return ip_list, domain_list
+
+
+def load_data(ips=10000, domains=2000, seed=2021):
+    '''生成并写入模拟数据，返回写入的耗时及记录数
+    '''
+    from nemo.core.database.colortag import IpColorTag
+    from nemo.core.database.ip import Ip
+    from nemo.core.database.memo import IpMemo
+    from nemo.core.database.vulnerability import Vulnerability
+    from nemo.core.tasks.ingest import IngestWriter
+    from nemo.common.utils.assertinfoparser import AssertInfoParser
+
+    rnd = random.Random(seed)
+    ip_list, domain_list = generate_data(ips, domains, seed)
+    start_time = time.time()
+    writer = IngestWriter('benchmark', ('title', 'server', 'banner'))
+    writer.add_ips(ip_list)
+    writer.add_domains(domain_list)
+    writer.flush()
+    # 5%的IP有备忘录及颜色标记，2%的IP有漏洞
+    ip_ids = [row['id'] for row in Ip().gets_by_search(rows_per_page=ips)]
+    sample_ids = rnd.sample(ip_ids, len(ip_ids) // 20)
+    IpMemo().upsert_many([{'r_id': Id, 'content': 'memo {} {}'.format(Id, rnd.choice(TITLES))} for Id in sample_ids],
+                         ('r_id',), ('content',))
+    IpColorTag().upsert_many([{'r_id': Id, 'color': rnd.choice(COLORS)} for Id in sample_ids], ('r_id',), ('color',))
+    vul_app = Vulnerability()
+    targets = [ip['ip'] for ip in rnd.sample(ip_list, len(ip_list) // 50)]
+    for target in targets:
+        vul_app.save_and_update({'target': target, 'url': 'http://{}/'.format(target), 'poc_file': 'poc-test.py',
+                                 'source': 'benchmark', 'extra': ''})
+    AssertInfoParser().refresh_targets_summary(targets)
+
+    return time.time() - start_time, writer.rows
+
+
+def timeit(label, func, repeat=3):
+    '''多次执行，输出最小及平均耗时
+    '''
+    elapsed = []
+    result = None
+    for _ in range(repeat):
+        searchcache.clear()
+        start_time = time.perf_counter()
+        result = func()
+        elapsed.append(time.perf_counter() - start_time)
+    print('{:<36} min:{:>8.1f}ms avg:{:>8.1f}ms'.format(label, min(elapsed) * 1000, sum(elapsed) / len(elapsed) * 1000))
+
+    return result
+
+
+def run_dao_benchmark():
+    '''DAO查询、统计及导出的耗时
+    '''
+    from nemo.common.utils.assertexport import export_domains, export_ips
+    from nemo.common.utils.assertinfoparser import AssertInfoParser
+    from nemo.core.database.domain import Domain
+    from nemo.core.database.ip import Ip
+
+    ip_app = Ip()
+    searches = (('all', {}), ('port', {'port': '8080'}), ('content', {'content': 'Tomcat'}),
+                ('domain', {'domain': 'example1'}), ('ip', {'ip': '10.0.1.0/24'}),
+                ('ip_ranges', {'ip': ','.join(['10.0.{}.0/25'.format(i) for i in range(0, 256, 2)]) + ' !10.0.0.1'}),
+                ('location', {'iplocation': '北京'}), ('color_tag', {'color_tag': 'red'}),
+                ('memo_content', {'memo_content': 'nginx'}), ('date_delta', {'date_delta': 7}))
+    for name, search in searches:
+        timeit('ip count [{}]'.format(name), lambda: ip_app.count_by_search(**search))
+        timeit('ip gets [{}]'.format(name), lambda: ip_app.gets_by_search(**search, rows_per_page=100))
+    # 最后一页：offset分页与键集分页的对比
+    page = ip_app.count_by_search() // 100
+    if page > 1:
+        timeit('ip gets [page {}]'.format(page), lambda: ip_app.gets_by_search(page=page, rows_per_page=100))
+        after = ip_app.keyset_value(ip_app.gets_by_search(page=page - 1, rows_per_page=100)[-1])
+        timeit('ip gets [keyset page {}]'.format(page), lambda: ip_app.gets_by_search(after=after, rows_per_page=100))
+    domain_app = Domain()
+    for name, search in (('all', {}), ('domain', {'domain': 'example1'}), ('ip', {'ip': '10.0.0.1'})):
+        timeit('domain count [{}]'.format(name), lambda: domain_app.count_by_search(**search))
+        timeit('domain gets [{}]'.format(name), lambda: domain_app.gets_by_search(**search, rows_per_page=100))
+
+    def statistics():
+        result = AssertInfoParser().statistics_ip(None, None, None, None, None, None, None, None, None, None)
+        # IP及Target列表为生成器
+        return [len(list(x)) if hasattr(x, '__next__') else x for x in result]
+
+    timeit('ip statistics', statistics, 1)
+    timeit('ip export', lambda: len(b''.join(export_ips())), 1)
+    timeit('domain export', lambda: len(b''.join(export_domains())), 1)
+
+
+def run_web_benchmark():
+    '''web请求（列表、统计、导出）的耗时：使用flask的测试客户端，不需要启动web server
+    '''
+    from instance.config import ProductionConfig
+    from nemo.web.flask_app import web_app
+
+    client = web_app.test_client()
+    client.post('/login', data={'password': ProductionConfig.WEB_PASSWORD})
+    form = {'draw': 1, 'start': 0, 'length': 100}
+    timeit('web /dashboard', lambda: client.post('/dashboard').status_code)
+    timeit('web /ip-list', lambda: client.post('/ip-list', data=form).status_code)
+    timeit('web /ip-list [content]', lambda: client.post('/ip-list', data=dict(form, content='Tomcat')).status_code)
+    timeit('web /domain-list', lambda: client.post('/domain-list', data=form).status_code)
+    timeit('web /vulnerability-list', lambda: client.post('/vulnerability-list', data=form).status_code)
+    timeit('web /ip-statistics', lambda: len(client.get('/ip-statistics').data), 1)
+    timeit('web /ip-export', lambda: len(client.get('/ip-export').data), 1)
+    timeit('web /domain-export', lambda: len(client.get('/domain-export').data), 1)
+
+
+def run_benchmark(ips=10000, database=':memory:', web=True):
+    '''
+    ips:      模拟的IP数量（域名数量为IP数量的1/5）
+    database: SQLite的数据库文件（':memory:'为内存数据库），'mysql'为使用配置的MySQL数据库
+    web:      是否测试web请求
+    '''
+    if database != 'mysql':
+        dbutils.configure_backend('sqlite', database)
+    elapsed, rows = load_data(ips, ips // 5)
+    print('写入{}条记录: {:.1f}s, {:.0f}条/s'.format(rows, elapsed, rows / elapsed if elapsed else rows))
+    sqlmetrics.reset()
+    run_dao_benchmark()
+    if web:
+        run_web_benchmark()
+    # 耗时最多的语句
+    for stmt in sqlmetrics.snapshot(top=5, histogram=False)['statements']:
+        print('{:>8.1f}ms {:>6}次 {}'.format(stmt['total_time'] * 1000, stmt['count'], stmt['sql'][:120]))
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000, sys.argv[2] if len(sys.argv) > 2 else ':memory:')
@@ -2,6 +2,7 @@
 # coding:utf-8
 from . import daobase
 from . import dbutils
+from . import searchcache
 
 
 class ColorTag(daobase.DAOBase):
@@ -19,28 +20,20 @@ class ColorTag(daobase.DAOBase):
         '''根据关联的ID删除一条记录
         '''
         sql = 'delete from {} where r_id=%s'.format(self.table_name)
+        result = dbutils.execute(sql, (Id,))
+        searchcache.bump(self.table_name)
 
-        return dbutils.execute(sql, (Id,))
+        return result
 
     def save_and_update(self, data):
         '''保存数据
         新增或更新一条数据
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.get(data['r_id'])
-        # 如果已存在，则更新记录
-        if obj:
-            data_update = {}
-            self.copy_exist(data_update, data, 'r_id')
-            self.copy_exist(data_update, data, 'color')
-            self.update(obj['id'], data_update)
-            return obj['id']
-        # 如果不存在，则生成新记录
-        else:
-            data_new = {'r_id': data['r_id']}
-            self.copy_key(data_new, data, 'color', 'GREEN')
-            return self.add(data_new)
+        # 以r_id的唯一索引upsert，已存在时只更新data中有的字段
+        data_new = {'r_id': data['r_id']}
+        self.copy_key(data_new, data, 'color', 'GREEN')
+        return self.upsert(data_new, ('r_id',), [k for k in ('color',) if k in data])
 
 
 class DomainColorTag(ColorTag):
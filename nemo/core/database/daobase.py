@@ -4,6 +4,7 @@ import copy
 from datetime import datetime
 
 from . import dbutils
+from . import searchcache
 
 
 class DAOBase():
@@ -14,6 +15,16 @@ class DAOBase():
         self.order_by = None
         # 表名，由各子类指定
         self.table_name = ''
+        # 键集分页（seek）的排序字段，需唯一确定一条记录，由支持的子类指定，如('ip_int',)
+        self.keyset_columns = ()
+        # 键集分页是否为降序
+        self.keyset_desc = False
+        # 综合查询（*_by_search）所依赖的表，用于查询缓存的失效，默认为本表
+        self.search_tables = ()
+        # 综合查询缓存的过期时间（秒），为None时使用默认值
+        self.search_cache_ttl = None
+        # upsert时已存在记录的字段更新表达式，默认为values(字段)，由需要的子类指定，如{'state':'...'}
+        self.upsert_expressions = {}
 
     def set_default_datetime(self, data):
         '''设置默认时间
@@ -43,16 +54,23 @@ class DAOBase():
 
         return ''.join(sql)
 
+    def fill_order_by(self, order_by):
+        '''多记录查询时的排序
+        注意：order by是SQL语句拼接，有注入的风险，考虑进行参数过滤
+        '''
+        if not order_by:
+            order_by = self.order_by
+        if order_by:
+            return ' order by {}'.format(order_by)
+        return ''
+
     def fill_order_by_and_limit(self, param, order_by, page, rows_per_page):
         '''多记录查询时的排序、分页
         注意：order by是SQL语句拼接，有注入的风险，考虑进行参数过滤
         '''
         # 排序
         sql = []
-        if not order_by:
-            order_by = self.order_by
-        if order_by:
-            sql.append(' order by {}'.format(order_by))
+        sql.append(self.fill_order_by(order_by))
         if not rows_per_page:
             rows_per_page = self.rows_per_page
         # 指定分页
@@ -62,6 +80,34 @@ class DAOBase():
 
         return ''.join(sql)
 
+    def fill_keyset_and_limit(self, param, after, rows_per_page, pre_word='where'):
+        '''键集分页（seek）：以上一页最后一条记录的排序字段值为起点，避免limit offset扫描并丢弃前面的记录
+        after:  上一页最后一条记录的排序字段值列表（见keyset_value），为空时从第一条记录开始
+        '''
+        sql = []
+        if after:
+            if len(self.keyset_columns) == 1:
+                sql.append(' {} {}{}%s'.format(pre_word, self.keyset_columns[0], '<' if self.keyset_desc else '>'))
+            else:
+                sql.append(' {} ({}){}({})'.format(pre_word, ','.join(self.keyset_columns),
+                                                  '<' if self.keyset_desc else '>',
+                                                  ','.join(['%s'] * len(self.keyset_columns))))
+            param.extend(after)
+        # 排序
+        sql.append(' order by {}'.format(
+            ','.join([c + (' desc' if self.keyset_desc else '') for c in self.keyset_columns])))
+        if not rows_per_page:
+            rows_per_page = self.rows_per_page
+        sql.append(' limit %s')
+        param.append(rows_per_page)
+
+        return ''.join(sql)
+
+    def keyset_value(self, row):
+        '''记录的键集分页排序字段值，作为下一页查询的after参数
+        '''
+        return [row[c] for c in self.keyset_columns]
+
     def add(self, data):
         '''增加一条记录
         data:   增加的字段和值，字典格式如{'name':'google','sort_order':300}
@@ -76,7 +122,73 @@ class DAOBase():
         for k, v in data.items():
             param.append(v)
 
-        return dbutils.insertone(sql=sql, param=param)
+        Id = dbutils.insertone(sql=sql, param=param)
+        searchcache.bump(self.table_name)
+
+        return Id
+
+    def upsert_many(self, rows, key_columns, update_columns=None, batch_size=500):
+        '''批量增加或更新记录：依赖于表的唯一索引，采用INSERT ... ON DUPLICATE KEY UPDATE
+        rows:           要增加的记录列表，每条记录的字段需一致，如[{'ip':'192.168.1.1','status':'alive'},...]
+        key_columns:    唯一索引的字段，如('ip',)、('ip_id','port')
+        update_columns: 记录已存在时要更新的字段（update_datetime总是更新），更新的表达式见upsert_expressions
+        batch_size:     每批的记录数，每批提交一次
+        返回值：与rows顺序一致的id列表，失败的记录id为0
+        '''
+        if not rows:
+            return []
+        if not update_columns:
+            update_columns = ()
+        for data in rows:
+            self.set_default_datetime(data)
+        columns = list(rows[0].keys())
+        # 按唯一索引的值排序后写入：并发的upsert以相同的顺序加锁，避免死锁
+        rows_sorted = sorted(rows, key=lambda data: self.__upsert_key(data, key_columns))
+        # sql语句
+        sql_insert = 'insert into {}({}) values '.format(self.table_name, ','.join(columns))
+        sql_values = '({})'.format(','.join(['%s'] * len(columns)))
+        sql_update = ' on duplicate key update {}'.format(
+            ','.join(['{}={}'.format(c, self.upsert_expressions.get(c, 'values({})'.format(c)))
+                      for c in list(update_columns) + ['update_datetime']]))
+        # 查询id的sql语句
+        if len(key_columns) == 1:
+            sql_query = 'select id,{0} from {1} where {0} in '.format(key_columns[0], self.table_name)
+            sql_query_values = '%s'
+        else:
+            sql_query = 'select id,{} from {} where ({}) in '.format(
+                ','.join(key_columns), self.table_name, ','.join(key_columns))
+            sql_query_values = '({})'.format(','.join(['%s'] * len(key_columns)))
+        statements = []
+        for i in range(0, len(rows_sorted), batch_size):
+            batch = rows_sorted[i:i + batch_size]
+            param = []
+            for data in batch:
+                param.extend([data.get(c) for c in columns])
+            query_param = []
+            for data in batch:
+                query_param.extend([data[k] for k in key_columns])
+            statements.append((
+                sql_insert + ','.join([sql_values] * len(batch)) + sql_update, param,
+                sql_query + '({})'.format(','.join([sql_query_values] * len(batch))), query_param))
+        # 按唯一索引的值匹配id
+        key_id = {}
+        for batch_rows in dbutils.upsertmany(statements):
+            for row in batch_rows:
+                key_id[self.__upsert_key(row, key_columns)] = row['id']
+        searchcache.bump(self.table_name)
+
+        return [key_id.get(self.__upsert_key(data, key_columns), 0) for data in rows]
+
+    def upsert(self, data, key_columns, update_columns=None):
+        '''增加或更新一条记录：一条INSERT ... ON DUPLICATE KEY UPDATE语句，不需要先查询记录是否存在，并发写入时不会重复
+        返回值：记录的id，失败为0
+        '''
+        return self.upsert_many([data], key_columns, update_columns)[0]
+
+    def __upsert_key(self, data, key_columns):
+        '''唯一索引的值（忽略类型及大小写的差异）
+        '''
+        return tuple([str(data[k]).lower() for k in key_columns])
 
     def update(self, Id, data):
         '''更新一条记录
@@ -93,15 +205,19 @@ class DAOBase():
         for k, v in data.items():
             param.append(v)
         param.append(Id)
+        result = dbutils.execute(sql, param)
+        searchcache.bump(self.table_name)
 
-        return dbutils.execute(sql, param)
+        return result
 
     def delete(self, Id):
         '''删除一条记录
         '''
         sql = 'delete from {} where id=%s'.format(self.table_name)
+        result = dbutils.execute(sql, (Id,))
+        searchcache.bump(self.table_name)
 
-        return dbutils.execute(sql, (Id,))
+        return result
 
     def get(self, Id):
         '''根据ID查询一条记录
@@ -131,6 +247,32 @@ class DAOBase():
 
         return dbutils.queryall(''.join(sql), param)
 
+    def gets_in(self, column, values, query=None, fields=None, order_by=None):
+        '''根据一个字段的多个值查询记录（不分页），用于批量获取关联的记录
+        column: 字段名，如'ip_id'
+        values: 字段值的列表
+        query:  其它查询条件，字典格式如{'tag':'A'}，多个条件默认是and
+        fields: 要返回的字段，列表格式('id','name','port')
+        order_by     :  排序字段
+        '''
+        if not values:
+            return []
+        sql = []
+        param = []
+        sql.append('select {} from {} '.format(
+            self.fill_fields(fields), self.table_name))
+        if query and len(query) > 0:
+            sql.append(self.fill_where(query, param))
+            sql.append(' and ')
+        else:
+            sql.append(' where ')
+        sql.append('{} in ({})'.format(column, ','.join(['%s'] * len(values))))
+        param.extend(values)
+        sql.append(self.fill_order_by(order_by))
+        rows = dbutils.queryall(''.join(sql), param)
+
+        return rows if rows else []
+
     def count(self, query=None):
         '''统计记录总条数
         query:  查询条件，字典格式如{'name':'hello','port':80}，多个条件默认是and
@@ -12,27 +12,328 @@ Python Mysql 工具包
 5. queryone 结果集只有一行一列的情况, 自动转为结果数据 参考:simple_value()
 6. insertone 插入一条数据, 返回数据ID
 7. *_process 重构方法, 方便支持批量数据处理
+8. upsertmany 批量插入或更新(INSERT ... ON DUPLICATE KEY UPDATE), 每批数据提交一次
+9. session 工作单元: with session() 块内(或 @session() 装饰的函数)的所有语句共用一个连接, 在一个事务中执行
+10. iterate 服务器端游标逐批读取结果集(生成器), 不受结果集大小限制, 内存占用固定
+11. explain EXPLAIN模式: with explain() 块内的 queryone/queryall 只记录语句的执行计划, 用于检查查询是否使用了索引
+12. 每条语句的耗时、行数及获取连接的等待时间由 sqlmetrics 统计, 慢查询写入慢查询日志
+13. 连接池在首次获取连接时创建, 之前可由 configure_pool 设置连接数(如按web server的协程数);
+    以gevent协程方式运行时, 须在导入本模块前 monkey.patch_all(), pymysql 的网络读写才能协作式切换
+14. timeout 查询超时: with timeout() 块内(或 set_timeout 之后当前上下文)的 select 语句增加 MAX_EXECUTION_TIME 限制
+15. 读写分离: 配置了从库(DB_REPLICA_HOST)时, 工作单元之外的 queryone/queryall/iterate 使用从库;
+    写操作、工作单元、with read_primary() 块内及当前上下文写操作之后 DB_REPLICA_MAX_LAG 秒内的查询(读己之写)使用主库,
+    从库的复制延迟超过 DB_REPLICA_MAX_LAG 或无法连接时也使用主库
+16. 数据库后端: 默认为MySQL; 配置 DB_BACKEND='sqlite' (或首次获取连接前调用 configure_backend)时使用SQLite, 参考 sqlitedb
+17. 并发写入: upsertmany 在工作单元之外遇到死锁或锁等待超时时重试; advisory_lock 以 GET_LOCK 对一组名称(如ip、域名)加锁,
+    用于"读取-计算-写入"的操作(如聚合信息的计算)在多个worker之间串行化
 """
 
+import contextvars
+import hashlib
+import itertools
+import re
+import threading
+import time
 import traceback
+from contextlib import contextmanager
 
 from DBUtils.PooledDB import PooledDB
 import pymysql
 
 from instance.config import ProductionConfig
 from nemo.common.utils.loggerutils import logger
+from . import sqlitedb
+from . import sqlmetrics
+
+# 数据库后端: 'mysql' 或 'sqlite'; sqlite_path 为SQLite的数据库文件(':memory:'为内存数据库)
+backend = ProductionConfig.DB_BACKEND
+sqlite_path = ProductionConfig.DB_SQLITE_PATH
+#DBUtils连接池, 首次获取连接时按 pool_options 创建
+pool = None
+_pool_lock = threading.Lock()
+# 连接池的参数: maxconnections 为最大连接数(0不限制), blocking 为连接数已满时等待空闲连接(否则抛出异常)
+pool_options = {'mincached': 1, 'maxcached': 20, 'maxconnections': 0, 'blocking': True}
+# 从库(只读)的连接池, 配置了 DB_REPLICA_HOST 时首次查询时按 pool_options 创建
+replica_pool = None
+# 从库复制延迟的检查间隔(秒)及最近一次检查的结果
+replica_check_interval = 5
+_replica_state = {'check_time': 0, 'available': False}
+# upsert遇到死锁(1213)或锁等待超时(1205)时的重试次数
+deadlock_retries = 3
+# advisory_lock 的等待时间(秒)
+lock_timeout = 10
+
+
+# 当前工作单元固定使用的连接和游标
+_session = contextvars.ContextVar('dbutils_session', default=None)
+# EXPLAIN模式: 记录执行计划的列表
+_explain = contextvars.ContextVar('dbutils_explain', default=None)
+# 查询超时(秒): select 语句的最长执行时间
+_timeout = contextvars.ContextVar('dbutils_timeout', default=None)
+# 查询强制使用主库
+_read_primary = contextvars.ContextVar('dbutils_read_primary', default=False)
+# 当前上下文最近一次写操作的时间
+_last_write = contextvars.ContextVar('dbutils_last_write', default=0)
+
+
+def configure_backend(name, path=None):
+    """设置数据库后端, 须在首次获取连接之前调用
+    :param name: 'mysql' 或 'sqlite'
+    :param path: SQLite的数据库文件, ':memory:'为内存数据库
+    """
+    global backend, sqlite_path
+    if pool is not None:
+        logger.error("database connect pool already created, configure ignored")
+        return False
+    backend = name
+    if path:
+        sqlite_path = path
+    return True
+
+
+def configure_pool(**options):
+    """设置连接池的参数(mincached, maxcached, maxconnections, blocking 等), 须在首次获取连接之前调用
+    """
+    if pool is not None:
+        logger.error("mysql connect pool already created, configure ignored")
+        return False
+    pool_options.update(options)
+    return True
+
+
+def get_pool():
+    """获取连接池, 不存在时创建
+    """
+    global pool
+    if pool is None:
+        with _pool_lock:
+            if pool is None and backend == 'sqlite':
+                pool = sqlitedb.SqlitePool(sqlite_path)
+            elif pool is None:
+                pool = PooledDB(creator=pymysql,
+                                host=ProductionConfig.DB_HOST,
+                                port=ProductionConfig.DB_PORT,
+                                user=ProductionConfig.DB_USERNAME,
+                                password=ProductionConfig.DB_PASSWORD,
+                                db=ProductionConfig.DB_NAME,
+                                cursorclass=pymysql.cursors.DictCursor,
+                                charset='utf8',
+                                **pool_options)
+    return pool
+
+
+def get_replica_pool():
+    """获取从库的连接池, 不存在时创建; 未配置从库时返回None
+    """
+    global replica_pool
+    if not ProductionConfig.DB_REPLICA_HOST or backend == 'sqlite':
+        return None
+    if replica_pool is None:
+        with _pool_lock:
+            if replica_pool is None:
+                replica_pool = PooledDB(creator=pymysql,
+                                        host=ProductionConfig.DB_REPLICA_HOST,
+                                        port=ProductionConfig.DB_REPLICA_PORT,
+                                        user=ProductionConfig.DB_USERNAME,
+                                        password=ProductionConfig.DB_PASSWORD,
+                                        db=ProductionConfig.DB_NAME,
+                                        cursorclass=pymysql.cursors.DictCursor,
+                                        charset='utf8',
+                                        **pool_options)
+    return replica_pool
+
+
+@contextmanager
+def read_primary():
+    """块内的查询使用主库, 用于必须读取最新数据的查询
+    用法: with read_primary(): ...
+    """
+    token = _read_primary.set(True)
+    try:
+        yield
+    finally:
+        _read_primary.reset(token)
+
+
+def replica_available():
+    """从库是否可用: 每 replica_check_interval 秒检查一次复制延迟(SHOW SLAVE STATUS)
+    复制已停止(Seconds_Behind_Master为NULL)、延迟超过 DB_REPLICA_MAX_LAG 或无法连接时不可用
+    """
+    now = time.time()
+    if now - _replica_state['check_time'] < replica_check_interval:
+        return _replica_state['available']
+    # 先更新检查时间, 避免并发的查询同时检查
+    _replica_state['check_time'] = now
+    available = False
+    try:
+        con = get_replica_pool().connection()
+        cur = con.cursor()
+        try:
+            cur.execute('show slave status')
+            row = cur.fetchone()
+            # 非复制的从库(如代理)没有复制状态, 视为没有延迟
+            lag = row['Seconds_Behind_Master'] if row else 0
+            available = lag is not None and lag <= ProductionConfig.DB_REPLICA_MAX_LAG
+            if not available:
+                logger.error("mysql replica lag: {}, read from primary".format(lag))
+        finally:
+            close_cursor_connect(cur, con)
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        logger.error("cannot check mysql replica status")
+    _replica_state['available'] = available
+    return available
+
+
+def use_replica():
+    """工作单元之外的查询是否使用从库
+    """
+    if _read_primary.get() or get_replica_pool() is None:
+        return False
+    if time.time() - _last_write.get() <= ProductionConfig.DB_REPLICA_MAX_LAG:
+        return False
+    return replica_available()
+
+
+def set_timeout(seconds):
+    """设置当前上下文(线程或协程)中 select 语句的最长执行时间(MySQL 5.7.8+的 MAX_EXECUTION_TIME), 超时的查询被中止并按出错处理
+    :param seconds: 秒, None或0为不限制
+    """
+    return _timeout.set(seconds)
+
+
+@contextmanager
+def timeout(seconds):
+    """查询超时: 块内的 select 语句的最长执行时间
+    用法: with timeout(10): ...
+    """
+    token = _timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _timeout.reset(token)
+
+
+def with_timeout(sql):
+    """select 语句增加最长执行时间的 optimizer hint
+    """
+    seconds = _timeout.get()
+    if not seconds:
+        return sql
+    return re.sub(r'^\s*select\b', 'select /*+ MAX_EXECUTION_TIME({}) */'.format(int(seconds * 1000)),
+                  sql, count=1, flags=re.I)
+
+
+class Session():
+    """工作单元: 固定的连接和游标
+    """
+
+    def __init__(self, con, cur, readonly=False):
+        self.con = con
+        self.cur = cur
+        # 只读的工作单元结束时不提交
+        self.readonly = readonly
+        # 有语句执行失败时, 工作单元结束时回滚整个事务
+        self.failed = False
+        # 提交后执行的回调 {key: callback}
+        self.after_commit = {}
+
+
+@contextmanager
+def session(readonly=False):
+    """工作单元: 块内的queryone/queryall/insertone/execute等调用都复用同一个连接和游标,
+    在一个事务中执行, 块结束时统一提交(出错则回滚)
+    用法: with session() as s: ...  或者作为装饰器 @session(readonly=True)
+    嵌套使用时复用最外层的工作单元
+    :param readonly: 只读, 结束时不提交
+    """
+    s = _session.get()
+    if s:
+        if not readonly:
+            s.readonly = False
+        yield s
+        return
+    con, cur = get_connect_cursor()
+    s = Session(con, cur, readonly)
+    token = _session.set(s)
+    try:
+        yield s
+    except Exception:
+        s.failed = True
+        raise
+    finally:
+        _session.reset(token)
+        try:
+            if s.failed:
+                con.rollback()
+            elif not s.readonly:
+                con.commit()
+        except Exception as e:
+            s.failed = True
+            logger.error(traceback.format_exc())
+            logger.error("session commit or rollback fail")
+        close_cursor_connect(cur, con)
+        if not s.failed:
+            for callback in s.after_commit.values():
+                callback()
+
+
+def on_commit(key, callback):
+    """写操作提交后执行回调: 工作单元内在工作单元提交后执行(相同key只执行一次), 否则立即执行
+    :param key: 回调的key, 用于合并同一工作单元内的相同回调
+    :param callback: 回调函数, 无参数
+    """
+    s = _session.get()
+    if s:
+        s.after_commit[key] = callback
+    else:
+        callback()
+
+
+@contextmanager
+def explain():
+    """EXPLAIN模式: 块内的queryone/queryall不执行查询, 而是记录语句的执行计划, 并返回None
+    用法: with explain() as plans: ...  plans为[(sql, [执行计划的记录{}]),...]
+    """
+    plans = []
+    token = _explain.set(plans)
+    try:
+        yield plans
+    finally:
+        _explain.reset(token)
+
+
+def explain_process(plans, sql, param=None):
+    """ explain:内部调用
+    """
+    con = connect_mysql()
+    cur = con.cursor()
+    try:
+        cur.execute('explain ' + sql, param)
+        plans.append((sql, list(cur.fetchall())))
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        logger.error("[sql]:{} [param]:{}".format(sql, param))
+    finally:
+        close_cursor_connect(cur, con)
+
+
+def _commit(con):
+    """ 提交: 工作单元内的语句在工作单元结束时统一提交
+    """
+    _last_write.set(time.time())
+    if not _session.get():
+        con.commit()
+
 
-#DBUtils连接池
-pool = PooledDB(creator=pymysql,
-                mincached=1,
-                maxcached=20,
-                host=ProductionConfig.DB_HOST,
-                port=ProductionConfig.DB_PORT,
-                user=ProductionConfig.DB_USERNAME,
-                password=ProductionConfig.DB_PASSWORD,
-                db=ProductionConfig.DB_NAME,
-                cursorclass=pymysql.cursors.DictCursor,
-                charset='utf8')
+def _rollback(con):
+    """ 回滚: 工作单元内的语句出错时, 在工作单元结束时回滚整个事务
+    """
+    s = _session.get()
+    if s:
+        s.failed = True
+    else:
+        con.rollback()
 
 
 def get_connect_cursor():
@@ -62,19 +363,45 @@ def close_cursor_connect(cur, con):
 
 def connect_mysql():
     try:
-        return pool.connection()
+        start = time.perf_counter()
+        con = get_pool().connection()
+        sqlmetrics.record_checkout(time.perf_counter() - start)
+        return con
     except Exception as e:
         logger.error(traceback.format_exc())
         logger.error("cannot create mysql connect")
 
 
+def connect_read():
+    """ 只读查询的连接: 从库可用时使用从库(无法连接时使用主库), 否则使用主库
+    """
+    if use_replica():
+        try:
+            start = time.perf_counter()
+            con = get_replica_pool().connection()
+            sqlmetrics.record_checkout(time.perf_counter() - start)
+            return con
+        except Exception as e:
+            _replica_state['available'] = False
+            logger.error(traceback.format_exc())
+            logger.error("cannot create mysql replica connect")
+    return connect_mysql()
+
+
 def queryone(sql, param=None):
     """返回结果集的第一条数据
     :param sql: sql语句
     :param param: string|tuple|list
     :return: 字典列表 [{}]
     """
-    con = connect_mysql()
+    plans = _explain.get()
+    if plans is not None:
+        return explain_process(plans, sql, param)
+    sql = with_timeout(sql)
+    s = _session.get()
+    if s:
+        return queryone_process(s.con, s.cur, sql, param)
+    con = connect_read()
     cur = con.cursor()
     row = queryone_process(con, cur, sql, param)
     cur.close()
@@ -87,10 +414,12 @@ def queryone_process(con, cur, sql, param=None):
     """
     row = None
     try:
-        cur.execute(sql, param)
-        row = cur.fetchone()
+        with sqlmetrics.measure(sql, param) as m:
+            cur.execute(sql, param)
+            row = cur.fetchone()
+            m.rows = 1 if row else 0
     except Exception as e:
-        con.rollback()
+        _rollback(con)
         logger.error(traceback.format_exc())
         logger.error("[sql]:{} [param]:{}".format(sql, param))
     return simple_value(row)
@@ -102,7 +431,14 @@ def queryall(sql, param=None):
     :param param: tuple|list
     :return: 字典列表 [{},{},{}...] or [,,,]
     """
-    con = connect_mysql()
+    plans = _explain.get()
+    if plans is not None:
+        return explain_process(plans, sql, param)
+    sql = with_timeout(sql)
+    s = _session.get()
+    if s:
+        return queryall_process(s.con, s.cur, sql, param)
+    con = connect_read()
     cur = con.cursor()
     rows = queryall_process(con, cur, sql, param)
     cur.close()
@@ -115,15 +451,60 @@ def queryall_process(con, cur, sql, param=None):
     """
     rows = None
     try:
-        cur.execute(sql, param)
-        rows = cur.fetchall()
+        with sqlmetrics.measure(sql, param) as m:
+            cur.execute(sql, param)
+            rows = cur.fetchall()
+            m.rows = len(rows)
     except Exception as e:
-        con.rollback()
+        _rollback(con)
         logger.error(traceback.format_exc())
         logger.error("[sql]:{} [param]:{}".format(sql, param))
     return simple_list(rows)
 
 
+def iterate(sql, param=None, fetch_size=1000):
+    """使用服务器端游标(SSDictCursor)逐批读取结果集的生成器
+    结果集不会一次性缓存在客户端, 适合大数据量的导出和统计
+    注意: 迭代期间独占一个连接(不使用工作单元的连接), 应读取完毕或close生成器
+    :param sql: sql语句
+    :param param: tuple|list
+    :param fetch_size: 每次从服务器读取的记录数
+    :return: 生成器, 每次返回一条记录 {}
+    """
+    sql = with_timeout(sql)
+    con = connect_read()
+    cur = con.cursor(pymysql.cursors.SSDictCursor)
+    try:
+        with sqlmetrics.measure(sql, param):
+            cur.execute(sql, param)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    except Exception as e:
+        con.rollback()
+        logger.error(traceback.format_exc())
+        logger.error("[sql]:{} [param]:{}".format(sql, param))
+    finally:
+        close_cursor_connect(cur, con)
+
+
+def chunks(rows, size=1000):
+    """将记录的迭代器(如 iterate 的结果)按 size 分批的生成器, 便于每批记录批量查询关联数据
+    :param rows: 可迭代对象
+    :param size: 每批的记录数
+    :return: 生成器, 每次返回一批记录 []
+    """
+    it = iter(rows)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            break
+        yield batch
+
+
 def insertmany(sql, arrays=None, batch_size=10000):
     """批量插入数据
     :param sql: sql语句
@@ -131,6 +512,9 @@ def insertmany(sql, arrays=None, batch_size=10000):
     :param batch_size: 每批入库数量, 超过自动多批入库
     :return: 入库数量
     """
+    s = _session.get()
+    if s:
+        return insertmany_process(s.con, s.cur, sql, arrays, batch_size)
     con = connect_mysql()
     cur = con.cursor()
     cnt = insertmany_process(con, cur, sql, arrays, batch_size)
@@ -151,6 +535,9 @@ def insertone(sql, param=None):
     :param param: string|tuple
     :return: id
     """
+    s = _session.get()
+    if s:
+        return insertone_process(s.con, s.cur, sql, param)
     con = connect_mysql()
     cur = con.cursor()
     lastrowid = insertone_process(con, cur, sql, param)
@@ -164,11 +551,12 @@ def insertone_process(con, cur, sql, param):
     """
     lastrowid = 0
     try:
-        cur.execute(sql, param)
-        con.commit()
+        with sqlmetrics.measure(sql, param) as m:
+            m.rows = cur.execute(sql, param)
+            _commit(con)
         lastrowid = cur.lastrowid
     except Exception as e:
-        con.rollback()
+        _rollback(con)
         logger.error(traceback.format_exc())
         logger.error("[sql]:{} [param]:{}".format(sql, param))
     return lastrowid
@@ -181,6 +569,9 @@ def execute(sql, param=None):
     :param param: string|list
     :return: 影响数量
     """
+    s = _session.get()
+    if s:
+        return execute_process(s.con, s.cur, sql, param)
     con = connect_mysql()
     cur = con.cursor()
     cnt = execute_process(con, cur, sql, param)
@@ -194,10 +585,11 @@ def execute_process(con, cur, sql, param=None):
     """
     cnt = 0
     try:
-        cnt = cur.execute(sql, param)
-        con.commit()
+        with sqlmetrics.measure(sql, param) as m:
+            cnt = m.rows = cur.execute(sql, param)
+            _commit(con)
     except Exception as e:
-        con.rollback()
+        _rollback(con)
         logger.error(traceback.format_exc())
         logger.error("[sql]:{} [param]:{}".format(sql, param))
     return cnt
@@ -212,15 +604,121 @@ def executemany_process(con, cur, sql, arrays=None, batch_size=10000):
         for i in range(batch_cnt):
             sub_array = arrays[i * batch_size:(i + 1) * batch_size]
             if sub_array:
-                cnt += cur.executemany(sql, sub_array)
-                con.commit()
+                with sqlmetrics.measure(sql, sub_array[:1]) as m:
+                    m.rows = cur.executemany(sql, sub_array)
+                    _commit(con)
+                cnt += m.rows
     except Exception as e:
-        con.rollback()
+        _rollback(con)
         logger.error(traceback.format_exc())
         logger.error("[sql]:{} [param]:{}".format(sql, arrays))
     return cnt
 
 
+def upsertmany(statements):
+    """批量插入或更新数据(INSERT ... ON DUPLICATE KEY UPDATE)
+    :param statements: [(upsert_sql, upsert_param, query_sql, query_param),...], 每一项为一批数据
+    :return: 每一批数据查询语句的结果集 [[{},{}...],...]
+    """
+    s = _session.get()
+    if s:
+        return [upsert_process(s.con, s.cur, upsert_sql, upsert_param, query_sql, query_param)
+                for upsert_sql, upsert_param, query_sql, query_param in statements]
+    con = connect_mysql()
+    cur = con.cursor()
+    results = []
+    for upsert_sql, upsert_param, query_sql, query_param in statements:
+        results.append(upsert_process(con, cur, upsert_sql, upsert_param, query_sql, query_param,
+                                      retries=deadlock_retries))
+    cur.close()
+    con.close()
+    return results
+
+
+def _is_deadlock(e):
+    """ 是否是死锁(1213)或锁等待超时(1205)
+    """
+    return isinstance(e, pymysql.err.OperationalError) and e.args and e.args[0] in (1205, 1213)
+
+
+def upsert_process(con, cur, upsert_sql, upsert_param, query_sql=None, query_param=None, retries=0):
+    """ upsert:内部调用
+    执行一批upsert语句并查询结果，只提交一次
+    :param retries: 死锁或锁等待超时时的重试次数(回滚后重新执行, 只用于工作单元之外)
+    """
+    rows = []
+    try:
+        with sqlmetrics.measure(upsert_sql, upsert_param) as m:
+            m.rows = cur.execute(upsert_sql, upsert_param)
+        if query_sql:
+            with sqlmetrics.measure(query_sql, query_param) as m:
+                cur.execute(query_sql, query_param)
+                rows = cur.fetchall()
+                m.rows = len(rows)
+        _commit(con)
+    except Exception as e:
+        _rollback(con)
+        if retries > 0 and _is_deadlock(e):
+            logger.error("mysql deadlock, retry upsert: {}".format(e))
+            return upsert_process(con, cur, upsert_sql, upsert_param, query_sql, query_param, retries - 1)
+        rows = []
+        logger.error(traceback.format_exc())
+        logger.error("[sql]:{} [param]:{}".format(upsert_sql, upsert_param))
+    return rows
+
+
+def lock_name(prefix, value):
+    """ advisory_lock 的锁名称: MySQL的锁名称最长64个字符, 较长的值(如域名)使用md5
+    """
+    value = str(value).lower()
+    if len(prefix) + len(value) > 60:
+        value = hashlib.md5(value.encode('utf-8')).hexdigest()
+    return 'nemo:{}:{}'.format(prefix, value)
+
+
+@contextmanager
+def advisory_lock(names, timeout=None):
+    """对一组名称加锁(GET_LOCK), 块结束时释放; 锁由单独的连接持有, 块内的语句可以使用任意连接或工作单元
+    名称排序后在一条语句中依次加锁, 多个进程对有交集的名称加锁时不会死锁
+    SQLite后端(单进程)不加锁
+    用法: with advisory_lock([lock_name('ip', ip) for ip in ips]) as locked: ...
+    :param names: 锁名称的列表, 参考 lock_name
+    :param timeout: 等待时间(秒), 默认为 lock_timeout
+    :return: 是否加锁成功; 失败(超时)时仍执行块内的语句
+    """
+    names = sorted(set(names))
+    if not names or backend == 'sqlite':
+        yield True
+        return
+    con = connect_mysql()
+    cur = con.cursor()
+    locked = False
+    try:
+        sql = 'select {}'.format(','.join(['get_lock(%s,%s) as l{}'.format(i) for i in range(len(names))]))
+        param = []
+        for name in names:
+            param.extend((name, timeout if timeout is not None else lock_timeout))
+        with sqlmetrics.measure(sql, param) as m:
+            cur.execute(sql, param)
+            row = cur.fetchone()
+            m.rows = 1
+        locked = all([v == 1 for v in row.values()])
+        if not locked:
+            logger.error("cannot get lock: {}".format(names[:10]))
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        logger.error("cannot get lock: {}".format(names[:10]))
+    try:
+        yield locked
+    finally:
+        try:
+            cur.execute('select release_all_locks()')
+            cur.fetchall()
+        except Exception as e:
+            logger.error(traceback.format_exc())
+        close_cursor_connect(cur, con)
+
+
 def simple_list(rows):
     """结果集只有一列的情况, 直接使用数据返回
     :param rows: [{'id': 1}, {'id': 2}, {'id': 3}]
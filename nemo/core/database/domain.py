@@ -5,6 +5,8 @@ from datetime import datetime
 from datetime import timedelta
 
 from . import dbutils
+from . import searchcache
+from . import textsearch
 from . import daobase
 
 from nemo.common.utils.loggerutils import logger
@@ -14,26 +16,19 @@ class Domain(daobase.DAOBase):
         super().__init__()
         self.table_name = 'domain'
         self.order_by = 'domain'
+        self.search_tables = ('domain', 'domain_attr', 'domain_color_tag', 'domain_memo')
+        self.keyset_columns = ('domain',)
 
     def save_and_update(self, data):
         '''保存数据
         新增或更新一条数据
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.gets({'domain': data['domain']})
-        # 如果已存在，则更新记录
-        if obj and len(obj) > 0:
-            data_update = {}
-            self.copy_exist(data_update, data, 'org_id')
-            self.update(obj[0]['id'], data_update)
-            return obj[0]['id']
-        # 如果不存在，则生成新记录
-        else:
-            data_new = {'domain': data['domain']}
-            self.copy_key(data_new, data, 'org_id')
+        # 以domain的唯一索引upsert，已存在时只更新data中有的字段
+        data_new = {'domain': data['domain']}
+        self.copy_key(data_new, data, 'org_id')
 
-            return self.add(data_new)
+        return self.upsert(data_new, ('domain',), [k for k in ('org_id',) if k in data])
 
     def __fill_where_by_search(self, org_id, domain, ip, color_tag, memo_content, date_delta):
         '''根据指定的字段，生成查询SQL语句和参数
@@ -66,8 +61,8 @@ class Domain(daobase.DAOBase):
         if memo_content:
             sql.append(link_word)
             sql.append(
-                ' id in (select r_id from domain_memo where content like %s)')
-            param.append('%' + memo_content+'%')
+                ' id in (select r_id from domain_memo where {})'.format(
+                    textsearch.fill_contains('domain_memo', 'content', memo_content, param)))
             link_word = ' and '
         if date_delta:
             try:
@@ -84,6 +79,7 @@ class Domain(daobase.DAOBase):
 
         return sql, param
 
+    @searchcache.cached
     def count_by_search(self, org_id=None, domain=None, ip=None, color_tag=None, memo_content=None, date_delta=None):
         '''统计记录总条数
         org_id:     组织的ID
@@ -103,8 +99,9 @@ class Domain(daobase.DAOBase):
 
         return dbutils.queryone(''.join(sql), param)
 
+    @searchcache.cached
     def gets_by_search(self, org_id=None, domain=None, ip=None, color_tag=None, memo_content=None, date_delta=None, 
-                       fields=None, page=1, rows_per_page=None, order_by=None):
+                       fields=None, page=1, rows_per_page=None, order_by=None, after=None):
         '''根据组织机构、IP地址（包括范围）及端口的综合查询
         org_id:     组织的ID
         domain:     单个域名
@@ -115,6 +112,7 @@ class Domain(daobase.DAOBase):
         page:       分页位置，从1开始
         rows_per_page:  每页的记录数
         order_by     :  排序字段
+        after        :  键集分页，上一页最后一条记录的排序字段值（keyset_value），指定时忽略page和order_by
         '''
         sql = []
         param = []
@@ -125,8 +123,33 @@ class Domain(daobase.DAOBase):
             org_id, domain, ip, color_tag, memo_content, date_delta)
         sql.extend(where_sql)
         param.extend(where_param)
-        # 排序、分页
-        sql.append(self.fill_order_by_and_limit(
-            param, order_by, page, rows_per_page))
+        # 排序、分页：指定after时使用键集分页
+        if after:
+            sql.append(self.fill_keyset_and_limit(
+                param, after, rows_per_page, 'and' if where_sql else 'where'))
+        else:
+            sql.append(self.fill_order_by_and_limit(
+                param, order_by, page, rows_per_page))
 
         return dbutils.queryall(''.join(sql), param)
+
+    def iter_by_search(self, org_id=None, domain=None, ip=None, color_tag=None, memo_content=None, date_delta=None,
+                       fields=None, order_by=None, fetch_size=1000):
+        '''根据查询条件，使用服务器端游标逐条读取所有的记录（生成器，不分页）
+        fields:     要返回的字段，列表格式('id','name','port')
+        order_by     :  排序字段
+        fetch_size   :  每次从数据库读取的记录数
+        '''
+        sql = []
+        param = []
+        sql.append('select {} from {} '.format(
+            self.fill_fields(fields), self.table_name))
+        # 查询条件
+        where_sql, where_param = self.__fill_where_by_search(
+            org_id, domain, ip, color_tag, memo_content, date_delta)
+        sql.extend(where_sql)
+        param.extend(where_param)
+        # 排序
+        sql.append(self.fill_order_by(order_by))
+
+        return dbutils.iterate(''.join(sql), param, fetch_size)
@@ -1,66 +1,104 @@
 #!/usr/bin/env python3
 # coding:utf-8
-import traceback
-import ipaddress
 import re
+import traceback
 from datetime import datetime
 from datetime import timedelta
 
 from . import dbutils
+from . import searchcache
+from . import textsearch
 from . import daobase
 
+from nemo.common.utils import iputils
 from nemo.common.utils.loggerutils import logger
 
+# IP地址区间的查询条件：不超过该数量时为ip_bin between的or，否则与区间的派生表连接
+IP_INTERVALS_OR_MAX = 100
+# 派生表每个子查询的区间数（SQLite的union all最多500项）
+IP_INTERVALS_CHUNK = 400
 
 class Ip(daobase.DAOBase):
     def __init__(self):
         super().__init__()
         self.table_name = 'ip'
-        self.order_by = 'ip_int'
+        # ip_bin：IPv4与IPv6统一的128位地址（16字节，IPv4为IPv4映射地址），用于排序及网段的范围查询
+        self.order_by = 'ip_bin'
+        self.search_tables = ('ip', 'port', 'port_attr', 'domain', 'domain_attr', 'ip_color_tag', 'ip_memo')
+        self.keyset_columns = ('ip_bin',)
 
     def ip2int(self, ip):
-        '''将点分的字符串IP转换为整数值
+        '''将点分的字符串IP转换为整数值，IPv6地址返回None
         '''
+        if iputils.is_ipv6(ip):
+            return None
         ips = ip.strip().split('.')
         x = int(ips[0]) << 24 | int(ips[1]) << 16 | int(
             ips[2]) << 8 | int(ips[3])
         return x
 
+    def fill_ip(self, data):
+        '''IP地址转换为规范格式，并计算整数值（IPv4）及128位地址值
+        '''
+        data['ip'] = iputils.normalize_ip(data['ip'])
+        data['ip_int'] = self.ip2int(data['ip'])
+        data['ip_bin'] = iputils.ip_to_bin(data['ip'])
+
     def add(self, data):
         '''增加一条IP记录：计算IP的整数值
         '''
-        data['ip_int'] = self.ip2int(data['ip'])
+        self.fill_ip(data)
         return super().add(data)
 
+    def upsert_many(self, rows, key_columns=('ip',), update_columns=None, batch_size=500):
+        '''批量增加或更新IP记录：计算IP的整数值
+        '''
+        for data in rows:
+            self.fill_ip(data)
+        return super().upsert_many(rows, key_columns, update_columns, batch_size)
+
     def update(self, Id, data):
         '''更新一条IP记录：如果IP地址需要更新，重新计算整数值
         '''
         if 'ip' in data:
-            data['ip_int'] = self.ip2int(data['ip'])
+            self.fill_ip(data)
         return super().update(Id, data)
 
     def save_and_update(self, data):
         '''保存数据
-        新增或更新一条数据
+        新增或更新一条数据（以ip的唯一索引upsert，已存在时只更新data中有的字段）
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.gets({'ip': data['ip']})
-        # 如果已存在，则更新记录
-        if obj and len(obj) > 0:
-            data_update = {}
-            self.copy_exist(data_update, data, 'status')
-            self.copy_exist(data_update, data, 'org_id')
-            self.copy_exist(data_update, data, 'location')
-            self.update(obj[0]['id'], data_update)
-            return obj[0]['id']
-        # 如果不存在，则生成新记录
-        else:
-            data_new = {'ip': data['ip']}
-            self.copy_key(data_new, data, 'status', 'alive')
-            self.copy_key(data_new, data, 'org_id')
-            self.copy_key(data_new, data, 'location')
-            return self.add(data_new)
+        data_new = {'ip': data['ip']}
+        self.copy_key(data_new, data, 'status', 'alive')
+        self.copy_key(data_new, data, 'org_id')
+        self.copy_key(data_new, data, 'location')
+
+        return self.upsert(data_new, ('ip',), [k for k in ('status', 'org_id', 'location') if k in data])
+
+    def __fill_ip_intervals(self, intervals, param):
+        '''IP地址区间（128位整数值）的查询条件
+        区间不超过IP_INTERVALS_OR_MAX个时为多个ip_bin between的or，MySQL对索引index_ip_ip_bin进行多个范围的扫描；
+        更多时与区间的派生表（每IP_INTERVALS_CHUNK个区间一个子查询）连接，每个区间使用索引查找
+        '''
+        if not intervals:
+            # 所有的地址都被排除
+            return ' 1=0 '
+        if len(intervals) <= IP_INTERVALS_OR_MAX:
+            for start, end in intervals:
+                param.append(iputils.int_to_bin(start))
+                param.append(iputils.int_to_bin(end))
+            return ' ({}) '.format(' or '.join(['ip_bin between %s and %s'] * len(intervals)))
+        ranges_sql = []
+        for i, chunk in enumerate(dbutils.chunks(intervals, IP_INTERVALS_CHUNK)):
+            ranges_sql.append('select * from (select %s as s,%s as e{}) r{}'.format(
+                ' union all select %s,%s' * (len(chunk) - 1), i))
+            for start, end in chunk:
+                param.append(iputils.int_to_bin(start))
+                param.append(iputils.int_to_bin(end))
+
+        return ' id in (select i.id from {} i join ({}) r on i.ip_bin between r.s and r.e) '.format(
+            self.table_name, ' union all '.join(ranges_sql))
 
     def __fill_search_where(self, org_id, domain, ip, port, content, iplocation, port_status, color_tag, memo_content, date_delta):
         '''根据指定的字段，生成查询SQL语句和参数
@@ -85,23 +123,20 @@ class Ip(daobase.DAOBase):
             param.append('%'+domain+'%')
             link_word = ' and '
         if ip:
-            # IP范围范围：是否是IP/掩码
-            ip_mask = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\/\d{1,2}$'
+            # 单个IP地址精确查询；多个IP、IP/掩码、IP范围及排除的地址合并为有序、不相交的地址区间，网段不展开
             try:
-                if re.match(ip_mask, ip):
-                    ip_network = ipaddress.ip_network(ip, strict=False)
-                    param.append(int(ip_network[0]))
-                    param.append(int(ip_network[-1]))
-                    sql.append(link_word)
-                    sql.append(' ip_int between %s and %s ')
-                else:
-                    param.append(ip)
-                    sql.append(link_word)
-                    sql.append(' ip=%s ')
-                link_word = ' and '
-            except:
-                logger.error(traceback.format_exc())
-                logger.error('ip address wrong:{}'.format(ip))
+                intervals = iputils.parse_ip_intervals(ip)
+            except ValueError:
+                intervals = None
+                if re.search(r'[\s,;!/-]', ip.strip()):
+                    logger.error('ip address wrong:{}'.format(ip))
+            sql.append(link_word)
+            if intervals is None or re.match(r'^[0-9a-fA-F:.]+$', ip.strip()):
+                sql.append(' ip=%s ')
+                param.append(iputils.normalize_ip(ip.strip()))
+            else:
+                sql.append(self.__fill_ip_intervals(intervals, param))
+            link_word = ' and '
         if port:
             sql.append(link_word)
             sql.append(' id in (select distinct ip_id from port where ')
@@ -126,8 +161,8 @@ class Ip(daobase.DAOBase):
         if content:
             sql.append(link_word)
             sql.append(
-                ' id in (select ip_id from port  where id in (select r_id from port_attr where content like %s))')
-            param.append('%'+content+'%')
+                ' id in (select ip_id from port  where id in (select r_id from port_attr where {}))'.format(
+                    textsearch.fill_contains('port_attr', 'content', content, param)))
             link_word = ' and '
         if color_tag:
             sql.append(link_word)
@@ -137,8 +172,8 @@ class Ip(daobase.DAOBase):
         if memo_content:
             sql.append(link_word)
             sql.append(
-                ' id in (select r_id from ip_memo where content like %s)')
-            param.append('%' + memo_content+'%')
+                ' id in (select r_id from ip_memo where {})'.format(
+                    textsearch.fill_contains('ip_memo', 'content', memo_content, param)))
             link_word = ' and '
         if date_delta:
             try:
@@ -155,11 +190,12 @@ class Ip(daobase.DAOBase):
 
         return sql, param
 
+    @searchcache.cached
     def count_by_search(self, org_id=None, domain=None, ip=None, port=None, content=None, iplocation=None, port_status=None, color_tag=None, memo_content=None,date_delta=None):
         '''统计记录总条数
         org_id:     组织的ID
         domain:     域名
-        ip:         ip地址或ip/掩码,(192.168.1.5或172.16.0.0/16）
+        ip:         ip地址、ip/掩码或ip范围，多个以逗号或空白分隔，!开头的为排除(192.168.1.5或172.16.0.0/16,2001:db8::/32 !172.16.1.0/24）
         port:       端口号，多个端口号以,分隔('21,22,80,8080')
         content:    端口属性内容
         color_tag:  标记的颜色
@@ -176,12 +212,13 @@ class Ip(daobase.DAOBase):
 
         return dbutils.queryone(''.join(sql), param)
 
+    @searchcache.cached
     def gets_by_search(self, org_id=None, domain=None, ip=None, port=None, content=None, iplocation=None, port_status=None, color_tag=None, memo_content=None,date_delta=None,
-                       fields=None, page=1, rows_per_page=None, order_by=None):
+                       fields=None, page=1, rows_per_page=None, order_by=None, after=None):
         '''根据组织机构、IP地址（包括范围）及端口的综合查询
         org_id:     组织的ID
         domain:     域名
-        ip:         ip地址或ip/掩码,(192.168.1.5或172.16.0.0/16）
+        ip:         ip地址、ip/掩码或ip范围，多个以逗号或空白分隔，!开头的为排除(192.168.1.5或172.16.0.0/16,2001:db8::/32 !172.16.1.0/24）
         port:       端口号，多个端口号以,分隔('21,22,80,8080')
         content:    端口属性内容
         iplocation: IP归属地
@@ -191,6 +228,7 @@ class Ip(daobase.DAOBase):
         page:       分页位置，从1开始
         rows_per_page:  每页的记录数
         order_by     :  排序字段
+        after        :  键集分页，上一页最后一条记录的排序字段值（keyset_value），指定时忽略page和order_by
         '''
         sql = []
         param = []
@@ -201,8 +239,91 @@ class Ip(daobase.DAOBase):
             org_id, domain, ip, port, content, iplocation, port_status, color_tag, memo_content, date_delta)
         sql.extend(where_sql)
         param.extend(where_param)
-        # 排序、分页
-        sql.append(self.fill_order_by_and_limit(
-            param, order_by, page, rows_per_page))
+        # 排序、分页：指定after时使用键集分页
+        if after:
+            sql.append(self.fill_keyset_and_limit(
+                param, after, rows_per_page, 'and' if where_sql else 'where'))
+        else:
+            sql.append(self.fill_order_by_and_limit(
+                param, order_by, page, rows_per_page))
 
         return dbutils.queryall(''.join(sql), param)
+
+    def iter_by_search(self, org_id=None, domain=None, ip=None, port=None, content=None, iplocation=None, port_status=None, color_tag=None, memo_content=None, date_delta=None,
+                       fields=None, order_by=None, fetch_size=1000):
+        '''根据查询条件，使用服务器端游标逐条读取所有的记录（生成器，不分页）
+        fields:     要返回的字段，列表格式('id','name','port')
+        order_by     :  排序字段
+        fetch_size   :  每次从数据库读取的记录数
+        '''
+        sql = []
+        param = []
+        sql.append('select {} from {} '.format(
+            self.fill_fields(fields), self.table_name))
+        # 查询条件
+        where_sql, where_param = self.__fill_search_where(
+            org_id, domain, ip, port, content, iplocation, port_status, color_tag, memo_content, date_delta)
+        sql.extend(where_sql)
+        param.extend(where_param)
+        # 排序
+        sql.append(self.fill_order_by(order_by))
+
+        return dbutils.iterate(''.join(sql), param, fetch_size)
+
+    def statistics_by_search(self, org_id=None, domain=None, ip=None, port=None, content=None, iplocation=None, port_status=None, color_tag=None, memo_content=None, date_delta=None):
+        '''根据查询条件，在数据库中聚合统计：端口出现的次数、C段及归属地
+        返回值：(port_count_rows, network_list, location_rows)
+            port_count_rows:  [{'port':80,'port_count':10},...]，按次数降序
+            network_list:     网段的ip_bin前缀（IPv4为C段的15字节，IPv6为/64的8字节，见iputils.prefix_to_network）
+            location_rows:    [{'location':'北京市','location_count':10},...]，按次数降序
+        '''
+        where_sql, where_param = self.__fill_search_where(
+            org_id, domain, ip, port, content, iplocation, port_status, color_tag, memo_content, date_delta)
+        ip_sql = 'select id from {} {}'.format(self.table_name, ''.join(where_sql))
+        # 端口
+        sql = 'select port,count(id) as port_count from port where ip_id in ({}) group by port order by port_count desc,port'.format(
+            ip_sql)
+        port_count_rows = dbutils.queryall(sql, where_param)
+        # C段（IPv6为/64）
+        sql = 'select distinct case when ip_int is null then substr(ip_bin,1,8) else substr(ip_bin,1,15) end as network from {} {}'.format(
+            self.table_name, ''.join(where_sql))
+        network_list = dbutils.queryall(sql, where_param)
+        # 归属地：取location第一个逗号、空格前的内容
+        sql = 'select trim(substring_index(substring_index(location,",",1)," ",1)) as location,count(id) as location_count from {} {} group by 1 order by location_count desc'.format(
+            self.table_name, ''.join(where_sql))
+        location_rows = dbutils.queryall(sql, where_param)
+
+        return port_count_rows if port_count_rows else [], network_list if network_list else [], location_rows if location_rows else []
+
+    def iter_ip_by_search(self, org_id=None, domain=None, ip=None, port=None, content=None, iplocation=None, port_status=None, color_tag=None, memo_content=None, date_delta=None, fetch_size=10000):
+        '''根据查询条件，按ip_bin顺序读取IP地址（生成器，服务器端游标）
+        '''
+        rows = self.iter_by_search(org_id, domain, ip, port, content, iplocation, port_status, color_tag,
+                                   memo_content, date_delta, fields=('ip',), order_by='ip_bin',
+                                   fetch_size=fetch_size)
+        for row in rows:
+            yield row['ip']
+
+    def iter_ports_by_ip(self, ip, updated_since, fetch_size=10000):
+        '''读取IP范围内、指定时间之后更新的端口（生成器，服务器端游标），按ip_bin、port排序
+        ip:             IP、网段或范围（格式同查询条件的ip）
+        updated_since:  端口的更新时间，如本次扫描的开始时间
+        返回值：{'ip':'192.168.1.1','port':80,'status':'open'}
+        '''
+        param = []
+        ip_where = self.__fill_ip_intervals(iputils.parse_ip_intervals(ip), param)
+        param.append(updated_since)
+        sql = 'select i.ip,p.port,p.status from {0} i join port p on p.ip_id=i.id where i.id in (select id from {0} where {1}) and p.update_datetime>=%s order by i.ip_bin,p.port'.format(
+            self.table_name, ip_where)
+
+        return dbutils.iterate(sql, param, fetch_size)
+
+    def iter_target_by_search(self, org_id=None, domain=None, ip=None, port=None, content=None, iplocation=None, port_status=None, color_tag=None, memo_content=None, date_delta=None, fetch_size=10000):
+        '''根据查询条件，按ip_bin、port顺序读取ip:port（生成器，服务器端游标），IPv6为[ip]:port
+        '''
+        where_sql, where_param = self.__fill_search_where(
+            org_id, domain, ip, port, content, iplocation, port_status, color_tag, memo_content, date_delta)
+        sql = 'select i.ip,p.port from {} i join port p on p.ip_id=i.id where i.id in (select id from {} {}) order by i.ip_bin,p.port'.format(
+            self.table_name, self.table_name, ''.join(where_sql))
+        for row in dbutils.iterate(sql, where_param, fetch_size):
+            yield iputils.format_host_port(row['ip'], row['port'])
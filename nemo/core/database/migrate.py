@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+数据库结构的版本升级
+1. 升级脚本保存在migrations目录，文件名为"版本号_名称.sql"，按版本号顺序执行
+2. 已执行的版本记录在schema_version表中（nemo.sql已包含的版本在导入时写入），每个版本只执行一次
+3. 执行期间使用GET_LOCK加锁，避免多个进程同时升级
+4. DDL会自动提交，版本执行中断后，已执行的语句不会回滚：重新执行时，ALTER TABLE语句增加的字段（ADD COLUMN）及索引
+   （ADD INDEX）都已存在（且没有DROP）则跳过该语句；其它语句（如UPDATE ... WHERE ... IS NULL、MODIFY）需编写为可以重复执行
+5. check使用EXPLAIN检查常用的查询是否使用了索引
+
+用法：python3 -m nemo.core.database.migrate [status|upgrade|check]
+"""
+import os
+import re
+import sys
+import traceback
+
+from . import dbutils
+from . import searchcache
+from . import textsearch
+from .attr import DomainAttr
+from .domain import Domain
+from .ip import Ip
+from .task import Task
+from .vulnerability import Vulnerability
+from nemo.common.utils.loggerutils import logger
+
+# 升级脚本的目录
+MIGRATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# 升级时的锁名称及等待时间（秒）
+LOCK_NAME = 'nemo_schema_migration'
+LOCK_TIMEOUT = 600
+
+_ALTER_TABLE = re.compile(r'^alter\s+table\s+`?(\w+)`?\s', re.I)
+_ADD_COLUMN = re.compile(r'\badd\s+column\s+`?(\w+)`?', re.I)
+_ADD_INDEX = re.compile(r'\badd\s+(?:unique\s+|fulltext\s+)?(?:index|key)\s+`?(\w+)`?', re.I)
+_DROP = re.compile(r'\bdrop\s', re.I)
+
+
+def load_migrations():
+    '''读取所有的升级脚本
+    返回值：按版本号排序的[(version, name, path),...]
+    '''
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_PATH):
+        m = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if m:
+            migrations.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_PATH, filename)))
+
+    return sorted(migrations)
+
+
+def split_statements(script):
+    '''将升级脚本拆分为单条的sql语句（去除注释）
+    '''
+    script = re.sub(r'/\*.*?\*/', '', script, flags=re.S)
+    lines = [line for line in script.splitlines() if not line.strip().startswith('--')]
+
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+def _create_version_table(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS `schema_version` (
+                  `version` int(10) unsigned NOT NULL,
+                  `name` varchar(100) NOT NULL,
+                  `applied_datetime` datetime NOT NULL,
+                  PRIMARY KEY (`version`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''')
+
+
+def _applied_versions(cur):
+    cur.execute('select version from schema_version')
+
+    return set([row['version'] for row in cur.fetchall()])
+
+
+def _index_exists(cur, table_name, index_name):
+    cur.execute('select count(*) as c from information_schema.statistics where table_schema=database() and table_name=%s and index_name=%s',
+                (table_name, index_name))
+
+    return cur.fetchone()['c'] > 0
+
+
+def _column_exists(cur, table_name, column_name):
+    cur.execute('select count(*) as c from information_schema.columns where table_schema=database() and table_name=%s and column_name=%s',
+                (table_name, column_name))
+
+    return cur.fetchone()['c'] > 0
+
+
+def _is_applied(cur, stmt):
+    '''ALTER TABLE语句增加的字段及索引是否都已存在（ALTER TABLE为原子操作，都存在说明语句已执行）
+    '''
+    m = _ALTER_TABLE.match(stmt)
+    if not m or _DROP.search(stmt):
+        return False
+    columns = _ADD_COLUMN.findall(stmt)
+    indexes = _ADD_INDEX.findall(stmt)
+    if not columns and not indexes:
+        return False
+
+    return all([_column_exists(cur, m.group(1), c) for c in columns]) and \
+        all([_index_exists(cur, m.group(1), i) for i in indexes])
+
+
+def status():
+    '''升级脚本的执行状态
+    返回值：[(version, name, 是否已执行),...]
+    '''
+    con, cur = dbutils.get_connect_cursor()
+    try:
+        _create_version_table(cur)
+        applied = _applied_versions(cur)
+    finally:
+        dbutils.close_cursor_connect(cur, con)
+
+    return [(version, name, version in applied) for version, name, _ in load_migrations()]
+
+
+def upgrade():
+    '''按顺序执行未执行的升级脚本，某个版本执行失败时停止
+    返回值：本次执行的版本列表
+    '''
+    applied_now = []
+    con, cur = dbutils.get_connect_cursor()
+    try:
+        cur.execute('select get_lock(%s,%s) as l', (LOCK_NAME, LOCK_TIMEOUT))
+        if not cur.fetchone()['l']:
+            logger.error('get schema migration lock fail')
+            return applied_now
+        try:
+            _create_version_table(cur)
+            con.commit()
+            applied = _applied_versions(cur)
+            for version, name, path in load_migrations():
+                if version in applied:
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    statements = split_statements(f.read())
+                for stmt in statements:
+                    if _is_applied(cur, stmt):
+                        logger.info('schema migration {}: {} applied, skip'.format(version, ' '.join(stmt.split())[:100]))
+                        continue
+                    cur.execute(stmt)
+                cur.execute('insert into schema_version(version,name,applied_datetime) values(%s,%s,now())',
+                            (version, name))
+                con.commit()
+                applied_now.append(version)
+                logger.info('schema migration {}_{} applied'.format(version, name))
+        finally:
+            cur.execute('select release_lock(%s)', (LOCK_NAME,))
+    except Exception as e:
+        con.rollback()
+        logger.error(traceback.format_exc())
+        logger.error('schema migration fail')
+    finally:
+        dbutils.close_cursor_connect(cur, con)
+
+    return applied_now
+
+
+def check_indexes():
+    '''使用EXPLAIN检查常用的查询（由各DAO的查询方法生成）是否可以使用索引
+    返回值：[(查询名称, 期望的索引, 可用的索引, 实际使用的索引, 是否通过),...]
+    注意：数据量很少时MySQL可能选择全表扫描，因此以possible_keys判断是否通过
+    '''
+    checks = (
+        ('task.task_id', 'index_task_task_id', lambda: Task().gets({'task_id': '0'})),
+        ('task.state', 'index_task_state', lambda: Task().count({'state': 'STARTED'})),
+        ('task.date_delta', 'index_task_update_datetime', lambda: Task().count_by_search(date_delta=1)),
+        ('vulnerability.hash', 'index_vulnerability_hash', lambda: Vulnerability().gets({'hash': '0'})),
+        ('vulnerability.target', 'index_vulnerability_target', lambda: Vulnerability().gets_in('target', ['0'])),
+        ('vulnerability.date_delta', 'index_vulnerability_update_datetime',
+         lambda: Vulnerability().count_by_search(date_delta=1)),
+        ('domain_attr.A', 'index_domain_attr_tag_content',
+         lambda: DomainAttr().gets_in('content', ['0'], query={'tag': 'A'})),
+        ('ip.date_delta', 'index_ip_update_datetime', lambda: Ip().count_by_search(date_delta=1)),
+        ('ip.network', 'index_ip_ip_bin', lambda: Ip().count_by_search(ip='192.168.0.0/16')),
+        ('ip.ipv6_network', 'index_ip_ip_bin', lambda: Ip().count_by_search(ip='2001:db8::/32')),
+        ('ip.networks', 'index_ip_ip_bin',
+         lambda: Ip().count_by_search(ip=','.join(['10.{}.{}.0/25'.format(i >> 8, i & 255) for i in range(500)]))),
+        ('ip.domain', 'index_domain_attr_tag_content', lambda: Ip().count_by_search(domain='0')),
+        ('ip.content', 'ft_port_attr_content', lambda: Ip().count_by_search(content='nginx')),
+        ('ip.memo_content', 'ft_ip_memo_content', lambda: Ip().count_by_search(memo_content='nginx')),
+        ('domain.date_delta', 'index_domain_update_datetime', lambda: Domain().count_by_search(date_delta=1)),
+        ('domain.ip', 'index_domain_attr_tag_content', lambda: Domain().count_by_search(ip='0')),
+        ('domain.memo_content', 'ft_domain_memo_content', lambda: Domain().count_by_search(memo_content='nginx')),
+    )
+    results = []
+    searchcache.clear()
+    # explain模式下的查询返回None，全文索引的字段需在explain之前读取，否则内容搜索回退为like查询
+    textsearch.fulltext_columns()
+    for name, index_name, query in checks:
+        with dbutils.explain() as plans:
+            query()
+        possible_keys = set()
+        keys = set()
+        for _, rows in plans:
+            for row in rows:
+                if row.get('possible_keys'):
+                    possible_keys.update(row['possible_keys'].split(','))
+                if row.get('key'):
+                    keys.update(row['key'].split(','))
+        results.append((name, index_name, sorted(possible_keys), sorted(keys), index_name in possible_keys))
+
+    return results
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'upgrade':
+        print('applied: {}'.format(upgrade()))
+    elif command == 'check':
+        for name, index_name, possible_keys, keys, passed in check_indexes():
+            print('{:<6} {:<28} expect:{:<36} possible:{} key:{}'.format(
+                'OK' if passed else 'FAIL', name, index_name, ','.join(possible_keys), ','.join(keys)))
+    else:
+        for version, name, applied in status():
+            print('{:04d}_{:<20} {}'.format(version, name, 'applied' if applied else 'pending'))
@@ -0,0 +1,19 @@
+/*
+ 已有数据库的升级：port_attr、ip_memo、domain_memo的content字段建立ngram全文索引（支持中文）
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+ 注意：ngram_token_size需为默认值2（与nemo/core/database/textsearch.py一致）；
+      数据量较大时建立索引需要较长的时间
+*/
+
+SET NAMES utf8mb4;
+-- ngram全文索引不使用停用词
+SET SESSION innodb_ft_enable_stopword = 0;
+
+ALTER TABLE `port_attr` ADD FULLTEXT INDEX `ft_port_attr_content` (`content`) WITH PARSER ngram;
+ALTER TABLE `ip_memo` ADD FULLTEXT INDEX `ft_ip_memo_content` (`content`) WITH PARSER ngram;
+ALTER TABLE `domain_memo` ADD FULLTEXT INDEX `ft_domain_memo_content` (`content`) WITH PARSER ngram;
@@ -0,0 +1,55 @@
+/*
+ 已有数据库的升级：增加资产的聚合信息表ip_summary、domain_summary
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+ 建表后执行 python3 -m nemo.common.utils.assertinfoparser 计算已有资产的聚合信息
+ （未计算的资产在首次查看时计算）
+*/
+
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for domain_summary
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `domain_summary` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `r_id` int(10) unsigned NOT NULL,
+  `ip` text,
+  `port` text,
+  `title` text,
+  `banner` text,
+  `vulnerability` text,
+  `vulnerability_count` int(10) unsigned NOT NULL DEFAULT '0',
+  `create_datetime` datetime NOT NULL,
+  `update_datetime` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_domain_summary_rid` (`r_id`),
+  CONSTRAINT `fk_domain_summary_rid` FOREIGN KEY (`r_id`) REFERENCES `domain` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ----------------------------
+-- Table structure for ip_summary
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `ip_summary` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `r_id` int(10) unsigned NOT NULL,
+  `port` text,
+  `port_status` text,
+  `title` text,
+  `banner` text,
+  `domain` text,
+  `vulnerability` text,
+  `vulnerability_count` int(10) unsigned NOT NULL DEFAULT '0',
+  `create_datetime` datetime NOT NULL,
+  `update_datetime` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_ip_summary_rid` (`r_id`),
+  CONSTRAINT `fk_ip_summary_rid` FOREIGN KEY (`r_id`) REFERENCES `ip` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+SET FOREIGN_KEY_CHECKS = 1;
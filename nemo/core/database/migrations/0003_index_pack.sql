@@ -0,0 +1,25 @@
+/*
+ 已有数据库的升级：常用查询条件的索引
+ - task.task_id：每次更新任务状态时查询
+ - task.state：dashboard统计运行中的任务
+ - vulnerability.hash、vulnerability.target：保存漏洞及每个IP、域名查询关联的漏洞
+ - domain_attr(tag,content)：域名与IP的关联（A记录）
+ - ip、domain、task、vulnerability的update_datetime：按时间范围（date_delta）查询
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+ 注意：使用在线DDL（ALGORITHM=INPLACE, LOCK=NONE），建立索引期间不阻塞读写；已存在的索引会跳过
+*/
+
+ALTER TABLE `task` ADD INDEX `index_task_task_id` (`task_id`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `task` ADD INDEX `index_task_state` (`state`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `task` ADD INDEX `index_task_update_datetime` (`update_datetime`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `vulnerability` ADD INDEX `index_vulnerability_hash` (`hash`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `vulnerability` ADD INDEX `index_vulnerability_target` (`target`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `vulnerability` ADD INDEX `index_vulnerability_update_datetime` (`update_datetime`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `domain_attr` ADD INDEX `index_domain_attr_tag_content` (`tag`,`content`(255)), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `ip` ADD INDEX `index_ip_update_datetime` (`update_datetime`), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE `domain` ADD INDEX `index_domain_update_datetime` (`update_datetime`), ALGORITHM=INPLACE, LOCK=NONE;
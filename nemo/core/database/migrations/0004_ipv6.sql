@@ -0,0 +1,18 @@
+/*
+ 已有数据库的升级：IPv6资产
+ - ip.ip_bin：IPv4与IPv6统一的128位地址（16字节，大端；IPv4保存为IPv4映射地址::ffff:a.b.c.d），唯一索引
+   用于排序、键集分页及网段（IP/掩码）的范围查询（ip_bin between start and end），网段不展开为IP列表
+ - ip.ip_int：只有IPv4地址有值，IPv6地址为NULL
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+ 注意：增加字段及回填ip_bin会重建ip表，数据量较大时需要一定的时间
+*/
+
+ALTER TABLE `ip` MODIFY `ip_int` bigint(11) DEFAULT NULL, ADD COLUMN `ip_bin` binary(16) DEFAULT NULL AFTER `ip_int`;
+UPDATE `ip` SET `ip_bin` = UNHEX(CONCAT('00000000000000000000FFFF', LPAD(HEX(`ip_int`), 8, '0'))) WHERE `ip_bin` IS NULL;
+ALTER TABLE `ip` MODIFY `ip_bin` binary(16) NOT NULL;
+ALTER TABLE `ip` ADD UNIQUE INDEX `index_ip_ip_bin` (`ip_bin`), ALGORITHM=INPLACE, LOCK=NONE;
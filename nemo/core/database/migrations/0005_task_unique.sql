@@ -0,0 +1,14 @@
+/*
+ 已有数据库的升级：task.task_id改为唯一索引
+ 任务状态由taskrecorder接收celery的任务事件后，以task_id批量upsert（INSERT ... ON DUPLICATE KEY UPDATE）
+ 升级前删除重复的任务记录（保留id最大的一条）
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+*/
+
+DELETE t1 FROM `task` t1 JOIN `task` t2 ON t1.`task_id` = t2.`task_id` AND t1.`id` < t2.`id`;
+ALTER TABLE `task` DROP INDEX `index_task_task_id`, ADD UNIQUE INDEX `index_task_task_id` (`task_id`);
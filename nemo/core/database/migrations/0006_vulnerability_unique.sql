@@ -0,0 +1,14 @@
+/*
+ 已有数据库的升级：vulnerability.hash改为唯一索引
+ 保存漏洞时以hash upsert（INSERT ... ON DUPLICATE KEY UPDATE），多个worker并发保存同一漏洞时不会重复
+ 升级前删除重复的漏洞记录（保留id最大的一条）
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+*/
+
+DELETE v1 FROM `vulnerability` v1 JOIN `vulnerability` v2 ON v1.`hash` = v2.`hash` AND v1.`id` < v2.`id`;
+ALTER TABLE `vulnerability` DROP INDEX `index_vulnerability_hash`, ADD UNIQUE INDEX `index_vulnerability_hash` (`hash`);
@@ -0,0 +1,23 @@
+/*
+ 已有数据库的升级：增加查询缓存的版本号表cache_generation
+ 各进程（web、celery worker、taskrecorder）写入数据后增加表的版本号，web在每个请求开始时读取，使其它进程的写入及时失效web的查询缓存
+
+ Target Server Type    : MySQL
+ Target Server Version : 50732
+ File Encoding         : 65001
+
+ 使用方法：python3 -m nemo.core.database.migrate upgrade
+*/
+
+SET NAMES utf8mb4;
+
+-- ----------------------------
+-- Table structure for cache_generation
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `cache_generation` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `table_name` varchar(64) NOT NULL,
+  `generation` bigint(20) unsigned NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_cache_generation_table_name` (`table_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -14,17 +14,8 @@ class Port(daobase.DAOBase):
         新增或更新一条数据
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.gets({'ip_id': data['ip_id'], 'port': data['port']})
-        # 如果该obj已存在，则更新记录
-        if obj and len(obj) > 0:
-            data_update = {}
-            self.copy_exist(data_update, data, 'status')
-            self.update(obj[0]['id'], data_update)
-            return obj[0]['id']
-        # 如果obj不存在，则生成新记录
-        else:
-            data_new = {'ip_id': data['ip_id'], 'port': data['port']}
-            self.copy_key(data_new, data, 'status', 'N/A')
+        # 以(ip_id,port)的唯一索引upsert，已存在时只更新data中有的字段
+        data_new = {'ip_id': data['ip_id'], 'port': data['port']}
+        self.copy_key(data_new, data, 'status', 'N/A')
 
-            return self.add(data_new)
+        return self.upsert(data_new, ('ip_id', 'port'), [k for k in ('status',) if k in data])
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+资产查询的结果及记录数缓存
+1. 缓存的key为：表名 + 查询方法 + 规范化的查询条件（及分页参数）
+2. 每个表有一个写入的版本号（generation），DAO的写操作会增加该表的版本号；
+   缓存记录保存了查询所依赖的各个表的版本号，版本号不一致时缓存失效
+3. 缓存有过期时间（TTL）及最大记录数，超过最大记录数时淘汰最久未使用的记录（LRU）
+4. 版本号分为进程内及共享（cache_generation表）两部分：写操作立即增加进程内的版本号，提交后增加共享的版本号；
+   web在每个请求开始时读取共享的版本号（refresh），其它进程（如celery worker、taskrecorder）的写入使web的缓存失效；
+   不调用refresh的进程只能看到本进程的写入，其它进程写入的数据最多在TTL后可见
+"""
+import copy
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from . import dbutils
+
+# 缓存的过期时间（秒）
+ttl = 30
+# 缓存的最大记录数
+maxsize = 1000
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_generation = {}
+# 共享的版本号：最近一次refresh时从cache_generation表读取
+_shared_generation = {}
+
+
+def bump(table_name):
+    '''表的数据有变更（写操作）：增加表的版本号，依赖该表的缓存失效
+    '''
+    with _lock:
+        _generation[table_name] = _generation.get(table_name, 0) + 1
+    # 提交后增加共享的版本号（工作单元内同一表只增加一次）
+    dbutils.on_commit(('searchcache', table_name), lambda: _bump_shared(table_name))
+
+
+def _bump_shared(table_name):
+    dbutils.execute(
+        'insert into cache_generation(table_name,generation) values(%s,1) on duplicate key update generation=generation+1',
+        (table_name,))
+
+
+def refresh():
+    '''读取共享的版本号（web在每个请求开始时调用），其它进程写入的表的缓存失效
+    '''
+    with dbutils.read_primary():
+        rows = dbutils.queryall('select table_name,generation from cache_generation')
+    if rows is None:
+        return
+    with _lock:
+        _shared_generation.clear()
+        _shared_generation.update([(row['table_name'], row['generation']) for row in rows])
+
+
+def clear():
+    '''清空缓存
+    '''
+    with _lock:
+        _cache.clear()
+
+
+def _generations(tables):
+    return tuple([(_shared_generation.get(t, 0), _generation.get(t, 0)) for t in tables])
+
+
+def _normalize(value):
+    '''规范化查询条件：空字符串视为None，字符串去除首尾空白，列表转换为tuple
+    '''
+    if isinstance(value, str):
+        value = value.strip()
+        return value if value else None
+    if isinstance(value, (list, tuple)):
+        return tuple([_normalize(v) for v in value])
+
+    return value
+
+
+def get_or_load(key, tables, loader, expire=None):
+    '''从缓存中获取，不存在或已失效时调用loader查询并缓存（loader返回None时不缓存）
+    key:    缓存的key，tuple
+    tables: 查询所依赖的表
+    expire: 缓存的过期时间（秒），默认为ttl
+    '''
+    now = time.time()
+    with _lock:
+        generations = _generations(tables)
+        item = _cache.get(key)
+        if item:
+            expire_time, item_generations, value = item
+            if expire_time > now and item_generations == generations:
+                _cache.move_to_end(key)
+                return copy.deepcopy(value)
+            del _cache[key]
+    value = loader()
+    if value is None:
+        return value
+    with _lock:
+        # 查询期间有写操作时，不缓存查询的结果
+        if _generations(tables) == generations:
+            _cache[key] = (now + (expire if expire else ttl), generations, copy.deepcopy(value))
+            _cache.move_to_end(key)
+            while len(_cache) > maxsize:
+                _cache.popitem(last=False)
+
+    return value
+
+
+def cached(func):
+    '''DAO查询方法的缓存装饰器：依赖的表由DAO的search_tables指定（默认为DAO的表），过期时间由DAO的search_cache_ttl指定
+    '''
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (self.table_name, func.__name__) + tuple(
+            [(k, _normalize(v)) for k, v in bound.arguments.items() if k != 'self'])
+        tables = self.search_tables if self.search_tables else (self.table_name,)
+
+        return get_or_load(key, tables, lambda: func(self, *args, **kwargs), self.search_cache_ttl)
+
+    return wrapper
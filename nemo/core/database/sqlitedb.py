@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+dbutils的SQLite后端：不需要MySQL服务器，用于本地的性能测试及调试
+1. SqlitePool与DBUtils的PooledDB接口一致（connection()），连接及游标与pymysql的DictCursor接口一致，DAO的代码不需要修改
+2. 执行时转换MySQL的语法：%s占位符、INSERT ... ON DUPLICATE KEY UPDATE、多字段的IN列表；注册now()、substring_index()函数
+3. 数据库中没有表时，由nemo.sql转换后建表（去除存储引擎、字符集、全文索引等，KEY转换为CREATE INDEX）
+4. 文件数据库每次获取新的连接（WAL模式）；内存数据库(':memory:')所有连接共用一个，语句的执行串行化
+注意：与MySQL的差异（如字符串比较区分大小写、没有全文索引及查询超时）不影响功能，但性能数据只用于相对的比较
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+# 建表的sql文件
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'nemo.sql')
+
+sqlite3.register_adapter(datetime, lambda d: d.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_converter('datetime', lambda v: datetime.fromisoformat(v.decode()))
+
+
+@lru_cache(maxsize=1024)
+def translate(sql, has_param=True):
+    '''MySQL的语句转换为SQLite的语法
+    has_param: 是否有参数（与pymysql一致，有参数时%%转义为%）
+    '''
+    if has_param:
+        sql = sql.replace('%s', '?').replace('%%', '%')
+    sql = re.sub(r'^\s*insert\s+ignore\b', 'insert or ignore', sql, flags=re.I)
+    m = re.search(r'\bon\s+duplicate\s+key\s+update\b', sql, flags=re.I)
+    if m:
+        update = re.sub(r'\bvalues\((\w+)\)', r'excluded.\1', sql[m.end():], flags=re.I)
+        sql = sql[:m.start()] + 'on conflict do update set' + update
+    # 多字段的IN列表：(a,b) in ((?,?),...) 转换为 (a,b) in (values (?,?),...)
+    sql = re.sub(r'\bin\s*\(\s*\(\s*\?', 'in (values (?', sql, flags=re.I)
+
+    return sql
+
+
+def translate_schema(script):
+    '''nemo.sql（MySQL的建表语句）转换为SQLite的建表及建索引语句列表
+    '''
+    from .migrate import split_statements
+
+    statements = []
+    index_names = set()
+    for stmt in split_statements(script):
+        m = re.match(r'^create\s+table\s+(?:if\s+not\s+exists\s+)?`?(\w+)`?\s*\(', stmt, flags=re.I)
+        if not m:
+            if re.match(r'^(drop|insert)\b', stmt, flags=re.I):
+                statements.append(stmt)
+            continue
+        table_name = m.group(1)
+        columns = []
+        indexes = []
+        for line in stmt[m.end():stmt.rindex(')')].split('\n'):
+            line = line.strip().rstrip(',')
+            if not line:
+                continue
+            if re.match(r'^fulltext\s+key\b', line, flags=re.I):
+                continue
+            key = re.match(r'^(unique\s+)?key\s+`?(\w+)`?\s*\((.*?)\)\s*(using\s+\w+)?$', line, flags=re.I)
+            if key:
+                index_name = key.group(2)
+                if index_name in index_names:
+                    index_name = '{}_{}'.format(table_name, index_name)
+                index_names.add(index_name)
+                # 去除前缀索引的长度，如`content`(255)
+                index_columns = re.sub(r'\(\d+\)', '', key.group(3))
+                indexes.append('CREATE {}INDEX `{}` ON `{}` ({})'.format(
+                    'UNIQUE ' if key.group(1) else '', index_name, table_name, index_columns))
+                continue
+            if re.match(r'^primary\s+key\b', line, flags=re.I):
+                continue
+            if re.search(r'\bauto_increment\b', line, flags=re.I):
+                columns.append('{} INTEGER PRIMARY KEY'.format(line.split()[0]))
+                continue
+            line = re.sub(r"\s+comment\s+'(?:[^'\\]|\\.)*'", '', line, flags=re.I)
+            line = re.sub(r'\s+(unsigned|on\s+update\s+current_timestamp|character\s+set\s+\w+|collate\s+\w+)\b', '', line,
+                          flags=re.I)
+            columns.append(line)
+        statements.append('CREATE TABLE `{}` (\n  {}\n)'.format(table_name, ',\n  '.join(columns)))
+        statements.extend(indexes)
+
+    return statements
+
+
+def _substring_index(value, delim, count):
+    '''MySQL的substring_index()
+    '''
+    if value is None:
+        return None
+    parts = value.split(delim)
+    return delim.join(parts[:count] if count > 0 else parts[count:])
+
+
+class SqliteCursor():
+    '''与pymysql的DictCursor接口一致的游标
+    '''
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.con.cursor()
+
+    def execute(self, sql, param=None):
+        if param is not None and not isinstance(param, (list, tuple, dict)):
+            param = (param,)
+        with self.conn.lock:
+            self.cursor.execute(translate(sql, param is not None), param if param is not None else ())
+        return max(self.cursor.rowcount, 0)
+
+    def executemany(self, sql, arrays):
+        with self.conn.lock:
+            self.cursor.executemany(translate(sql), arrays)
+        return max(self.cursor.rowcount, 0)
+
+    def __rows(self, rows):
+        names = [c[0] for c in self.cursor.description]
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchone(self):
+        with self.conn.lock:
+            row = self.cursor.fetchone()
+        return self.__rows([row])[0] if row else None
+
+    def fetchmany(self, size):
+        with self.conn.lock:
+            return self.__rows(self.cursor.fetchmany(size))
+
+    def fetchall(self):
+        with self.conn.lock:
+            return self.__rows(self.cursor.fetchall())
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+
+class SqliteConnection():
+    '''与pymysql的连接接口一致的连接
+    '''
+
+    def __init__(self, con, lock, shared=False):
+        self.con = con
+        self.lock = lock
+        # 共用的连接（内存数据库）不关闭
+        self.shared = shared
+
+    def cursor(self, *args):
+        # 不区分游标的类型（如SSDictCursor），SQLite的游标本身逐条读取
+        return SqliteCursor(self)
+
+    def commit(self):
+        with self.lock:
+            self.con.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.con.rollback()
+
+    def close(self):
+        if not self.shared:
+            self.con.close()
+
+
+class SqlitePool():
+    '''SQLite的"连接池"
+    path: 数据库文件，':memory:'为内存数据库
+    '''
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.shared = None
+        if path == ':memory:':
+            self.shared = SqliteConnection(self.__connect(), self.lock, shared=True)
+        con = self.connection()
+        try:
+            cur = con.cursor()
+            cur.execute("select count(*) as c from sqlite_master where type='table'")
+            if cur.fetchone()['c'] == 0:
+                with open(SCHEMA_FILE, encoding='utf-8') as f:
+                    for stmt in translate_schema(f.read()):
+                        cur.execute(stmt)
+                con.commit()
+            cur.close()
+        finally:
+            con.close()
+
+    def __connect(self):
+        con = sqlite3.connect(self.path, timeout=30, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        con.create_function('now', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        con.create_function('substring_index', 3, _substring_index)
+        con.execute('pragma foreign_keys=on')
+        if self.path != ':memory:':
+            con.execute('pragma journal_mode=wal')
+        return con
+
+    def connection(self):
+        if self.shared:
+            return self.shared
+        return SqliteConnection(self.__connect(), threading.RLock())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+数据库语句的性能统计
+1. dbutils执行每条语句时记录：按语句的指纹（去除参数值、规范化空白及IN列表后的sql）汇总执行次数、出错次数、
+   耗时的直方图、合计及最大耗时、返回或影响的行数
+2. 从连接池获取连接的等待时间单独统计（checkout）
+3. 耗时超过slow_threshold的语句写入慢查询日志(instance/nemo.slow.log)
+4. 统计数据在进程内有效：snapshot()读取进程的汇总数据（web的/metrics）；
+   collect()统计块内执行的语句，用于celery任务结果中的数据库统计
+"""
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from nemo.common.utils.loggerutils import slow_logger
+
+# 慢查询的阈值（秒）
+slow_threshold = 1.0
+# 最多统计的语句指纹数量，超过后统计到'other'
+max_statements = 500
+# 耗时直方图的区间上限（秒），最后一个区间为+Inf
+buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+_lock = threading.Lock()
+# 当前上下文中collect()的统计对象
+_collectors = contextvars.ContextVar('sqlmetrics_collectors', default=())
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    '''语句的指纹：参数值（字符串、数字、%s占位符）替换为?，IN列表及批量的VALUES合并，空白规范化并转为小写
+    '''
+    fp = re.sub(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"", '?', sql)
+    fp = re.sub(r'%s|\b\d+(?:\.\d+)?\b', '?', fp)
+    fp = re.sub(r'\s+', ' ', fp).strip().lower()
+    fp = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?+)', fp)
+    fp = re.sub(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+', '(?+)...', fp)
+
+    return fp
+
+
+class Stats():
+    '''一类语句（或连接池获取连接）的统计
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def add(self, elapsed, rows=0, error=False):
+        self.count += 1
+        self.rows += rows if rows and rows > 0 else 0
+        if error:
+            self.errors += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        for i, b in enumerate(buckets):
+            if elapsed <= b:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def to_dict(self, histogram=True):
+        data = {'count': self.count, 'errors': self.errors, 'rows': self.rows,
+                'total_time': round(self.total_time, 6), 'max_time': round(self.max_time, 6),
+                'avg_time': round(self.total_time / self.count, 6) if self.count else 0}
+        if histogram:
+            data['histogram'] = dict(zip([str(b) for b in buckets] + ['+Inf'], self.histogram))
+
+        return data
+
+
+class Metrics():
+    '''语句统计的集合：以语句指纹为key
+    '''
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.statements = {}
+        self.checkout = Stats()
+
+    def record(self, fp, elapsed, rows, error):
+        stats = self.statements.get(fp)
+        if stats is None:
+            if len(self.statements) >= max_statements:
+                fp = 'other'
+                stats = self.statements.get(fp)
+            if stats is None:
+                stats = self.statements[fp] = Stats()
+        stats.add(elapsed, rows, error)
+
+    def to_dict(self, top=None, histogram=True):
+        '''统计数据，语句按合计耗时倒序
+        top: 只返回合计耗时最多的top条语句
+        '''
+        statements = sorted(self.statements.items(), key=lambda x: x[1].total_time, reverse=True)
+        if top:
+            statements = statements[:top]
+
+        return {'uptime': round(time.time() - self.start_time, 3),
+                'count': sum([s.count for s in self.statements.values()]),
+                'errors': sum([s.errors for s in self.statements.values()]),
+                'rows': sum([s.rows for s in self.statements.values()]),
+                'total_time': round(sum([s.total_time for s in self.statements.values()]), 6),
+                'checkout': self.checkout.to_dict(histogram),
+                'statements': [dict(sql=fp, **s.to_dict(histogram)) for fp, s in statements]}
+
+
+_metrics = Metrics()
+
+
+class measure():
+    '''统计一条语句的执行：with measure(sql, param) as m: ... m.rows = 影响的行数
+    块内有异常时记录为出错
+    '''
+
+    def __init__(self, sql, param=None):
+        self.sql = sql
+        self.param = param
+        self.rows = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        record(self.sql, time.perf_counter() - self.start, self.rows, self.param, exc_type is not None)
+
+
+def record(sql, elapsed, rows=0, param=None, error=False):
+    '''记录一条语句的执行
+    sql:     sql语句
+    elapsed: 耗时（秒）
+    rows:    返回或影响的行数
+    '''
+    fp = fingerprint(sql)
+    with _lock:
+        _metrics.record(fp, elapsed, rows, error)
+        for m in _collectors.get():
+            m.record(fp, elapsed, rows, error)
+    if elapsed >= slow_threshold:
+        slow_logger.warning('{:.3f}s rows:{} [sql]:{} [param]:{}'.format(
+            elapsed, rows, re.sub(r'\s+', ' ', sql).strip(), str(param)[:500]))
+
+
+def record_checkout(elapsed):
+    '''记录一次从连接池获取连接的等待时间
+    '''
+    with _lock:
+        _metrics.checkout.add(elapsed)
+        for m in _collectors.get():
+            m.checkout.add(elapsed)
+
+
+@contextmanager
+def collect():
+    '''统计块内（当前上下文）执行的语句
+    用法：with collect() as m: ...  m.to_dict()
+    '''
+    m = Metrics()
+    token = _collectors.set(_collectors.get() + (m,))
+    try:
+        yield m
+    finally:
+        _collectors.reset(token)
+
+
+def snapshot(top=None, histogram=True):
+    '''进程内的汇总统计数据
+    '''
+    with _lock:
+        return _metrics.to_dict(top, histogram)
+
+
+def reset():
+    '''清空进程内的汇总统计数据
+    '''
+    global _metrics
+    with _lock:
+        _metrics = Metrics()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+并发写入的压力测试：模拟多个worker同时保存有交集的扫描结果，检查是否有重复记录、写入失败及死锁
+1. 每个worker（线程）多轮随机选取同一组IP、域名中的一部分，通过IngestWriter批量写入（包括聚合信息的计算），
+   并通过各DAO的save_and_update逐条保存IP、端口、漏洞、颜色标记及备忘录
+2. 结束后检查各表的唯一字段没有重复、所有的写入都返回了记录id，并输出语句的错误数（包括重试的死锁）
+3. 须指定数据库：mysql为配置的MySQL数据库，否则为SQLite数据库文件（语句串行执行，只验证功能）
+4. 测试数据（172.31.x.x的IP、stressN.example.com的域名）在开始前不能存在，结束后删除
+   （端口、属性、颜色标记、备忘录及聚合信息由外键级联删除）
+用法：python3 -m nemo.core.database.stresstest worker数量 mysql|sqlite数据库文件
+"""
+import random
+import sys
+import threading
+import time
+import traceback
+
+from . import dbutils
+from . import searchcache
+from . import sqlmetrics
+from nemo.common.utils.loggerutils import logger
+
+# 检查重复记录的表及唯一字段
+UNIQUE_COLUMNS = (('ip', 'ip'), ('domain', 'domain'), ('port', 'ip_id,port'), ('port_attr', 'hash'),
+                  ('domain_attr', 'hash'), ('vulnerability', 'hash'), ('ip_color_tag', 'r_id'), ('ip_memo', 'r_id'),
+                  ('ip_summary', 'r_id'), ('domain_summary', 'r_id'))
+
+
+def worker(index, rounds, ips, domains, result, lock):
+    '''一个worker：多轮写入有交集的扫描结果
+    lock: 更新统计结果（result）的锁
+    '''
+    from nemo.core.database.colortag import IpColorTag
+    from nemo.core.database.ip import Ip
+    from nemo.core.database.memo import IpMemo
+    from nemo.core.database.port import Port
+    from nemo.core.database.vulnerability import Vulnerability
+    from nemo.core.tasks.ingest import IngestWriter
+
+    rnd = random.Random(index)
+    for n in range(rounds):
+        try:
+            sample_ips = rnd.sample(ips, len(ips) // 4)
+            writer = IngestWriter('stress-{}'.format(index % 4), ('title',), chunk_size=50)
+            writer.add_ips([{'ip': ip, 'status': 'alive',
+                             'port': [{'port': port, 'title': 'title-{}'.format(port)} for port in (80, 443, 8080)]}
+                            for ip in sample_ips])
+            writer.add_domains([{'domain': domain, 'A': [rnd.choice(ips)], 'title': ['title']}
+                                for domain in rnd.sample(domains, len(domains) // 4)])
+            writer.flush()
+            # 逐条保存
+            ip = rnd.choice(ips)
+            ip_id = Ip().save_and_update({'ip': ip, 'location': 'location-{}'.format(n)})
+            ids = [ip_id,
+                   Port().save_and_update({'ip_id': ip_id, 'port': 22, 'status': 'open'}),
+                   Vulnerability().save_and_update({'target': ip, 'url': 'http://{}/'.format(ip), 'poc_file': 'stress.py',
+                                                    'source': 'stress', 'extra': str(n)}),
+                   IpColorTag().save_and_update({'r_id': ip_id, 'color': 'red'}),
+                   IpMemo().save_and_update({'r_id': ip_id, 'content': 'memo {} {}'.format(index, n)})]
+            with lock:
+                result['writes'] += len(ids)
+                result['failed'] += len([Id for Id in ids if not Id])
+        except Exception:
+            logger.error(traceback.format_exc())
+            with lock:
+                result['exceptions'] += 1
+
+
+def check_duplicates():
+    '''各表唯一字段的重复记录数
+    '''
+    duplicates = {}
+    for table, columns in UNIQUE_COLUMNS:
+        sql = 'select count(*) from (select {0} from {1} group by {0} having count(*) > 1) t'.format(columns, table)
+        duplicates[table] = dbutils.queryone(sql)
+
+    return duplicates
+
+
+def _count_existing(ips, domains):
+    '''测试数据中已存在的IP及域名数量
+    '''
+    count = 0
+    for table, column, values in (('ip', 'ip', ips), ('domain', 'domain', domains)):
+        for rows in dbutils.chunks(values, 500):
+            count += dbutils.queryone('select count(*) from {} where {} in ({})'.format(
+                table, column, ','.join(['%s'] * len(rows))), rows) or 0
+
+    return count
+
+
+def cleanup(ips, domains):
+    '''删除测试数据：IP、域名及以其为目标的漏洞，关联的记录由外键级联删除
+    '''
+    for rows in dbutils.chunks(ips + domains, 500):
+        dbutils.execute('delete from vulnerability where target in ({})'.format(','.join(['%s'] * len(rows))), rows)
+    for table, column, values in (('ip', 'ip', ips), ('domain', 'domain', domains)):
+        for rows in dbutils.chunks(values, 500):
+            dbutils.execute('delete from {} where {} in ({})'.format(table, column, ','.join(['%s'] * len(rows))), rows)
+    for table in ('vulnerability', 'ip', 'domain'):
+        searchcache.bump(table)
+
+
+def run_stress_test(database, workers=32, rounds=10, ips=200, domains=100):
+    '''
+    database: 'mysql'为使用配置的MySQL数据库，否则为SQLite的数据库文件
+    workers:  并发的worker（线程）数量
+    rounds:   每个worker的写入轮数
+    ips:      IP的数量（每轮写入其中的1/4，各worker之间有交集）
+    domains:  域名的数量
+    '''
+    if database != 'mysql':
+        dbutils.configure_backend('sqlite', database)
+    else:
+        dbutils.configure_pool(maxconnections=workers * 2, maxcached=workers * 2, blocking=True)
+    ip_list = ['172.31.{}.{}'.format(i >> 8 & 255, i & 255) for i in range(ips)]
+    domain_list = ['stress{}.example.com'.format(i) for i in range(domains)]
+    existing = _count_existing(ip_list, domain_list)
+    if existing:
+        print('数据库中已有{}条测试数据（172.31.x.x、stressN.example.com），为避免删除已有资产，不执行测试'.format(existing))
+        return False
+    result = {'writes': 0, 'failed': 0, 'exceptions': 0}
+    lock = threading.Lock()
+    sqlmetrics.reset()
+    start_time = time.time()
+    threads = [threading.Thread(target=worker, args=(i, rounds, ip_list, domain_list, result, lock))
+               for i in range(workers)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start_time
+        metrics = sqlmetrics.snapshot(histogram=False)
+        duplicates = check_duplicates()
+    finally:
+        cleanup(ip_list, domain_list)
+    print('{}个worker，每个{}轮: {:.1f}s, {}条语句, 语句错误(包括重试的死锁): {}'.format(
+        workers, rounds, elapsed, metrics['count'], metrics['errors']))
+    print('逐条保存: {}次, 失败: {}, 异常: {}'.format(result['writes'], result['failed'], result['exceptions']))
+    for table, count in duplicates.items():
+        print('{:<16} 重复: {}'.format(table, count))
+    passed = result['failed'] == 0 and result['exceptions'] == 0 and not any(duplicates.values())
+    print('通过' if passed else '未通过')
+
+    return passed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: python3 -m nemo.core.database.stresstest worker数量 mysql|sqlite数据库文件')
+        sys.exit(1)
+    run_stress_test(sys.argv[2], int(sys.argv[1]))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# coding:utf-8
+import json
+
+from . import daobase
+
+
+class Summary(daobase.DAOBase):
+    '''资产（IP、域名）的聚合信息：端口、标题、banner、关联的域名或IP及漏洞等，每个资产一条记录
+    由资产的写入及删除操作更新（AssertInfoParser.refresh_*_summary），列表、详情及导出直接读取，避免每次重新聚合
+    列表类型的字段以json格式保存
+    '''
+
+    def __init__(self):
+        super().__init__()
+        # 以json格式保存的字段，由各子类指定
+        self.json_columns = ()
+
+    def save_many(self, rows):
+        '''批量保存聚合信息（增加或更新）
+        rows: [{'r_id':1,'port':[80,443],...,'vulnerability_count':0},...]，vulnerability只保留分页数量的记录，数量单独统计
+        '''
+        if not rows:
+            return []
+        data_rows = []
+        for row in rows:
+            data = {'r_id': row['r_id'], 'vulnerability_count': row.get('vulnerability_count', 0)}
+            for c in self.json_columns:
+                data[c] = json.dumps(row.get(c, []), ensure_ascii=False)
+            data_rows.append(data)
+
+        return self.upsert_many(data_rows, ('r_id',), [c for c in data_rows[0].keys() if c != 'r_id'])
+
+    def gets_by_rid(self, r_ids):
+        '''批量查询聚合信息
+        返回值：以r_id为key的字典，列表类型的字段已转换
+        '''
+        summary_dict = {}
+        for row in self.gets_in('r_id', list(set(r_ids))):
+            for c in self.json_columns:
+                row[c] = json.loads(row[c]) if row[c] else []
+            summary_dict[row['r_id']] = row
+
+        return summary_dict
+
+
+class IpSummary(Summary):
+    def __init__(self):
+        super().__init__()
+        self.table_name = 'ip_summary'
+        self.json_columns = ('port', 'port_status', 'title', 'banner', 'domain', 'vulnerability')
+
+
+class DomainSummary(Summary):
+    def __init__(self):
+        super().__init__()
+        self.table_name = 'domain_summary'
+        self.json_columns = ('ip', 'port', 'title', 'banner', 'vulnerability')
@@ -5,6 +5,7 @@ from datetime import datetime
 from datetime import timedelta
 
 from . import dbutils
+from . import searchcache
 from . import daobase
 
 from nemo.common.utils.loggerutils import logger
@@ -15,48 +16,28 @@ class Task(daobase.DAOBase):
         super().__init__()
         self.table_name = 'task'
         self.order_by = 'create_datetime desc'
+        # 任务状态由worker进程持续更新，缩短查询缓存的时间
+        self.search_cache_ttl = 3
+        # 已结束的状态（SUCCESS、FAILURE、REVOKED）不被较晚写入的未结束状态覆盖
+        self.upsert_expressions = {
+            'state': "case when state in ('SUCCESS','FAILURE','REVOKED') then state else values(state) end"}
 
     def save_and_update(self, data):
         '''保存数据
         新增或更新一条数据
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.gets({'task_id': data['task_id']})
-        # 如果已存在，则更新记录
-        if obj and len(obj) > 0:
-            data_update = {}
-            self.copy_exist(data_update, data, 'worker')
-            self.copy_exist(data_update, data, 'state')
-            self.copy_exist(data_update, data, 'result')
-            self.copy_exist(data_update, data, 'received')
-            self.copy_exist(data_update, data, 'retried')
-            self.copy_exist(data_update, data, 'revoked')
-            self.copy_exist(data_update, data, 'started')
-            self.copy_exist(data_update, data, 'succeeded')
-            self.copy_exist(data_update, data, 'failed')
-            self.copy_exist(data_update, data, 'progress_message')
+        # 以task_id的唯一索引upsert，已存在时只更新data中有的状态字段（任务名称及参数只在新增时写入）
+        update_columns = ('worker', 'state', 'result', 'received', 'retried', 'revoked', 'started', 'succeeded', 'failed',
+                          'progress_message')
+        data_new = {'task_id': data['task_id']}
+        self.copy_key(data_new, data, 'task_name', '')
+        self.copy_key(data_new, data, 'args')
+        self.copy_key(data_new, data, 'kwargs')
+        for k in update_columns:
+            self.copy_key(data_new, data, k)
 
-            self.update(obj[0]['id'], data_update)
-            return obj[0]['id']
-        # 如果不存在，则生成新记录
-        else:
-            data_new = {'task_id': data['task_id']}
-            self.copy_key(data_new, data, 'task_name')
-            self.copy_key(data_new, data, 'args')
-            self.copy_key(data_new, data, 'kwargs')
-            self.copy_key(data_new, data, 'worker')
-            self.copy_key(data_new, data, 'state')
-            self.copy_key(data_new, data, 'result')
-            self.copy_key(data_new, data, 'received')
-            self.copy_key(data_new, data, 'retried')
-            self.copy_key(data_new, data, 'revoked')
-            self.copy_key(data_new, data, 'started')
-            self.copy_key(data_new, data, 'succeeded')
-            self.copy_key(data_new, data, 'failed')
-            self.copy_key(data_new, data, 'progress_message')
-
-            return self.add(data_new)
+        return self.upsert(data_new, ('task_id',), [k for k in update_columns if k in data])
 
     def __fill_search_where(self, task_name=None, task_args=None, worker=None, state=None, result=None,
                             date_delta=None):
@@ -105,6 +86,7 @@ class Task(daobase.DAOBase):
 
         return sql, param
 
+    @searchcache.cached
     def count_by_search(self, task_name=None, task_args=None, worker=None, state=None, result=None, date_delta=None):
         '''统计记录总条数
         '''
@@ -119,6 +101,7 @@ class Task(daobase.DAOBase):
 
         return dbutils.queryone(''.join(sql), param)
 
+    @searchcache.cached
     def gets_by_search(self, task_name=None, task_args=None, worker=None, state=None, result=None, date_delta=None,
                        fields=None, page=1, rows_per_page=None, order_by=None):
         '''根据组织机构、IP地址（包括范围）及端口的综合查询
@@ -141,3 +124,24 @@ class Task(daobase.DAOBase):
             param, order_by, page, rows_per_page))
 
         return dbutils.queryall(''.join(sql), param)
+
+    def iter_by_search(self, task_name=None, task_args=None, worker=None, state=None, result=None, date_delta=None,
+                       fields=None, order_by=None, fetch_size=1000):
+        '''根据查询条件，使用服务器端游标逐条读取所有的记录（生成器，不分页）
+        fields:     要返回的字段，列表格式('id','name','port')
+        order_by     :  排序字段
+        fetch_size   :  每次从数据库读取的记录数
+        '''
+        sql = []
+        param = []
+        sql.append('select {} from {} '.format(
+            self.fill_fields(fields), self.table_name))
+        # 查询条件
+        where_sql, where_param = self.__fill_search_where(
+            task_name, task_args, worker, state, result, date_delta)
+        sql.extend(where_sql)
+        param.extend(where_param)
+        # 排序
+        sql.append(self.fill_order_by(order_by))
+
+        return dbutils.iterate(''.join(sql), param, fetch_size)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+文本内容的模糊搜索（包含关键字）
+1. port_attr、ip_memo、domain_memo的content字段建立ngram全文索引(migrations/0001_fulltext.sql)，支持中文
+2. 关键字中长度不小于ngram_token_size的词，使用MATCH ... AGAINST(布尔模式的短语)通过全文索引缩小范围，
+   再使用like '%关键字%'精确匹配，结果与原来的like查询一致
+3. 关键字中没有可用的词（如单个汉字、符号），或者表没有建立全文索引时，只使用like查询
+"""
+import re
+import time
+
+from . import dbutils
+
+# 与MySQL的ngram_token_size参数一致
+ngram_token_size = 2
+
+# 已建立全文索引的(表名, 字段名)，首次使用时从数据库中读取
+_fulltext_columns = None
+
+
+def fulltext_columns():
+    '''数据库中已建立全文索引的字段
+    '''
+    global _fulltext_columns
+    # SQLite没有全文索引
+    if dbutils.backend == 'sqlite':
+        return set()
+    if _fulltext_columns is None:
+        sql = 'select table_name as table_name,column_name as column_name from information_schema.statistics where table_schema=database() and index_type="FULLTEXT"'
+        rows = dbutils.queryall(sql)
+        # 查询出错时不缓存，下次重新读取
+        if rows is None:
+            return set()
+        _fulltext_columns = set([(row['table_name'], row['column_name']) for row in rows])
+
+    return _fulltext_columns
+
+
+def match_words(keyword):
+    '''关键字中可用于全文索引查询的词：按非字母数字（包括中文）的字符分词，忽略长度小于ngram_token_size的词
+    '''
+    return [w for w in re.split(r'\W+', keyword) if len(w) >= ngram_token_size]
+
+
+def fill_contains(table_name, column, keyword, param):
+    '''生成字段包含关键字的查询条件
+    table_name: 表名
+    column:     字段名
+    keyword:    关键字
+    param:      sql预编译参数，查询条件的参数会加入
+    '''
+    words = match_words(keyword)
+    if words and (table_name, column) in fulltext_columns():
+        param.append(' '.join(['+"{}"'.format(w) for w in words]))
+        param.append('%' + keyword + '%')
+        return ' match({0}) against(%s in boolean mode) and {0} like %s '.format(column)
+
+    param.append('%' + keyword + '%')
+    return ' {} like %s '.format(column)
+
+
+def run_benchmark(rows=10000000, batch_size=10000, keywords=('nginx', '登录', 'Apache Tomcat', 'a')):
+    '''全文索引与like查询的性能对比：在测试表中生成rows条类似port_attr的记录，分别统计查询的耗时
+    注意：生成1千万条记录需要较长的时间和约数GB的磁盘空间
+    '''
+    titles = ('nginx', 'Apache Tomcat/8.5.32', 'Microsoft-IIS/10.0', '后台管理系统', '用户登录', 'Welcome to CentOS',
+              'Jenkins', 'phpMyAdmin', '404 Not Found', 'OpenSSH_7.4', '欢迎访问', 'Index of /')
+    print("删表:", dbutils.execute('drop table if exists test_port_attr'))
+    sql = '''
+            CREATE TABLE `test_port_attr` (
+              `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+              `r_id` int(10) unsigned NOT NULL,
+              `tag` varchar(40) NOT NULL,
+              `content` varchar(1000) DEFAULT NULL,
+              PRIMARY KEY (`id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='测试用的, 可以直接删除';
+            '''
+    print("建表:", dbutils.execute(sql))
+    start_time = time.time()
+    sql_str = 'insert into test_port_attr(r_id,tag,content) values (%s,%s,%s)'
+    for i in range(0, rows, batch_size):
+        arrays = [(n, 'title', '{} {}'.format(titles[n % len(titles)], n)) for n in range(i, min(i + batch_size, rows))]
+        dbutils.insertmany(sql_str, arrays, batch_size)
+    print('插入{}条记录: {:.1f}s'.format(rows, time.time() - start_time))
+
+    def query(label):
+        for keyword in keywords:
+            param = []
+            where = fill_contains('test_port_attr', 'content', keyword, param)
+            start_time = time.time()
+            count = dbutils.queryone('select count(id) from test_port_attr where {}'.format(where), param)
+            print('{} [{}]: {}条, {:.3f}s'.format(label, keyword, count, time.time() - start_time))
+
+    global _fulltext_columns
+    _fulltext_columns = set()
+    query('like')
+    start_time = time.time()
+    # 关闭停用词后建立索引，需在同一个连接中执行
+    with dbutils.session():
+        dbutils.execute('set session innodb_ft_enable_stopword=0')
+        dbutils.execute(
+            'alter table test_port_attr add fulltext index ft_test_port_attr_content(content) with parser ngram')
+    print('建立全文索引: {:.1f}s'.format(time.time() - start_time))
+    _fulltext_columns = set([('test_port_attr', 'content')])
+    query('fulltext')
+    _fulltext_columns = None
+    print("删表:", dbutils.execute('drop table test_port_attr'))
+
+
+if __name__ == '__main__':
+    run_benchmark()
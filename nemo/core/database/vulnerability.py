@@ -6,6 +6,7 @@ from datetime import datetime
 from datetime import timedelta
 
 from . import dbutils
+from . import searchcache
 from . import daobase
 
 from nemo.common.utils.loggerutils import logger
@@ -15,7 +16,9 @@ class Vulnerability(daobase.DAOBase):
     def __init__(self):
         super().__init__()
         self.table_name = 'vulnerability'
-        self.order_by = 'update_datetime desc'
+        self.order_by = 'update_datetime desc,id desc'
+        self.keyset_columns = ('update_datetime', 'id')
+        self.keyset_desc = True
 
     def attr_hash(self, data):
         '''根据属性值计算hash
@@ -42,23 +45,28 @@ class Vulnerability(daobase.DAOBase):
         新增或更新一条数据
         返回值：id
         '''
-        # 查询obj是否已存在
-        obj = self.gets({'hash': self.attr_hash(data)})
-        # 如果该已存在，则更新记录
-        if obj and len(obj) > 0:
-            data_update = {}
-            # 只更新extra
-            if 'extra' in data and str(data['extra']) != obj[0]['extra']:
-                data_update['extra'] = str(data['extra'])
-            self.update(obj[0]['id'], data_update)
-            return obj[0]['id']
-        # 如果不存在，则生成新记录
-        else:
-            data_new = {'target': data['target'], 'url': data['url'],
-                        'source': data['source'], 'poc_file': data['poc_file'],
-                        'extra': str(data['extra']) if 'extra' in data else ''}
-            return self.add(data_new)
+        # 以hash的唯一索引upsert，已存在时只更新extra
+        data_new = {'target': data['target'], 'url': data['url'],
+                    'source': data['source'], 'poc_file': data['poc_file'],
+                    'extra': str(data['extra']) if 'extra' in data else ''}
+        data_new['hash'] = self.attr_hash(data_new)
+
+        return self.upsert(data_new, ('hash',), [k for k in ('extra',) if k in data])
 
+    def count_by_targets(self, targets):
+        '''统计多个目标（IP或域名）的漏洞数量
+        返回值：以目标（小写）为key的字典，值为漏洞数量
+        '''
+        if not targets:
+            return {}
+        sql = 'select target,count(id) as vul_count from {} where target in ({}) group by target'.format(
+            self.table_name, ','.join(['%s'] * len(targets)))
+        count_dict = {}
+        for row in dbutils.queryall(sql, list(targets)) or []:
+            target = row['target'].lower()
+            count_dict[target] = count_dict.get(target, 0) + row['vul_count']
+
+        return count_dict
 
     def __fill_search_where(self, target=None, poc_file=None, source=None, date_delta=None):
         '''根据指定的字段，生成查询SQL语句和参数
@@ -96,6 +104,7 @@ class Vulnerability(daobase.DAOBase):
 
         return sql, param
 
+    @searchcache.cached
     def count_by_search(self, target=None, poc_file=None, source=None, date_delta=None):
         '''统计记录总条数
         '''
@@ -110,13 +119,15 @@ class Vulnerability(daobase.DAOBase):
 
         return dbutils.queryone(''.join(sql), param)
 
+    @searchcache.cached
     def gets_by_search(self, target=None, poc_file=None, source=None, date_delta=None,
-                       fields=None, page=1, rows_per_page=None, order_by=None):
+                       fields=None, page=1, rows_per_page=None, order_by=None, after=None):
         '''根据组织机构、IP地址（包括范围）及端口的综合查询
         fields:     要返回的字段，列表格式('id','name','port')
         page:       分页位置，从1开始
         rows_per_page:  每页的记录数
         order_by     :  排序字段
+        after        :  键集分页，上一页最后一条记录的排序字段值（keyset_value），指定时忽略page和order_by
         '''
         sql = []
         param = []
@@ -127,8 +138,33 @@ class Vulnerability(daobase.DAOBase):
             target, poc_file, source,  date_delta)
         sql.extend(where_sql)
         param.extend(where_param)
-        # 排序、分页
-        sql.append(self.fill_order_by_and_limit(
-            param, order_by, page, rows_per_page))
+        # 排序、分页：指定after时使用键集分页
+        if after:
+            sql.append(self.fill_keyset_and_limit(
+                param, after, rows_per_page, 'and' if where_sql else 'where'))
+        else:
+            sql.append(self.fill_order_by_and_limit(
+                param, order_by, page, rows_per_page))
 
         return dbutils.queryall(''.join(sql), param)
+
+    def iter_by_search(self, target=None, poc_file=None, source=None, date_delta=None,
+                       fields=None, order_by=None, fetch_size=1000):
+        '''根据查询条件，使用服务器端游标逐条读取所有的记录（生成器，不分页）
+        fields:     要返回的字段，列表格式('id','name','port')
+        order_by     :  排序字段
+        fetch_size   :  每次从数据库读取的记录数
+        '''
+        sql = []
+        param = []
+        sql.append('select {} from {} '.format(
+            self.fill_fields(fields), self.table_name))
+        # 查询条件
+        where_sql, where_param = self.__fill_search_where(
+            target, poc_file, source, date_delta)
+        sql.extend(where_sql)
+        param.extend(where_param)
+        # 排序
+        sql.append(self.fill_order_by(order_by))
+
+        return dbutils.iterate(''.join(sql), param, fetch_size)
@@ -3,7 +3,7 @@
 import traceback
 from multiprocessing.dummy import Pool
 
-from nemo.common.utils.iputils import check_ip_or_domain
+from nemo.common.utils.iputils import check_ip_or_domain, format_host_port
 from nemo.common.utils.loggerutils import logger
 from nemo.core.tasks.taskbase import TaskBase
 
@@ -95,10 +95,10 @@ class PortFingerBase(TaskBase):
             for port in target['port']:
                 if int(port['port']) in self.black_port:
                     continue
+                # IPv6地址加[]
+                url = format_host_port(target['ip'], port['port'])
                 if int(port['port']) in [443, 8443]:
-                    url = 'https://{}:{}'.format(target['ip'], port['port'])
-                else:
-                    url = '{}:{}'.format(target['ip'], port['port'])
+                    url = 'https://' + url
                 content = self.fetch_title(url)
                 if content:
                     port.update(self.parse_result(content))
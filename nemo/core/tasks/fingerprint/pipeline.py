@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# coding:utf-8
+import queue
+import threading
+import traceback
+
+from nemo.common.utils.loggerutils import logger
+
+# 待指纹识别的端口队列的最大长度
+QUEUE_SIZE = 1000
+
+
+class FingerprintPipeline():
+    '''端口扫描与指纹识别的流水线
+    扫描结果（生成器）中开放的端口逐个放入有界队列，由指纹识别的线程在扫描过程中处理（whatweb、httpx依次执行）
+    队列满时暂停读取扫描结果（背压），待识别的端口数不超过queue_size；指纹识别的结果直接更新扫描结果中的端口
+    参数：
+        fingerprint_apps:   指纹识别的任务（PortFingerBase的继承类，如WhatWeb、Httpx）
+        threads:            指纹识别的线程数，默认为各任务的最大线程数
+    '''
+
+    def __init__(self, fingerprint_apps, threads=None, queue_size=QUEUE_SIZE):
+        self.fingerprint_apps = fingerprint_apps
+        self.threads = threads or max([app.threads for app in fingerprint_apps])
+        self.queue = queue.Queue(maxsize=queue_size)
+        # 不进行指纹识别的端口（与PortFingerBase的黑名单一致）
+        self.black_port = set(fingerprint_apps[0].black_port) if fingerprint_apps else set()
+
+    def __worker(self):
+        '''指纹识别的线程：处理队列中的端口，直到收到结束标记（None）
+        '''
+        while True:
+            target = self.queue.get()
+            try:
+                if target is None:
+                    break
+                for app in self.fingerprint_apps:
+                    app.execute_worker(target)
+            except Exception:
+                logger.error(traceback.format_exc())
+            finally:
+                self.queue.task_done()
+
+    def run(self, ip_ports):
+        '''执行流水线
+        ip_ports:   扫描结果的生成器，格式：{'ip':'192.168.1.1','status':'alive','port':[{'port':80,...},...]}
+        返回值：扫描结果的列表（包括指纹识别的结果）
+        '''
+        workers = [threading.Thread(target=self.__worker, daemon=True) for _ in range(self.threads)]
+        for w in workers:
+            w.start()
+        results = []
+        try:
+            for ip in ip_ports:
+                results.append(ip)
+                for port in ip['port']:
+                    if int(port['port']) in self.black_port:
+                        continue
+                    # 每个端口作为一个指纹识别的目标，端口的字典与扫描结果共用
+                    self.queue.put({'ip': ip['ip'], 'port': [port]})
+        finally:
+            for _ in workers:
+                self.queue.put(None)
+            for w in workers:
+                w.join()
+
+        return results
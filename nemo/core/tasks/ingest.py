@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# coding:utf-8
+import time
+
+from nemo.common.utils.assertinfoparser import AssertInfoParser
+from nemo.core.database import dbutils
+from nemo.core.database.attr import DomainAttr
+from nemo.core.database.attr import PortAttr
+from nemo.core.database.domain import Domain
+from nemo.core.database.ip import Ip
+from nemo.core.database.port import Port
+
+
+class IngestWriter():
+    '''扫描结果的批量写入
+    将ip->port->attr及domain->attr的结果缓存，按批次（chunk_size）合并为多行的upsert语句写入数据库
+    支持一次性写入整个结果列表，也可以逐条加入（流式）后再调用flush
+    聚合信息（ip_summary、domain_summary）不在每个批次中更新，记录变化的id，由flush在全部写入后统一更新
+    '''
+
+    def __init__(self, source, result_attr_keys=(), org_id=None, chunk_size=500):
+        # 属性来源
+        self.source = source
+        # 要保存的端口属性字段
+        self.result_attr_keys = result_attr_keys
+        self.org_id = org_id
+        # 每批次的记录数
+        self.chunk_size = chunk_size
+        # 域名要保存的属性字段
+        self.domain_attr_keys = ('CNAME', 'A', 'title', 'whatweb', 'server', 'httpx')
+
+        self.ip_app = Ip()
+        self.port_app = Port()
+        self.port_attr_app = PortAttr()
+        self.domain_app = Domain()
+        self.domain_attr_app = DomainAttr()
+        self.asset_parser = AssertInfoParser()
+
+        self.ip_buffer = []
+        self.domain_buffer = []
+        # 待更新聚合信息的id
+        self.changed_ip_ids = set()
+        self.changed_domain_ids = set()
+        # 统计
+        self.ip_count = 0
+        self.port_count = 0
+        self.domain_count = 0
+        self.rows = 0
+        self.elapsed = 0.0
+
+    def add_ip(self, ip):
+        '''加入一条ip资产结果
+        '''
+        self.ip_count += 1
+        if 'ip' not in ip:
+            return
+        if self.org_id:
+            ip['org_id'] = self.org_id
+        self.ip_buffer.append(ip)
+        if len(self.ip_buffer) >= self.chunk_size:
+            self.flush_ip()
+
+    def add_ips(self, data):
+        '''加入ip资产结果列表
+        '''
+        for ip in data:
+            self.add_ip(ip)
+
+    def add_domain(self, domain):
+        '''加入一条domain资产结果
+        '''
+        self.domain_count += 1
+        if 'domain' not in domain:
+            return
+        if self.org_id:
+            domain['org_id'] = self.org_id
+        self.domain_buffer.append(domain)
+        if len(self.domain_buffer) >= self.chunk_size:
+            self.flush_domain()
+
+    def add_domains(self, data):
+        '''加入domain资产结果列表
+        '''
+        for domain in data:
+            self.add_domain(domain)
+
+    def flush(self):
+        '''写入所有缓存的结果，并更新变化的IP、DOMAIN及其关联的DOMAIN、IP的聚合信息
+        '''
+        self.flush_ip()
+        self.flush_domain()
+        self.refresh_summary()
+
+    def refresh_summary(self):
+        '''更新写入的IP、DOMAIN的聚合信息：IP与A记录关联的DOMAIN合并后各计算一次
+        '''
+        if not self.changed_ip_ids and not self.changed_domain_ids:
+            return
+        start_time = time.time()
+        ip_ids, self.changed_ip_ids = self.changed_ip_ids, set()
+        domain_ids, self.changed_domain_ids = self.changed_domain_ids, set()
+        # 域名的端口、标题等来自于A记录的IP，IP关联的域名来自于A记录
+        linked_domain_ids = set()
+        for ids in dbutils.chunks(sorted(ip_ids), self.chunk_size):
+            linked_domain_ids.update(self.asset_parser.get_ips_linked_domain_ids(
+                [row['ip'] for row in self.ip_app.gets_in('id', ids, fields=('id', 'ip'))]))
+        linked_ip_ids = set()
+        for ids in dbutils.chunks(sorted(domain_ids), self.chunk_size):
+            linked_ip_ids.update(self.asset_parser.get_domains_linked_ip_ids(ids))
+        for ids in dbutils.chunks(sorted(ip_ids | linked_ip_ids), self.chunk_size):
+            self.asset_parser.refresh_ips_summary(ids, False)
+        for ids in dbutils.chunks(sorted(domain_ids | linked_domain_ids), self.chunk_size):
+            self.asset_parser.refresh_domains_summary(ids, False)
+        self.elapsed += time.time() - start_time
+
+    def __upsert_grouped(self, app, rows, key_columns, optional_fields):
+        '''按记录中存在的可选字段分组后upsert：只有结果中存在的字段才会更新已有记录
+        rows: [(data, 结果中存在的字段),...]
+        返回值：与rows顺序一致的id列表
+        '''
+        groups = {}
+        for index, (data, fields) in enumerate(rows):
+            update_columns = tuple([f for f in optional_fields if f in fields])
+            groups.setdefault(update_columns, []).append(index)
+        ids = [0] * len(rows)
+        for update_columns, indexes in groups.items():
+            group_ids = app.upsert_many([rows[i][0] for i in indexes], key_columns, update_columns,
+                                        batch_size=self.chunk_size)
+            for i, Id in zip(indexes, group_ids):
+                ids[i] = Id
+        self.rows += len(rows)
+
+        return ids
+
+    def flush_ip(self):
+        '''写入缓存的ip、port及port属性
+        '''
+        if not self.ip_buffer:
+            return
+        start_time = time.time()
+        ips, self.ip_buffer = self.ip_buffer, []
+        # 保存IP
+        ip_rows = []
+        for ip in ips:
+            data = {'ip': ip['ip']}
+            self.ip_app.copy_key(data, ip, 'status', 'alive')
+            self.ip_app.copy_key(data, ip, 'org_id')
+            self.ip_app.copy_key(data, ip, 'location')
+            ip_rows.append((data, ip))
+        ip_ids = self.__upsert_grouped(self.ip_app, ip_rows, ('ip',), ('status', 'org_id', 'location'))
+        # 保存端口
+        port_rows = []
+        ports = []
+        for ip, ip_id in zip(ips, ip_ids):
+            if ip_id <= 0 or 'port' not in ip:
+                continue
+            self.port_count += len(ip['port'])
+            for port in ip['port']:
+                port['ip_id'] = ip_id
+                data = {'ip_id': ip_id, 'port': port['port']}
+                self.port_app.copy_key(data, port, 'status', 'N/A')
+                port_rows.append((data, port))
+                ports.append(port)
+        port_ids = self.__upsert_grouped(self.port_app, port_rows, ('ip_id', 'port'), ('status',))
+        # 保存端口的属性
+        attr_rows = []
+        for port, port_id in zip(ports, port_ids):
+            if port_id <= 0:
+                continue
+            for attr_key in self.result_attr_keys:
+                if attr_key in port and port[attr_key]:
+                    attr_rows.append(({'r_id': port_id, 'source': self.source, 'tag': attr_key,
+                                       'content': port[attr_key][:800]}, ()))
+        self.__upsert_grouped(self.port_attr_app, attr_rows, ('hash',), ())
+        self.changed_ip_ids.update([ip_id for ip_id in ip_ids if ip_id > 0])
+        self.elapsed += time.time() - start_time
+
+    def flush_domain(self):
+        '''写入缓存的domain及domain属性
+        '''
+        if not self.domain_buffer:
+            return
+        start_time = time.time()
+        domains, self.domain_buffer = self.domain_buffer, []
+        # 保存domain
+        domain_rows = []
+        for domain in domains:
+            data = {'domain': domain['domain']}
+            self.domain_app.copy_key(data, domain, 'org_id')
+            domain_rows.append((data, domain))
+        domain_ids = self.__upsert_grouped(self.domain_app, domain_rows, ('domain',), ('org_id',))
+        # 保存domain的属性
+        attr_rows = []
+        for domain, domain_id in zip(domains, domain_ids):
+            if domain_id <= 0:
+                continue
+            for attr_key in self.domain_attr_keys:
+                if attr_key in domain:
+                    for attr_value in domain[attr_key]:
+                        attr_rows.append(({'r_id': domain_id, 'source': self.source, 'tag': attr_key,
+                                           'content': attr_value[0:800]}, ()))
+        self.__upsert_grouped(self.domain_attr_app, attr_rows, ('hash',), ())
+        self.changed_domain_ids.update([domain_id for domain_id in domain_ids if domain_id > 0])
+        self.elapsed += time.time() - start_time
+
+    def rows_per_second(self):
+        '''写入速率（记录数/秒）
+        '''
+        if self.elapsed <= 0:
+            return self.rows
+        return round(self.rows / self.elapsed, 1)
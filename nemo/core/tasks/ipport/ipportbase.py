@@ -50,6 +50,13 @@ class IPPortBase(TaskBase):
         由继承类实现
         '''
 
+    def iter_scan(self, target, port):
+        '''对指定IP和端口进行扫描，逐个生成扫描结果（生成器）
+        默认在扫描完成后生成，能逐行读取扫描输出的继承类（如masscan）在扫描过程中生成
+        '''
+        for ip in self.execute_scan(target, port):
+            yield ip
+
     def prepare(self, options):
         '''解析参数
         '''
@@ -75,6 +82,15 @@ class IPPortBase(TaskBase):
 
         return ip_ports
 
+    def iter_execute(self):
+        '''调用执行扫描任务，逐个生成扫描结果（生成器）
+        '''
+        try:
+            yield from self.iter_scan(self.target, self.port)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error('{} scan target:{},port:{}'.format(self.task_name, self.target, self.port))
+
     def run(self, options):
         '''执行任务
         '''
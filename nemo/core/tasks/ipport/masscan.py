@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 # coding:utf-8
-import os
 import re
 import subprocess
 import traceback
 from tempfile import NamedTemporaryFile
 
 from nemo.common.utils.config import load_config
+from nemo.common.utils.iputils import normalize_ip
 from nemo.common.utils.loggerutils import logger
 from nemo.common.utils.parseservice import ParsePortService
 from .ipportbase import IPPortBase
@@ -38,27 +38,20 @@ class Masscan(IPPortBase):
         # 参数
         self.source = 'portscan'
 
-    def __parse_masscan_output_file(self, output_results):
-        '''解析masscan的扫描结果
+    def __parse_masscan_output_line(self, line, port_service):
+        '''解析masscan的一行扫描结果（-oL格式），不是开放端口时返回None
         '''
-        results = []
-        port_service = ParsePortService()
-        try:
-            for line in output_results.split(os.linesep):
-                if line.strip() == '':
-                    continue
-                if line.startswith('#'):
-                    continue
-                data = line.strip().split(' ')
-                if data[0] == 'open' and data[1] == 'tcp':
-                    ip = data[3].strip()
-                    port = data[2].strip()
-                    results.append({'ip': ip, 'status': 'alive', 'port': [
-                        {'port': port, 'service': port_service.get_service(port)}]})
-        except Exception as e:
-            logger.error(traceback.format_exc())
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            return None
+        data = line.split(' ')
+        # open tcp 80 192.168.1.1 1600000000，IPv6地址的格式相同
+        if len(data) >= 4 and data[0] == 'open' and data[1] == 'tcp':
+            ip = normalize_ip(data[3].strip())
+            port = data[2].strip()
+            return {'ip': ip, 'status': 'alive', 'port': [{'port': port, 'service': port_service.get_service(port)}]}
 
-        return results
+        return None
 
     def __get_top_ports_by_nmap(self, top_number):
         '''调用nmap获得--top-ports的定义
@@ -82,12 +75,18 @@ class Masscan(IPPortBase):
     def execute_scan(self, target, port):
         '''调用masscan对指定IP和端口进行扫描
         '''
-        with NamedTemporaryFile('w+t') as tfile_ip, NamedTemporaryFile('w+t') as tfile_output:
+        return list(self.iter_scan(target, port))
+
+    def iter_scan(self, target, port):
+        '''调用masscan对指定IP和端口进行扫描，结果输出到管道（-oL -）并逐行解析，扫描过程中逐个生成开放的端口
+        调用者停止读取时，管道写满后masscan的输出暂停
+        '''
+        port_service = ParsePortService()
+        with NamedTemporaryFile('w+t') as tfile_ip:
             # 将所有目标一次性写入文件中
             tfile_ip.write('\n'.join(target))
             tfile_ip.seek(0)
-            masscan_bin = [self.masscan_bin, '-oL',
-                           tfile_output.name, '--open', '--rate', str(self.rate)]
+            masscan_bin = [self.masscan_bin, '-oL', '-', '--open', '--rate', str(self.rate)]
             if self.ping:
                 masscan_bin.append('--ping')
             # 两种方式：指定端口（包括全端口）和常用top端口（--top-ports 1000）
@@ -103,10 +102,22 @@ class Masscan(IPPortBase):
             if self.exclude:
                 masscan_bin.append('--exclude')
                 masscan_bin.append(self.exclude)
-            # 调用masscan进行扫描
-            child = subprocess.Popen(masscan_bin, stdout=subprocess.PIPE)
-            child.wait()
-            # 解析masscan扫描结果
-            result = self.__parse_masscan_output_file(tfile_output.read())
-
-        return result
+            # 调用masscan进行扫描，逐行解析扫描结果
+            child = subprocess.Popen(masscan_bin, stdout=subprocess.PIPE, universal_newlines=True)
+            finished = False
+            try:
+                for line in child.stdout:
+                    try:
+                        result = self.__parse_masscan_output_line(line, port_service)
+                    except Exception:
+                        logger.error(traceback.format_exc())
+                        continue
+                    if result:
+                        yield result
+                finished = True
+            finally:
+                # 提前结束读取时终止扫描
+                if not finished and child.poll() is None:
+                    child.terminate()
+                child.stdout.close()
+                child.wait()
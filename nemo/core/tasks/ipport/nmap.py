@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 # coding:utf-8
-import os
-import re
 import subprocess
+import traceback
 from tempfile import NamedTemporaryFile
+from xml.etree import ElementTree
 
+from nemo.common.utils.iputils import normalize_ip, split_by_version
+from nemo.common.utils.loggerutils import logger
 from nemo.common.utils.parseservice import ParsePortService
 from .ipportbase import IPPortBase
 
+# nmap输出扫描进度的间隔
+STATS_INTERVAL = '10s'
+
 
 class Nmap(IPPortBase):
     '''调用Nmap的扫描任务
@@ -35,49 +40,97 @@ class Nmap(IPPortBase):
         self.task_description = '调用nmap进行端口扫描'
         # 参数
         self.source = 'portscan'
+        self.result_attr_keys = ('service', 'banner', 'script')
+
+    def __parse_host(self, host, service_app):
+        '''解析一个主机的XML元素，没有开放的端口时返回None
+        '''
+        status = host.find('status')
+        if status is not None and status.get('state') != 'up':
+            return None
+        ip = None
+        for address in host.findall('address'):
+            if address.get('addrtype') in ('ipv4', 'ipv6'):
+                ip = normalize_ip(address.get('addr'))
+                break
+        if not ip:
+            return None
+        ports = []
+        for p in host.findall('ports/port'):
+            state = p.find('state')
+            if state is None or state.get('state') != 'open':
+                continue
+            port = int(p.get('portid'))
+            service = ''
+            banner = ''
+            service_elem = p.find('service')
+            if service_elem is not None:
+                service = service_elem.get('name', '')
+                banner = ' '.join([service_elem.get(k) for k in ('product', 'version', 'extrainfo') if service_elem.get(k)])
+            service_custom = service_app.get_service(port)
+            if service_custom and service_custom != 'unknown':
+                service = service_custom
+            port_info = {'port': port, 'service': service, 'banner': banner}
+            # NSE脚本的输出
+            scripts = ['{}: {}'.format(script.get('id'), script.get('output', '').strip()) for script in
+                       p.findall('script')]
+            if scripts:
+                port_info['script'] = '\n'.join(scripts)
+            ports.append(port_info)
+        if not ports:
+            return None
+
+        return {'ip': ip, 'status': 'alive', 'port': ports}
 
-    def __parse_nmap_grepable_file(self, nmap_grepable_file):
-        '''解析nmap扫描输出的grepable文件
+    def __parse_nmap_xml(self, stream):
+        '''逐步解析nmap输出的XML（iterparse），每个主机扫描完成后生成该主机的结果，并清除已解析的元素
+        --stats-every输出的扫描进度（taskprogress）上报为任务进度
         '''
-        results = []
         service_app = ParsePortService()
-        for line in nmap_grepable_file.split(os.linesep):
-            line_str = line.strip()
-            if line_str.startswith('#'):
+        root = None
+        for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
                 continue
-            if line_str == '':
+            if elem.tag == 'taskprogress':
+                self.report_progress('nmap {}: {}%，预计剩余{}秒'.format(
+                    elem.get('task', ''), elem.get('percent', ''), elem.get('remaining', '')))
+            elif elem.tag == 'host':
+                result = self.__parse_host(elem, service_app)
+                if result:
+                    yield result
+            else:
                 continue
-            m = re.findall(r'^Host:(.+)Ports:(.+)', line_str)
-            if m and len(m[0]) >= 2:
-                ip = re.findall(
-                    r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', m[0][0])[0]
-                ports_info = m[0][1].strip().split(',')
-                ports = []
-                for pi in ports_info:
-                    p = pi.split('/')
-                    status = p[1]
-                    if status == 'open':
-                        port = int(p[0].strip())
-                        service = p[4].strip()
-                        banner = p[6].strip()
-                        service_custom = service_app.get_service(port)
-                        if service_custom and service_custom != 'unknown':
-                            service = service_custom
-                        ports.append(
-                            {'port': port, 'service': service, 'banner': banner})
-                results.append({'ip': ip, 'status': 'alive', 'port': ports})
-
-        return results
+            # 清除已处理的元素，内存不随主机数增长
+            root.clear()
 
     def execute_scan(self, target, port):
         '''调用nmap对指定IP和端口进行扫描
         '''
-        with  NamedTemporaryFile('w+t') as tfile_ip, NamedTemporaryFile('w+t') as tfile_output:
+        return list(self.iter_scan(target, port))
+
+    def iter_scan(self, target, port):
+        '''调用nmap对指定IP和端口进行扫描，扫描过程中逐个生成完成扫描的主机
+        nmap的一次扫描只能是IPv4或IPv6（-6）的目标，因此按地址类型分别扫描
+        '''
+        ipv4_target, ipv6_target = split_by_version(target)
+        if ipv4_target:
+            yield from self.__scan(ipv4_target, port, False)
+        if ipv6_target:
+            yield from self.__scan(ipv6_target, port, True)
+
+    def __scan(self, target, port, ipv6):
+        '''调用nmap扫描，XML结果输出到管道（-oX -）并逐步解析
+        '''
+        with NamedTemporaryFile('w+t') as tfile_ip:
             # 将所有目标一次性写入文件中
             tfile_ip.write('\n'.join(target))
             tfile_ip.seek(0)
-            nmap_bin = [self.nmap_bin, self.tech, '-T4', '-oG', tfile_output.name, '--open',
+            nmap_bin = [self.nmap_bin, self.tech, '-T4', '-oX', '-', '--stats-every', STATS_INTERVAL, '--open',
                         '-n', '--randomize-hosts', '--min-rate', str(self.rate)]
+            if ipv6:
+                nmap_bin.append('-6')
             if not self.ping:
                 nmap_bin.append('-Pn')
             # 两种方式：指定端口（包括全端口）和常用top端口（--top-ports 1000）
@@ -92,8 +145,18 @@ class Nmap(IPPortBase):
             if self.exclude:
                 nmap_bin.append('--exclude')
                 nmap_bin.append(self.exclude)
-            # 调用nmap进行扫描
-            child = subprocess.Popen(nmap_bin, stdout=subprocess.PIPE)
-            child.wait()
-            # 解析nmap扫描结果
-            return self.__parse_nmap_grepable_file(tfile_output.read())
+            # 调用nmap进行扫描，逐步解析扫描结果：不使用缓冲，读取时返回已输出的内容，不等待读满缓冲区
+            child = subprocess.Popen(nmap_bin, stdout=subprocess.PIPE, bufsize=0)
+            finished = False
+            try:
+                yield from self.__parse_nmap_xml(child.stdout)
+                finished = True
+            except ElementTree.ParseError:
+                logger.error(traceback.format_exc())
+                logger.error('nmap output error, target:{},port:{}'.format(target, port))
+            finally:
+                # 提前结束读取时终止扫描
+                if not finished and child.poll() is None:
+                    child.terminate()
+                child.stdout.close()
+                child.wait()
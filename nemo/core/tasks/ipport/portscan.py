@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 # coding:utf-8
+from datetime import datetime
+from datetime import timedelta
+
+from nemo.common.utils.config import load_config
+from nemo.common.utils.loggerutils import logger
 from nemo.common.utils.iputils import check_ip_or_domain
 from nemo.core.tasks.fingerprint.httpx import Httpx
+from nemo.core.tasks.fingerprint.pipeline import FingerprintPipeline
 
 from nemo.core.tasks.domain.ipdomain import IpDomain
 from nemo.core.tasks.onlineapi.iplocation import IpLocation
 from nemo.core.tasks.ipport.masscan import Masscan
 from nemo.core.tasks.ipport.nmap import Nmap
+from nemo.core.tasks.planner import SHARD_DURATION, plan_shards, skipped_targets
+from nemo.core.database import dbutils
+from nemo.core.database.ip import Ip
 from nemo.core.tasks.taskbase import TaskBase
 from nemo.core.tasks.fingerprint.webtitle import WebTitle
 from nemo.core.tasks.fingerprint.whatweb import WhatWeb
 
+# 分片扫描的开始时间提前的秒数（各worker与数据库的时钟误差）
+SCAN_START_MARGIN = 60
+
 
 class PortScan(TaskBase):
     '''端口扫描综合任务
@@ -25,6 +37,8 @@ class PortScan(TaskBase):
             'httpx':    True/False,是否调用httpx
             'iplocation':   True/False，是否调用iplocation
             'bin':      nmap/masscan，扫描方法
+            'shard_duration':   分片扫描时每个分片的预计执行时长（秒）
+            'shard_port':       True/False，分片扫描时主机数较少是否拆分端口
         }
     '''
 
@@ -36,7 +50,7 @@ class PortScan(TaskBase):
         self.task_description = '端口扫描综合任务'
         # 默认参数：
         self.source = 'portscan'
-        self.result_attr_keys = ('service', 'banner', 'title', 'whatweb', 'server', 'httpx')
+        self.result_attr_keys = ('service', 'banner', 'script', 'title', 'whatweb', 'server', 'httpx')
         self.whatweb = False
         self.iplocation = False
         self.httpx = False
@@ -65,34 +79,116 @@ class PortScan(TaskBase):
                 # 如果没有CDN，则将ip地址加入到扫描目标地址
                 if len(iplist['CNAME']) == 0 and len(iplist['A']) > 0:
                     target_ip.extend(iplist['A'])
+        # 地址数超过MAX_EXPAND_IPV6的IPv6网段或范围不扫描（与估算及分片一致）
+        skipped = set(skipped_targets(target_ip))
+        if skipped:
+            logger.info('portscan skip ipv6 network: {}'.format(','.join(sorted(skipped))))
 
-        options['target'] = target_ip
+        options['target'] = [t for t in target_ip if t not in skipped]
 
-    def run(self, options):
-        '''执行端口扫描任务
+    def execute_scan(self, options, pipeline=None):
+        '''端口扫描，不包括保存
+        pipeline:   指纹识别的流水线（FingerprintPipeline），扫描过程中对开放的端口进行指纹识别
+        返回值：ip_ports
         '''
-        self.prepare(options)
-        # 扫描
         if self.bin == 'nmap':
             scan_app = Nmap()
         else:
             scan_app = Masscan()
         scan_app.prepare(options)
-        ip_ports = scan_app.execute()
+        scan_app.progress_callback = self.progress_callback
+        if pipeline:
+            return pipeline.run(scan_app.iter_execute())
+
+        return scan_app.execute()
+
+    def fingerprint_apps(self):
+        '''要调用的指纹识别任务（whatweb、httpx）
+        '''
+        apps = []
+        if self.whatweb:
+            apps.append(WhatWeb())
+        if self.httpx:
+            apps.append(Httpx())
+
+        return apps
+
+    def process(self, ip_ports, fingerprint=True):
+        '''扫描结果的IP归属地、指纹识别，并保存
+        fingerprint:    是否进行指纹识别（已由流水线完成时为False）
+        '''
         # iplocation:
         if self.iplocation:
             iplocation_app = IpLocation()
             iplocation_app.execute(ip_ports)
-        # 是否调用whatweb
-        if self.whatweb:
-            whatweb_app = WhatWeb()
-            whatweb_app.execute(ip_ports)
-        # 是否调用httpx
-        if self.httpx:
-            httpx_app = Httpx()
-            httpx_app.execute(ip_ports)
+        # 是否调用whatweb、httpx
+        if fingerprint:
+            for app in self.fingerprint_apps():
+                app.execute(ip_ports)
         # 保存数据
         result = self.save_ip(ip_ports)
         result['status'] = 'success'
 
         return result
+
+    def run(self, options):
+        '''执行端口扫描任务
+        有指纹识别时，扫描结果经流水线在扫描过程中进行指纹识别
+        '''
+        self.prepare(options)
+        fingerprint_apps = self.fingerprint_apps()
+        if fingerprint_apps:
+            ip_ports = self.execute_scan(options, FingerprintPipeline(fingerprint_apps))
+            return self.process(ip_ports, fingerprint=False)
+        # 扫描
+        ip_ports = self.execute_scan(options)
+
+        return self.process(ip_ports)
+
+    def shard(self, options):
+        '''分片扫描：解析参数（域名转换为IP）后，将目标及端口拆分为多个分片
+        返回值：各分片的options列表，分片的options增加shard（序号/分片数量）、hosts、packets
+        '''
+        self.prepare(options)
+        config_datajson = load_config()
+        port = self.get_option('port', options, None) or config_datajson['nmap']['port'] or '--top-ports 1000'
+        rate = self.get_option('rate', options, None) or config_datajson['nmap']['rate']
+        shards = plan_shards(options['target'], port, rate,
+                             shard_duration=self.get_option('shard_duration', options, SHARD_DURATION),
+                             split_port=self.get_option('shard_port', options, True))
+        # 扫描的开始时间：merge读取该时间之后更新的端口（减去SCAN_START_MARGIN，避免worker之间时钟的误差）
+        options['scan_start'] = (datetime.now() - timedelta(seconds=SCAN_START_MARGIN)).strftime('%Y-%m-%d %H:%M:%S')
+        shard_options = []
+        for i, shard in enumerate(shards):
+            shard_options.append(dict(options, target=shard['target'], port=shard['port'], hosts=shard['hosts'],
+                                      packets=shard['packets'], shard='{}/{}'.format(i + 1, len(shards))))
+
+        return shard_options
+
+    def run_shard(self, options):
+        '''执行一个分片的扫描：扫描结果直接保存（不进行指纹识别），只返回数量
+        任务结果经celery的结果存储传递，不包括扫描结果；merge从数据库读取各分片的结果
+        '''
+        self.bin = self.get_option('bin', options, self.bin)
+        self.org_id = self.get_option('org_id', options, self.org_id)
+        ip_ports = self.execute_scan(options)
+        result = self.save_ip(ip_ports)
+        result.update(status='success', shard=options.get('shard'))
+
+        return result
+
+    def merge(self, shard_results, options):
+        '''从数据库读取各分片保存的扫描结果（目标范围内、扫描开始后更新的端口），进行IP归属地、指纹识别并保存
+        '''
+        self.prepare(options)
+        ip_ports = []
+        with dbutils.read_primary():
+            for row in Ip().iter_ports_by_ip(','.join(options['target']), options['scan_start']):
+                if not ip_ports or ip_ports[-1]['ip'] != row['ip']:
+                    ip_ports.append({'ip': row['ip'], 'status': 'alive', 'port': []})
+                ip_ports[-1]['port'].append({'port': row['port'], 'status': row['status']})
+        result = self.process(ip_ports)
+        result['shards'] = len(shard_results)
+        result['shard_ports'] = sum([r.get('port', 0) for r in shard_results if r])
+
+        return result
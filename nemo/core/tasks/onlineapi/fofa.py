@@ -7,7 +7,7 @@ import traceback
 import requests
 
 from instance.config import APIConfig
-from nemo.common.utils.iputils import check_ip_or_domain
+from nemo.common.utils.iputils import check_ip_or_domain, normalize_ip, split_host_port
 from nemo.common.utils.loggerutils import logger
 from nemo.core.tasks.taskbase import TaskBase
 
@@ -95,9 +95,10 @@ class Fofa(TaskBase):
         '''解析IP与PORT
         '''
         ip = line[1]
-        # 只保留和解析ipv4地址
+        # 只保留和解析IP地址（IPv4及IPv6）
         if not check_ip_or_domain(ip):
             return None
+        ip = normalize_ip(ip)
 
         port = int(line[2])
         title = line[3]
@@ -120,12 +121,12 @@ class Fofa(TaskBase):
         host = line[0]
         ip = line[1]
         title = line[3]
-        # 只保留和解析ipv4地址
+        # 只保留和解析IP地址（IPv4及IPv6）
         if not check_ip_or_domain(ip):
             return None
+        ip = normalize_ip(ip)
 
-        data = host.replace(
-            'https://', '').replace('http://', '').split(':')[0]
+        data, _ = split_host_port(host.replace('https://', '').replace('http://', ''))
         # 去除IP
         if not check_ip_or_domain(data):
             domain = {'domain': data, 'A': [ip, ]}
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+扫描任务的分片：按成本模型估算扫描的执行时长，将目标（及端口）拆分为预计时长相近的分片
+1. 成本模型：数据包数 = 主机数 × 端口数，执行时长 = 数据包数 / 扫描速率(rate) + 每次扫描的固定耗时(SCAN_OVERHEAD)
+2. 目标为IP、IP/掩码或IP范围（IPv4或IPv6），范围转换为网段列表（nmap只支持网段及单个IP）；域名按DOMAIN_HOSTS个主机估算
+   地址数超过MAX_EXPAND_IPV6的IPv6网段或范围不扫描（与iputils.parse_ip一致），按0个主机计算，estimate()返回这些目标
+3. IPv4、IPv6的目标分别拆分，分片数量按各自的数据包数分配，合计不超过max_shards；
+   目标按顺序装入分片，每个分片的主机数不超过分片的数据包数/端口数，网段在分片的边界处切分，切分后的地址范围转换为网段列表
+   （只有分片数量达到max_shards时，分片的预计时长才会超过shard_duration）
+4. 主机数少于分片数量时（如少量IP的全端口扫描），可以将端口范围拆分为多组，--top-ports不拆分
+5. 分片用于portscan_sharded（chord）及web的子任务模式；estimate()的估算结果用于web显示预计的执行时长
+"""
+import ipaddress
+import math
+import re
+
+from nemo.common.utils.iputils import MAX_EXPAND_IPV6, split_by_version
+
+# 每个分片的预计执行时长（秒）
+SHARD_DURATION = 600
+# 每次扫描的固定耗时（秒）：进程启动及masscan发送完成后等待响应的时间（--wait，默认10秒）
+SCAN_OVERHEAD = 10
+# 没有指定速率时的默认扫描速率（每秒数据包数）
+DEFAULT_RATE = 1000
+# 域名按解析得到的IP数估算
+DOMAIN_HOSTS = 1
+# 最多的分片数量
+SHARD_MAX_COUNT = 256
+# 端口的最大值
+MAX_PORT = 65535
+
+
+def parse_ports(port):
+    '''解析端口范围，如'21-23,80,8000-9000'
+    返回值：合并后有序的端口区间列表[(start, end),...]；--top-ports或带协议前缀（如U:53）的端口返回None
+    '''
+    port = port.strip()
+    if not port or port.startswith('--top') or ':' in port:
+        return None
+    intervals = []
+    for item in port.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '-' in item:
+            start, end = item.split('-', 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else MAX_PORT
+        else:
+            start = end = int(item)
+        intervals.append((min(start, end), max(start, end)))
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return [tuple(i) for i in merged]
+
+
+def count_ports(port):
+    '''端口的数量：--top-ports N为N，端口范围为端口数，带协议前缀的按各项分别计算
+    '''
+    port = port.strip()
+    if not port:
+        return 0
+    m = re.match(r'^--top-ports?\s+(\d+)$', port)
+    if m:
+        return min(int(m.group(1)), MAX_PORT)
+    intervals = parse_ports(port)
+    if intervals is None:
+        # 带协议前缀：T:80,U:53,161
+        return sum([count_ports(re.sub(r'^[a-zA-Z]:', '', p)) for p in port.split(',') if p.strip()])
+
+    return sum([end - start + 1 for start, end in intervals])
+
+
+def format_ports(intervals):
+    '''端口区间列表转换为端口范围的格式
+    '''
+    return ','.join([str(start) if start == end else '{}-{}'.format(start, end) for start, end in intervals])
+
+
+def split_ports(intervals, count):
+    '''将端口区间列表拆分为count组端口数相近的端口范围
+    '''
+    total = sum([end - start + 1 for start, end in intervals])
+    size = math.ceil(total / max(1, min(count, total)))
+    groups = []
+    group = []
+    group_size = 0
+    for start, end in intervals:
+        while start <= end:
+            n = min(end - start + 1, size - group_size)
+            group.append((start, start + n - 1))
+            group_size += n
+            start += n
+            if group_size >= size:
+                groups.append(format_ports(group))
+                group = []
+                group_size = 0
+    if group:
+        groups.append(format_ports(group))
+
+    return groups
+
+
+def _expand_network(target):
+    '''扫描目标转换为网段列表，不是IP的目标（如域名）返回None
+    '''
+    target = target.strip()
+    try:
+        if '-' in target and '/' not in target:
+            ip_start, ip_end = target.split('-', 1)
+            return list(ipaddress.summarize_address_range(ipaddress.ip_address(ip_start.strip()),
+                                                          ipaddress.ip_address(ip_end.strip())))
+        return [ipaddress.ip_network(target, strict=False)]
+    except (ValueError, TypeError):
+        return None
+
+
+def _is_skipped(networks):
+    '''地址数超过MAX_EXPAND_IPV6的IPv6网段或范围不扫描
+    '''
+    return bool(networks) and networks[0].version == 6 and \
+        sum([n.num_addresses for n in networks]) > MAX_EXPAND_IPV6
+
+
+def expand_target(target):
+    '''扫描目标转换为网段列表，不是IP的目标（如域名）返回None，不扫描的IPv6大网段返回空列表
+    '''
+    networks = _expand_network(target)
+    if _is_skipped(networks):
+        return []
+
+    return networks
+
+
+def skipped_targets(targets):
+    '''不扫描的目标（地址数超过MAX_EXPAND_IPV6的IPv6网段或范围）
+    '''
+    return [t.strip() for t in targets if _is_skipped(_expand_network(t))]
+
+
+def count_hosts(targets):
+    '''扫描目标的主机数
+    '''
+    hosts = 0
+    for t in targets:
+        networks = expand_target(t)
+        hosts += DOMAIN_HOSTS if networks is None else sum([n.num_addresses for n in networks])
+
+    return hosts
+
+
+def _format_network(network):
+    '''网段的扫描目标格式：单个地址不带掩码
+    '''
+    if network.num_addresses == 1:
+        return str(network.network_address)
+
+    return str(network)
+
+
+def split_targets(targets, count):
+    '''将扫描目标拆分为不超过count组的目标列表，每组的主机数不超过ceil(总主机数/count)
+    网段在分组的边界处切分，切分的地址范围转换为网段列表
+    返回值：[(目标列表, 主机数),...]
+    '''
+    items = []
+    for t in targets:
+        networks = expand_target(t)
+        if networks is None:
+            items.append((t.strip(), DOMAIN_HOSTS, None))
+        else:
+            items.extend([(_format_network(n), n.num_addresses, n) for n in networks])
+    total = sum([item[1] for item in items])
+    count = max(1, min(count, total))
+    budget = math.ceil(total / count)
+    # 按顺序装入分组，分组满时切分网段
+    groups = []
+    group = []
+    group_hosts = 0
+    for target, hosts, network in items:
+        start = 0
+        while start < hosts:
+            if group_hosts >= budget:
+                groups.append((group, group_hosts))
+                group = []
+                group_hosts = 0
+            n = min(hosts - start, budget - group_hosts)
+            if n == hosts:
+                group.append(target)
+            else:
+                first = network.network_address + start
+                group.extend([_format_network(subnet)
+                              for subnet in ipaddress.summarize_address_range(first, first + n - 1)])
+            group_hosts += n
+            start += n
+    if group:
+        groups.append((group, group_hosts))
+
+    return groups
+
+
+def parse_rate(rate):
+    '''扫描速率（每秒数据包数），无效时为DEFAULT_RATE
+    '''
+    try:
+        rate = int(rate)
+    except (ValueError, TypeError):
+        return DEFAULT_RATE
+
+    return rate if rate > 0 else DEFAULT_RATE
+
+
+def estimate_seconds(packets, rate):
+    '''一次扫描的预计执行时长（秒）
+    '''
+    return packets / parse_rate(rate) + SCAN_OVERHEAD
+
+
+def plan_shards(targets, port, rate, shard_duration=SHARD_DURATION, split_port=True, max_shards=SHARD_MAX_COUNT):
+    '''将扫描目标（及端口）拆分为预计执行时长相近、不超过shard_duration的分片
+    targets:    扫描目标列表（IP、IP/掩码、IP范围、域名）
+    port:       端口范围或--top-ports N
+    rate:       扫描速率（每秒数据包数）
+    split_port: 主机数少于分片数量时是否拆分端口
+    返回值：[{'target': [目标列表], 'port': 端口, 'hosts': 主机数, 'packets': 数据包数, 'seconds': 预计时长},...]
+    '''
+    # 每个分片的数据包数
+    max_packets = parse_rate(rate) * max(1, shard_duration - SCAN_OVERHEAD)
+    ports = count_ports(port)
+    intervals = parse_ports(port)
+    # IPv6的网段远大于IPv4，分别拆分
+    versions = []
+    for version_targets in split_by_version(targets):
+        hosts = count_hosts(version_targets)
+        if not hosts:
+            continue
+        if ports <= max_packets:
+            # 每个分片的主机数不超过max_packets/ports
+            count = math.ceil(hosts / (max_packets // max(1, ports)))
+        else:
+            # 单个主机的端口数超过分片的数据包数：每个主机一个分片，再拆分端口
+            count = hosts * math.ceil(ports / max_packets)
+        versions.append((version_targets, hosts, count))
+    # 分片数量超过max_shards时按比例分配（IPv4、IPv6各至少1个）
+    total = sum([v[2] for v in versions])
+    shards = []
+    for version_targets, hosts, count in versions:
+        if total > max_shards:
+            count = max(1, count * max_shards // total)
+        port_groups = [port]
+        if split_port and intervals and count > hosts:
+            port_groups = split_ports(intervals, count // hosts)
+        for target, target_hosts in split_targets(version_targets, count // len(port_groups)):
+            for p in port_groups:
+                packets = target_hosts * count_ports(p)
+                shards.append({'target': target, 'port': p, 'hosts': target_hosts, 'packets': packets,
+                               'seconds': estimate_seconds(packets, rate)})
+
+    return shards
+
+
+def estimate(targets, port, rate, shard_duration=SHARD_DURATION, split_port=True):
+    '''估算扫描任务的数据包数及执行时长
+    返回值：{'hosts': 主机数, 'ports': 端口数, 'packets': 数据包数, 'seconds': 单个任务的预计时长,
+            'shards': 分片数量, 'shard_seconds': 分片的最长预计时长, 'skipped': 不扫描的目标列表}
+    '''
+    hosts = count_hosts(targets)
+    ports = count_ports(port)
+    shards = plan_shards(targets, port, rate, shard_duration, split_port)
+
+    return {'hosts': hosts, 'ports': ports, 'packets': hosts * ports,
+            'seconds': round(estimate_seconds(hosts * ports, rate)), 'shards': len(shards),
+            'shard_seconds': round(max([s['seconds'] for s in shards])) if shards else 0,
+            'skipped': skipped_targets(targets)}
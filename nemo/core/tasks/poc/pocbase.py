@@ -5,6 +5,7 @@ import os
 import traceback
 from urllib.parse import urlparse
 
+from nemo.common.utils.assertinfoparser import AssertInfoParser
 from nemo.common.utils.loggerutils import logger
 from nemo.core.database.vulnerability import Vulnerability
 from nemo.core.tasks.taskbase import TaskBase
@@ -115,6 +116,8 @@ class PocBase(TaskBase):
             for v in vul_results:
                 if vul_app.save_and_update(v):
                     result['vulnerability'] += 1
+            # 更新漏洞目标的聚合信息
+            AssertInfoParser().refresh_targets_summary([v['target'] for v in vul_results])
 
             return result
         except Exception as e:
@@ -4,8 +4,9 @@ from datetime import datetime
 
 from celery.result import AsyncResult
 
-from .tasks import portscan, fofasearch, shodansearch, domainscan, domainscan_with_portscan, iplocation, pocsuite3, xray
-from .tasks import save_task, update_task
+from .tasks import portscan, portscan_sharded, fofasearch, shodansearch, domainscan, domainscan_with_portscan, iplocation
+from .tasks import pocsuite3, xray
+from .tasks import save_task, update_task, shard_enabled
 
 
 class TaskAPI():
@@ -19,6 +20,7 @@ class TaskAPI():
         任务对应关系
         '''
         self.task_map = {'portscan': portscan,
+                         'portscan_sharded': portscan_sharded,
                          'fofasearch': fofasearch,
                          'shodansearch': shodansearch,
                          'domainscan': domainscan,
@@ -28,6 +30,12 @@ class TaskAPI():
                          'xray': xray
                          }
 
+    def shard_enabled(self):
+        '''
+        分片端口扫描是否可用（配置了MQ_RESULT_BACKEND）
+        '''
+        return shard_enabled()
+
     def start_task(self, task_name, args=None, kwargs=None):
         '''
         启动一个task
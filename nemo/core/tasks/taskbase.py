@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 # coding:utf-8
-import traceback
+import time
 
-from nemo.common.utils.loggerutils import logger
-from nemo.core.database.attr import DomainAttr
-from nemo.core.database.attr import PortAttr
-from nemo.core.database.domain import Domain
-from nemo.core.database.ip import Ip
-from nemo.core.database.port import Port
+from nemo.core.tasks.ingest import IngestWriter
+
+# 任务进度的最小上报间隔（秒）
+PROGRESS_INTERVAL = 5
 
 
 class TaskBase():
@@ -21,6 +19,8 @@ class TaskBase():
         self.org_id = None  # org_id
         self.source = 'taskbase'  # 属性来源
         self.target = []  # 任务目标
+        self.progress_callback = None  # 任务进度的上报（如celery任务的update_progress）
+        self.progress_time = 0  # 上次上报进度的时间
 
     def get_option(self, key, options, default_option):
         '''从options中获取参数值
@@ -30,74 +30,31 @@ class TaskBase():
 
         return options[key]
 
+    def report_progress(self, message, force=False):
+        '''上报任务进度，两次上报的间隔不小于PROGRESS_INTERVAL秒（force为True时不限制）
+        '''
+        if not self.progress_callback:
+            return
+        now = time.time()
+        if not force and now - self.progress_time < PROGRESS_INTERVAL:
+            return
+        self.progress_time = now
+        self.progress_callback(message)
+
     def save_ip(self, data):
         '''保存ip资产相关的结果
         '''
-        ip_app = Ip()
-        port_app = Port()
-        port_attr_app = PortAttr()
-        result = {'ip': len(data), 'port': 0}
+        writer = IngestWriter(self.source, self.result_attr_keys, self.org_id)
+        writer.add_ips(data)
+        writer.flush()
 
-        for ip in data:
-            # 保存IP
-            if 'ip' not in ip:
-                continue
-            if self.org_id:
-                ip['org_id'] = self.org_id
-            ip_id = ip_app.save_and_update(ip)
-            if ip_id > 0:
-                # 保存每个端口数据
-                if 'port' not in ip:
-                    continue
-                result['port'] += len(ip['port'])
-                for port in ip['port']:
-                    port['ip_id'] = ip_id
-                    try:
-                        port_id = port_app.save_and_update(port)
-                        if port_id > 0:
-                            # 保存端口的属性
-                            for attr_key in self.result_attr_keys:
-                                if attr_key in port and port[attr_key]:
-                                    data_port_attr = {
-                                        'r_id': port_id, 'source': self.source, 'tag': attr_key,
-                                        'content': port[attr_key][:800]}
-                                    try:
-                                        port_attr_app.save_and_update(data_port_attr)
-                                    except Exception as e:
-                                        logger.error(traceback.format_exc())
-                                        logger.error('save port port attr:{}-{}-{}-{}'.format(ip['port'], port['port'],
-                                                                                            data_port_attr['tag'],
-                                                                                            data_port_attr['content']))
-                    except Exception as ex:
-                        logger.error(traceback.format_exc())
-                        logger.error('save ip port:{}-{}'.format(ip['port'], port['port']))
-        return result
+        return {'ip': writer.ip_count, 'port': writer.port_count, 'ip_rows_per_sec': writer.rows_per_second()}
 
     def save_domain(self, data):
         '''保存domain资产的相关结果
         '''
-        domain_app = Domain()
-        doamin_attr_app = DomainAttr()
-        result = {'domain': len(data)}
-        for domain in data:
-            if 'domain' not in domain:
-                continue
-            if self.org_id:
-                domain['org_id'] = self.org_id
-            # 保存到domain
-            domain_id = domain_app.save_and_update(domain)
-            if domain_id > 0:
-                # 保存domain的属性
-                for attr_key in ('CNAME', 'A', 'title', 'whatweb', 'server', 'httpx'):
-                    if attr_key in domain:
-                        for attr_value in domain[attr_key]:
-                            domain_attr = {'r_id': domain_id, 'source': self.source,
-                                           'tag': attr_key, 'content': attr_value[0:800]}
-                            try:
-                                doamin_attr_app.save_and_update(domain_attr)
-                            except Exception as e:
-                                logger.error(traceback.format_exc())
-                                logger.error('save domain attr:{}-{}-{}'.format(domain['domain'], domain_attr['tag'],
-                                                                                domain_attr['content']))
+        writer = IngestWriter(self.source, org_id=self.org_id)
+        writer.add_domains(data)
+        writer.flush()
 
-        return result
+        return {'domain': writer.domain_count, 'domain_rows_per_sec': writer.rows_per_second()}
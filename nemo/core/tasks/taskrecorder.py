@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+任务状态的记录：接收celery的任务事件，批量写入task表
+1. worker发送任务事件（worker_send_task_events），任务的执行过程中不再写数据库
+2. 同一任务在一批中的多个事件合并为一条记录，每FLUSH_INTERVAL秒或累积FLUSH_SIZE个任务时，以task_id（唯一索引）批量upsert
+3. 已结束的状态（SUCCESS、FAILURE、REVOKED）不会被同一批中较晚收到的未结束状态覆盖；已写入的结束状态由upsert的语句保护（见Task.upsert_expressions）
+4. 任务执行中的进度（task-progress事件，见UpdateTaskStatus.update_progress）写入progress_message
+用法：python3 -m nemo.core.tasks.taskrecorder，与celery worker、flower同时运行
+"""
+import socket
+import time
+import traceback
+from datetime import datetime
+
+from celery import states
+
+from nemo.common.utils.loggerutils import logger
+from nemo.core.database.task import Task as TaskDatabase
+from nemo.core.tasks.tasks import celery_app
+
+# 批量写入的间隔（秒）及任务数
+FLUSH_INTERVAL = 2
+FLUSH_SIZE = 200
+# 连接中断后重新连接的等待时间（秒）
+RECONNECT_INTERVAL = 5
+# 与task表字段的长度一致
+RESULT_MAX_LENGTH = 4000
+PROGRESS_MAX_LENGTH = 100
+
+# 任务事件对应的状态及时间字段
+EVENT_STATES = {
+    'task-received': (states.RECEIVED, 'received'),
+    'task-started': (states.STARTED, 'started'),
+    'task-succeeded': (states.SUCCESS, 'succeeded'),
+    'task-failed': (states.FAILURE, 'failed'),
+    'task-retried': (states.RETRY, 'retried'),
+    'task-revoked': (states.REVOKED, 'revoked'),
+}
+
+
+class TaskStateRecorder():
+    '''合并任务事件并批量写入task表
+    '''
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        # 待写入的任务：{task_id: {字段: 值}}
+        self.pending = {}
+        self.last_flush = time.time()
+
+    def on_event(self, event):
+        '''处理一个任务事件：合并到待写入的任务
+        '''
+        if not event.get('uuid'):
+            return
+        # 任务执行中发送的进度（UpdateTaskStatus.update_progress）
+        if event.get('type') == 'task-progress':
+            data = self.pending.setdefault(event['uuid'], {'task_id': event['uuid']})
+            data['progress_message'] = str(event.get('message', ''))[:PROGRESS_MAX_LENGTH]
+            self.check_flush()
+            return
+        if event.get('type') not in EVENT_STATES:
+            return
+        state, time_field = EVENT_STATES[event['type']]
+        data = self.pending.setdefault(event['uuid'], {'task_id': event['uuid']})
+        if not (data.get('state') in states.READY_STATES and state not in states.READY_STATES):
+            data['state'] = state
+        data[time_field] = datetime.fromtimestamp(event['timestamp']) if event.get('timestamp') else datetime.now()
+        if event.get('hostname'):
+            data['worker'] = event['hostname']
+        if event['type'] == 'task-received':
+            data['task_name'] = event.get('name', '').split('.')[-1]
+            data['args'] = event.get('args')
+            data['kwargs'] = event.get('kwargs')
+        elif event['type'] == 'task-succeeded':
+            data['result'] = str(event.get('result'))[:RESULT_MAX_LENGTH]
+        elif event['type'] in ('task-failed', 'task-retried') and event.get('exception'):
+            data['result'] = str(event['exception'])[:RESULT_MAX_LENGTH]
+        self.check_flush()
+
+    def check_flush(self):
+        '''累积的任务数或距上次写入的时间达到阈值时写入
+        '''
+        if len(self.pending) >= self.flush_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        '''批量写入待写入的任务
+        同一批中字段相同的任务一起upsert；task_name、args、kwargs只在新增时写入（已由web保存的不覆盖）
+        '''
+        self.last_flush = time.time()
+        if not self.pending:
+            return
+        groups = {}
+        for data in self.pending.values():
+            update_columns = tuple(sorted([k for k in data if k not in ('task_id', 'task_name', 'args', 'kwargs')]))
+            row = {'task_id': data['task_id'], 'task_name': data.get('task_name', ''), 'args': data.get('args'),
+                   'kwargs': data.get('kwargs'), 'state': data.get('state', states.PENDING)}
+            for k in update_columns:
+                row[k] = data[k]
+            groups.setdefault(update_columns, []).append(row)
+        try:
+            task_app = TaskDatabase()
+            for update_columns, rows in groups.items():
+                task_app.upsert_many(rows, ('task_id',), update_columns)
+        except Exception:
+            logger.error(traceback.format_exc())
+        self.pending = {}
+
+    def run(self):
+        '''接收任务事件，连接中断时重新连接
+        '''
+        while True:
+            try:
+                with celery_app.connection() as connection:
+                    receiver = celery_app.events.Receiver(connection, handlers={'*': self.on_event})
+                    while True:
+                        try:
+                            receiver.capture(limit=None, timeout=self.flush_interval, wakeup=False)
+                        except socket.timeout:
+                            # 没有新的事件时写入剩余的任务
+                            self.flush()
+            except KeyboardInterrupt:
+                self.flush()
+                break
+            except Exception:
+                logger.error(traceback.format_exc())
+                self.flush()
+                time.sleep(RECONNECT_INTERVAL)
+
+
+if __name__ == '__main__':
+    TaskStateRecorder().run()
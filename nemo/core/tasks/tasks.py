@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 # coding:utf-8
-import time
+import traceback
 from datetime import datetime
+from urllib.parse import quote_plus
 
-from celery import Celery, Task
+from celery import Celery, Task, chord
 
 from instance.config import ProductionConfig
+from nemo.common.utils.iputils import is_ipv6
+from nemo.common.utils.loggerutils import logger
+from nemo.core.database import sqlmetrics
 from nemo.core.database.task import Task as TaskDatabase
 from nemo.core.tasks.domain.domainscan import DomainScan
 from nemo.core.tasks.ipport.portscan import PortScan
@@ -17,18 +21,34 @@ from nemo.core.tasks.poc.xray import XRay
 
 broker = 'amqp://{}:{}@{}:{}/'.format(ProductionConfig.MQ_USERNAME,
                                       ProductionConfig.MQ_PASSWORD, ProductionConfig.MQ_HOST, ProductionConfig.MQ_PORT)
-celery_app = Celery('nemo', broker=broker, backend='rpc://')
+# 任务结果的存储：默认为rpc://；分片端口扫描的chord需要在worker之间共享任务结果，须配置MQ_RESULT_BACKEND
+if ProductionConfig.MQ_RESULT_BACKEND == 'mysql':
+    result_backend = 'db+mysql+pymysql://{}:{}@{}:{}/{}'.format(
+        quote_plus(ProductionConfig.DB_USERNAME), quote_plus(ProductionConfig.DB_PASSWORD), ProductionConfig.DB_HOST,
+        ProductionConfig.DB_PORT, ProductionConfig.DB_NAME)
+else:
+    result_backend = ProductionConfig.MQ_RESULT_BACKEND or 'rpc://'
+celery_app = Celery('nemo', broker=broker, backend=result_backend)
+# worker发送任务事件，由taskrecorder批量写入任务状态
+celery_app.conf.worker_send_task_events = True
+
+
+def shard_enabled():
+    '''分片端口扫描是否可用：chord需要共享的任务结果存储，rpc://不支持
+    '''
+    return not result_backend.startswith('rpc://')
 
 
 def save_task(task_id, task_name, kwargs, state):
     '''
     保存新的任务信息
+    taskrecorder可能已写入任务的事件，因此以task_id upsert，不覆盖已有的状态
     '''
     task_app = TaskDatabase()
     task_data = {'task_id': task_id, 'task_name': task_name, 'state': state, 'result': '',
                  'args': '()', 'kwargs': str(kwargs), 'received': datetime.now()}
 
-    task_app.save_and_update(task_data)
+    task_app.upsert_many([task_data], ('task_id',), ('task_name', 'args', 'kwargs'))
 
 
 def update_task(task_id, state, result=None, succeeded=None, failed=None, started=None, retried=None,
@@ -60,7 +80,12 @@ def update_task(task_id, state, result=None, succeeded=None, failed=None, starte
 
 class UpdateTaskStatus(Task):
     '''在celery的任务异步完成时，显示完成状态和结果
+    任务的状态由worker发送的任务事件经taskrecorder写入数据库，任务执行过程中不写task表
     '''
+    # 任务事件中结果的长度，与task表的result字段一致
+    resultrepr_maxsize = 4000
+    # 任务进度的长度，与task表的progress_message字段一致
+    progress_maxsize = 100
 
     def __init__(self):
         self.task_track_started = True
@@ -68,22 +93,34 @@ class UpdateTaskStatus(Task):
 
         super(UpdateTaskStatus, self).__init__()
 
+    def __call__(self, *args, **kwargs):
+        '''执行任务，并在任务结果中加入任务执行期间的数据库语句统计（合计及耗时最多的语句）
+        '''
+        with sqlmetrics.collect() as metrics:
+            retval = super(UpdateTaskStatus, self).__call__(*args, **kwargs)
+        if isinstance(retval, dict):
+            retval['db'] = metrics.to_dict(top=5, histogram=False)
+
+        return retval
+
+    def update_progress(self, message):
+        '''发送任务进度的事件（task-progress），由taskrecorder写入task表的progress_message
+        '''
+        try:
+            self.send_event('task-progress', message=str(message)[:self.progress_maxsize])
+        except Exception:
+            logger.error(traceback.format_exc())
+
     def on_success(self, retval, task_id, args, kwargs):
-        time.sleep(1)
         print('task {} done: {}'.format(task_id, retval))
-        update_task(task_id, 'SUCCESS', result=retval, succeeded=datetime.now())
         return super(UpdateTaskStatus, self).on_success(retval, task_id, args, kwargs)
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
-        time.sleep(1)
         print('task {} fail, reason: {}'.format(task_id, exc))
-        update_task(task_id, 'FAILURE', failed=datetime.now())
         return super(UpdateTaskStatus, self).on_failure(exc, task_id, args, kwargs, einfo)
 
     def on_retry(self, exc, task_id, args, kwargs, einfo):
-        time.sleep(1)
         print('task {} retry, reason: {}'.format(task_id, exc))
-        update_task(task_id, 'RETRY', retried=datetime.now())
 
         return super(UpdateTaskStatus, self).on_failure(exc, task_id, args, kwargs, einfo)
 
@@ -92,18 +129,55 @@ class UpdateTaskStatus(Task):
 def portscan(self, options):
     '''端口扫描综合任务
     '''
-    # 由于对数据库操作的并发未采用“锁”机制，导致写库的时候会出现异常，因此简单采用延时机制“降低”冲突
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
-    return PortScan().run(options)
+    portscan_app = PortScan()
+    portscan_app.progress_callback = self.update_progress
+
+    return portscan_app.run(options)
+
+
+@celery_app.task(base=UpdateTaskStatus, bind=True)
+def portscan_sharded(self, options):
+    '''分片的端口扫描：将目标（及端口）按估算的数据包数拆分为多个分片，由各worker并行扫描（celery group），
+    全部完成后由portscan_merge（chord的回调）合并结果，进行指纹识别并保存
+    '''
+    # 抛出异常，任务的状态为FAILURE
+    if not shard_enabled():
+        raise RuntimeError('sharded portscan requires MQ_RESULT_BACKEND (rpc:// does not support chord)')
+    shard_options = PortScan().shard(options)
+    if not shard_options:
+        return {'status': 'success', 'shards': 0}
+    shard_result = chord([portscan_shard.s(o) for o in shard_options])(portscan_merge.s(options))
+    self.update_progress('拆分为{}个分片，合并任务:{}'.format(len(shard_options), shard_result.id))
+
+    return {'status': 'success', 'shards': len(shard_options), 'merge_task_id': shard_result.id}
+
+
+@celery_app.task(base=UpdateTaskStatus, bind=True)
+def portscan_shard(self, options):
+    '''分片端口扫描的一个分片：扫描并保存结果，不进行指纹识别
+    '''
+    self.update_progress('分片{}: {}个主机，{}个数据包'.format(options['shard'], options['hosts'], options['packets']))
+    portscan_app = PortScan()
+    portscan_app.progress_callback = self.update_progress
+    result = portscan_app.run_shard(options)
+    self.update_progress('分片{}: 完成，{}个IP，{}个端口'.format(options['shard'], result['ip'], result['port']))
+
+    return result
+
+
+@celery_app.task(base=UpdateTaskStatus, bind=True)
+def portscan_merge(self, shard_results, options):
+    '''分片端口扫描的合并（chord的回调）：从数据库读取各分片保存的结果，进行IP归属地、指纹识别并保存
+    '''
+    self.update_progress('合并{}个分片的结果'.format(len(shard_results)))
+
+    return PortScan().merge(shard_results, options)
 
 
 @celery_app.task(base=UpdateTaskStatus, bind=True)
 def fofasearch(self, options):
     '''调用fofa API
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
     return Fofa().run(options)
 
 
@@ -111,8 +185,6 @@ def fofasearch(self, options):
 def shodansearch(self, options):
     '''调用shodan API
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
     return Shodan().run(options)
 
 
@@ -120,8 +192,6 @@ def shodansearch(self, options):
 def domainscan(self, options):
     '''域名收集综合信息
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
     return DomainScan().run(options)
 
 
@@ -129,8 +199,6 @@ def domainscan(self, options):
 def iplocation(self, options):
     '''IP归属地
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
     return IpLocation().run(options)
 
 
@@ -138,11 +206,9 @@ def iplocation(self, options):
 def domainscan_with_portscan(self, options):
     '''域名收集综合信息
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
-
     domainscan = DomainScan()
     portscan = PortScan()
+    portscan.progress_callback = self.update_progress
     # 域名任务
     domainscan.prepare(options)
     domain_list = domainscan.execute()
@@ -152,7 +218,8 @@ def domainscan_with_portscan(self, options):
     for domain in domain_list:
         if 'A' in domain and domain['A']:
             for ip in domain['A']:
-                if options['networkscan']:
+                # C段扫描只用于IPv4地址
+                if options['networkscan'] and not is_ipv6(ip):
                     network = ip.split('.')[0:3]
                     network.append('0/24')
                     ip_set.update(['.'.join(network)])
@@ -170,8 +237,6 @@ def domainscan_with_portscan(self, options):
 def pocsuite3(self, options):
     '''pocsuite3漏洞验证
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
     return Pocsuite3().run(options)
 
 
@@ -179,6 +244,4 @@ def pocsuite3(self, options):
 def xray(self, options):
     '''xray
     '''
-    time.sleep(1)
-    update_task(self.request.id, 'STARTED', started=datetime.now(), worker=self.request.hostname)
     return XRay().run(options)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+"""
+web server的并发性能测试：导出数据（/ip-export）期间/dashboard请求的响应时间
+1. 先单独请求/dashboard，统计基准的响应时间
+2. 再同时启动exports个导出请求，导出期间持续请求/dashboard，统计响应时间（p50、p99、最大值）
+   web server以gevent协程方式运行时，导出期间/dashboard的p99应与基准接近；未patch时会被导出请求阻塞
+用法：python3 -m nemo.web.benchmark [url] [password]，需先启动web server（python3 app.py）
+"""
+import sys
+import threading
+import time
+
+import requests
+
+from instance.config import ProductionConfig
+
+
+def percentile(values, p):
+    '''百分位数
+    '''
+    if not values:
+        return 0
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def login(url, password):
+    s = requests.Session()
+    s.post(url + '/login', data={'password': password})
+
+    return s
+
+
+def dashboard_latency(s, url, count=100, concurrency=4):
+    '''并发请求/dashboard，返回每个请求的响应时间（秒）
+    '''
+    latency = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(count // concurrency):
+            start_time = time.time()
+            s.post(url + '/dashboard')
+            with lock:
+                latency.append(time.time() - start_time)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return latency
+
+
+def run_benchmark(url='http://127.0.0.1:{}'.format(ProductionConfig.WEB_PORT), password=ProductionConfig.WEB_PASSWORD,
+                  count=200, concurrency=4, exports=2):
+    s = login(url, password)
+
+    def report(label, latency):
+        print('{}: {}次, p50:{:.3f}s p99:{:.3f}s max:{:.3f}s'.format(
+            label, len(latency), percentile(latency, 50), percentile(latency, 99), max(latency) if latency else 0))
+
+    report('dashboard', dashboard_latency(s, url, count, concurrency))
+
+    export_time = []
+
+    def export():
+        start_time = time.time()
+        r = login(url, password).get(url + '/ip-export')
+        export_time.append((time.time() - start_time, len(r.content)))
+
+    export_threads = [threading.Thread(target=export) for _ in range(exports)]
+    for t in export_threads:
+        t.start()
+    latency = []
+    while any([t.is_alive() for t in export_threads]):
+        latency.extend(dashboard_latency(s, url, concurrency * 10, concurrency))
+    for t in export_threads:
+        t.join()
+    report('dashboard(导出期间)', latency)
+    for elapsed, size in export_time:
+        print('ip-export: {:.1f}s, {}字节'.format(elapsed, size))
+
+
+if __name__ == '__main__':
+    run_benchmark(*sys.argv[1:3])
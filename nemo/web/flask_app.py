@@ -3,8 +3,11 @@
 import logging
 
 from flask import Flask
+from flask import request
 
 from instance.config import ProductionConfig
+from nemo.core.database import dbutils
+from nemo.core.database import searchcache
 from nemo.common.utils.loggerutils import web_handler
 from nemo.web.views.authenticate import authenticate
 from nemo.web.views.config_manager import config_manager
@@ -12,6 +15,7 @@ from nemo.web.views.dashboard import dashboard
 from nemo.web.views.domain_manager import domain_manager
 from nemo.web.views.index import index
 from nemo.web.views.ip_manager import ip_manager
+from nemo.web.views.metrics import metrics
 from nemo.web.views.org_manager import org_manager
 from nemo.web.views.task_manager import task_manager
 from nemo.web.views.vulnerability_manager import vulnerability_manager
@@ -32,3 +36,22 @@ web_app.register_blueprint(org_manager)
 web_app.register_blueprint(task_manager)
 web_app.register_blueprint(config_manager)
 web_app.register_blueprint(vulnerability_manager)
+web_app.register_blueprint(metrics)
+
+
+@web_app.before_request
+def refresh_search_cache():
+    '''每个请求读取一次查询缓存的共享版本号：celery worker等其它进程的写入使缓存失效
+    '''
+    if not request.path.startswith('/static/'):
+        searchcache.refresh()
+
+
+@web_app.before_request
+def set_db_timeout():
+    '''每个请求的数据库查询超时：导出及统计的请求允许较长的时间
+    '''
+    if request.path.endswith(('-export', '-statistics')):
+        dbutils.set_timeout(ProductionConfig.DB_EXPORT_TIMEOUT)
+    else:
+        dbutils.set_timeout(ProductionConfig.DB_QUERY_TIMEOUT)
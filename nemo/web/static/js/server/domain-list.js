@@ -1,3 +1,6 @@
+//键集分页的游标：记录每页起始位置对应的游标，顺序翻页时由服务端按游标查询
+var page_cursors = {};
+var page_next_start = 0;
 $(function () {
     $('#btnsiderbar').click();
     $('#select_org_id_search').val($('#hidden_org_id').val());
@@ -158,14 +161,20 @@ $(function () {
                 "type": "post",
                 "data": function (d) {
                     init_dataTables_defaultParam(d);
+                    page_next_start = d.start + d.length;
                     return $.extend({}, d, {
                         "org_id": $('#select_org_id_search').val(),
                         "ip_address": $('#ip_address').val(),
                         "domain_address": $('#domain_address').val(),
                         "color_tag": $('#select_color_tag').val(),
                         "memo_content": $('#memo_content').val(),
-                        "date_delta": $('#date_delta').val()
+                        "date_delta": $('#date_delta').val(),
+                        "cursor": page_cursors[d.start] || ''
                     });
+                },
+                "dataSrc": function (json) {
+                    if (json.cursor) page_cursors[page_next_start] = json.cursor;
+                    return json.data;
                 }
             },
             columns: [
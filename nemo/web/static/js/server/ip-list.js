@@ -1,3 +1,6 @@
+//键集分页的游标：记录每页起始位置对应的游标，顺序翻页时由服务端按游标查询
+var page_cursors = {};
+var page_next_start = 0;
 $(function () {
     $('#btnsiderbar').click();
     $('#select_org_id_search').val($('#hidden_org_id').val());
@@ -20,8 +23,13 @@ $(function () {
             checkIP[i] = $(this).val().split("|")[1];
         });
         $('#text_target').val(checkIP.join("\n"));
+        estimate_task();
         $('#newTask').modal('toggle');
     });
+    //估算端口扫描任务的执行时长
+    $("#text_target,#input_port,#input_rate").change(function () {
+        estimate_task();
+    });
     //执行新建任务Button
     $("#start_task").click(function () {
         const target = $('#text_target').val();
@@ -53,6 +61,7 @@ $(function () {
                     'fofasearch': $('#checkbox_fofasearch').is(":checked"),
                     'shodansearch': $('#checkbox_shodansearch').is(":checked"),
                     'subtask': $('#checkbox_subtask').is(":checked"),
+                    'shard': $('#checkbox_shard').is(":checked"),
                     'httpx': $('#checkbox_httpx').is(":checked"),
                     'exclude': exclude_ip,
                 }, function (data, e) {
@@ -208,6 +217,7 @@ $(function () {
                 "type": "post",
                 "data": function (d) {
                     init_dataTables_defaultParam(d);
+                    page_next_start = d.start + d.length;
                     return $.extend({}, d, {
                         "org_id": $('#select_org_id_search').val(),
                         "domain_address": $('#domain_address').val(),
@@ -218,8 +228,13 @@ $(function () {
                         "port_status": $('#port_status').val(),
                         "color_tag": $('#select_color_tag').val(),
                         "memo_content": $('#memo_content').val(),
-                        "date_delta": $('#date_delta').val()
+                        "date_delta": $('#date_delta').val(),
+                        "cursor": page_cursors[d.start] || ''
                     });
+                },
+                "dataSrc": function (json) {
+                    if (json.cursor) page_cursors[page_next_start] = json.cursor;
+                    return json.data;
                 }
             },
             columns: [
@@ -372,6 +387,33 @@ function load_nmap_config() {
     });
 }
 
+//估算端口扫描任务的执行时长
+function estimate_task() {
+    const target = $('#text_target').val();
+    if (!target) {
+        $('#text_estimate').text('');
+        return;
+    }
+    $.post("/task-estimate-portscan",
+        {
+            "target": target,
+            "port": $('#input_port').val(),
+            'rate': $('#input_rate').val(),
+        }, function (data, e) {
+            if (e === "success" && data['status'] == 'success') {
+                const r = data['result'];
+                let text = '预计：' + r['hosts'] + '个主机 × ' + r['ports'] + '个端口，单个任务约' + r['runtime']
+                    + '；分为' + r['shards'] + '个分片，每个分片约' + r['shard_runtime'];
+                if (r['skipped'].length > 0) {
+                    text += '；IPv6网段过大，不扫描：' + r['skipped'].join(',');
+                }
+                $('#text_estimate').text(text);
+            } else {
+                $('#text_estimate').text('');
+            }
+        });
+}
+
 //删除一个IP
 function delete_ip(id) {
     swal({
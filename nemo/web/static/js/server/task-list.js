@@ -52,7 +52,12 @@ $(function () {
                     data: "state", title: "状态", width: "8%",
                     "render": function (data, type, row) {
                         if (data == 'STARTED' || data == 'RECEIVED' || data == 'PENDING') {
-                            return data + '<button class="btn btn-sm btn-danger" type="button" onclick="stop_task(\'' + row['task_id'] + '\')" >&nbsp;中止&nbsp;</button>';
+                            var strData = data + '<button class="btn btn-sm btn-danger" type="button" onclick="stop_task(\'' + row['task_id'] + '\')" >&nbsp;中止&nbsp;</button>';
+                            //任务执行中的进度
+                            if (row['progress_message']) {
+                                strData += '<br><small class="text-muted">' + $('<div>').text(row['progress_message']).html() + '</small>';
+                            }
+                            return strData;
                         } else return data;
                     }
                 },
@@ -1,3 +1,6 @@
+//键集分页的游标：记录每页起始位置对应的游标，顺序翻页时由服务端按游标查询
+var page_cursors = {};
+var page_next_start = 0;
 $(function () {
     $('#btnsiderbar').click();
     $('#vulnerability_table').DataTable(
@@ -14,12 +17,18 @@ $(function () {
                 "type": "post",
                 "data": function (d) {
                     init_dataTables_defaultParam(d);
+                    page_next_start = d.start + d.length;
                     return $.extend({}, d, {
                         "vul_source": $('#vul_source').val(),
                         "vul_target": $('#vul_target').val(),
                         "vul_poc_file": $('#vul_poc_file').val(),
-                        "date_delta": $('#date_delta').val()
+                        "date_delta": $('#date_delta').val(),
+                        "cursor": page_cursors[d.start] || ''
                     });
+                },
+                "dataSrc": function (json) {
+                    if (json.cursor) page_cursors[page_next_start] = json.cursor;
+                    return json.data;
                 }
             },
             columns: [
@@ -12,12 +12,11 @@ from flask import session
 from nemo.common.utils.assertexport import export_domains
 from nemo.common.utils.assertinfoparser import AssertInfoParser
 from nemo.common.utils.loggerutils import logger
-from nemo.core.database.attr import DomainAttr
+from nemo.common.utils.pagecursor import decode_cursor, encode_cursor
 from nemo.core.database.colortag import DomainColorTag
 from nemo.core.database.domain import Domain
 from nemo.core.database.memo import DomainMemo
 from nemo.core.database.organization import Organization
-from nemo.core.database.vulnerability import Vulnerability
 from nemo.core.tasks.poc.pocsuite3 import Pocsuite3
 from nemo.core.tasks.poc.xray import XRay
 from .authenticate import login_check
@@ -46,9 +45,7 @@ def domain_asset_view():
         return render_template('domain-list.html', data=data)
 
     domain_list = []
-    org_table = Organization()
     domain_table = Domain()
-    domain_attr_table = DomainAttr()
     api = AssertInfoParser()
     index = 1
     json_data = {}
@@ -69,44 +66,47 @@ def domain_asset_view():
         session['session_org_id'] = org_id
 
         count = 0
-        domains = domain_table.gets_by_search(org_id, domain_address, ip_address, color_tag, memo_content, date_delta,
-                                              page=start // length + 1, rows_per_page=length)
+        cursor = ''
+        search = dict(org_id=org_id, domain=domain_address, ip=ip_address, color_tag=color_tag,
+                      memo_content=memo_content, date_delta=date_delta)
+        # 顺序翻页时使用上一页返回的游标（键集分页），否则使用limit offset分页
+        after = decode_cursor(request.form.get('cursor'), start, search)
+        domains = domain_table.gets_by_search(**search, page=start // length + 1, rows_per_page=length, after=after)
         if domains:
+            # 批量读取本页所有域名的聚合信息及关联信息
+            domains_summary = api.get_domains_summary(domains)
+            domains_relation_info = api.get_domains_relation_info(domains)
             for domain_row in domains:
-                ips = domain_attr_table.gets(
-                    query={'tag': 'A', 'r_id': domain_row['id']})
-                domain_info = api.get_domain_info(domain_row['id'])
-                # 获取关联的漏洞信息：
-                vul_info = []
-                vul_results = Vulnerability().gets({'target': domain_row['domain']})
-                if vul_results and len(vul_results) > 0:
-                    for v in vul_results:
-                        vul_info.append('{}/{}'.format(v['poc_file'], v['source']))
+                summary = domains_summary[domain_row['id']]
+                relation_info = domains_relation_info[domain_row['id']]
                 domain_list.append({
                     "id": domain_row['id'],
                     "index": index + start,
-                    "color_tag": domain_info['color_tag'],
-                    "memo_content": domain_info['memo'],
+                    "color_tag": relation_info['color_tag'],
+                    "memo_content": relation_info['memo'],
                     "domain": domain_row['domain'],
                     "ip": ', '.join(set(
-                        ['<a href="/ip-info?ip={0}" target="_blank">{0}</a>'.format(ip_row['content']) for ip_row in
-                         ips])),
-                    "org_name": org_table.get(int(domain_row['org_id']))['org_name'] if domain_row['org_id'] else '',
+                        ['<a href="/ip-info?ip={0}" target="_blank">{0}</a>'.format(ip) for ip in
+                         summary['ip']])),
+                    "org_name": relation_info['org_name'],
                     "create_time": str(domain_row['create_datetime']),
                     "update_time": str(domain_row['update_datetime']),
-                    'port': domain_info['port'],
-                    'title': ', '.join(domain_info['title']),
-                    'banner': ', '.join(domain_info['banner']),
-                    'vulnerability': '\r\n'.join(vul_info)
+                    'port': summary['port'],
+                    'title': ', '.join(summary['title']),
+                    'banner': ', '.join(summary['banner']),
+                    'vulnerability': '\r\n'.join(summary['vulnerability'])
                 })
                 index += 1
-            count = domain_table.count_by_search(
-                org_id, domain_address, ip_address, color_tag, memo_content, date_delta)
+            count = domain_table.count_by_search(**search)
+            # 下一页的游标
+            if len(domains) == length:
+                cursor = encode_cursor(start + length, domain_table.keyset_value(domains[-1]), search)
         json_data = {
             'draw': draw,
             'recordsTotal': count,
             'recordsFiltered': count,
-            'data': domain_list
+            'data': domain_list,
+            'cursor': cursor
         }
     except Exception as e:
         logger.error(traceback.format_exc())
@@ -142,7 +142,11 @@ def domain_asset_info_view():
 def delete_domain_view(domain_id):
     '''删除一个DOMAIN
     '''
+    api = AssertInfoParser()
+    ip_ids = api.get_domains_linked_ip_ids([domain_id])
     rows = Domain().delete(domain_id)
+    # DOMAIN的聚合信息随DOMAIN删除，更新A记录对应的IP的聚合信息
+    api.refresh_ips_summary(ip_ids, False)
 
     return jsonify({'status': 'success', 'msg': rows})
 
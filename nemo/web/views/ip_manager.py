@@ -13,14 +13,16 @@ from flask import session
 from nemo.common.utils.assertexport import export_ips
 from nemo.common.utils.assertinfoparser import AssertInfoParser
 from nemo.common.utils.loggerutils import logger
+from nemo.common.utils.pagecursor import decode_cursor, encode_cursor
 from nemo.core.database.attr import PortAttr
 from nemo.core.database.colortag import IpColorTag
 from nemo.core.database.ip import Ip
 from nemo.core.database.memo import IpMemo
 from nemo.core.database.organization import Organization
-from nemo.core.database.vulnerability import Vulnerability
+from nemo.core.database.port import Port
 from nemo.core.tasks.poc.pocsuite3 import Pocsuite3
 from nemo.core.tasks.poc.xray import XRay
+from nemo.core.tasks.taskapi_v2 import TaskAPI
 from .authenticate import login_check
 
 ip_manager = Blueprint('ip_manager', __name__)
@@ -41,14 +43,12 @@ def ip_asset_view():
         data = {'org_list': org_list, 'ip_address_ip': session.get('ip_address_ip', default=''),
                 'domain_address': session.get('domain_address', default=''), 'port': session.get('port', default=''),
                 'session_org_id': session.get('session_org_id', default=''),
-                'pocsuite3_poc_files': Pocsuite3().load_poc_files(), 'xray_poc_files': XRay().load_poc_files()}
+                'pocsuite3_poc_files': Pocsuite3().load_poc_files(), 'xray_poc_files': XRay().load_poc_files(),
+                'shard_enabled': TaskAPI().shard_enabled()}
 
         return render_template('ip-list.html', data=data)
 
     ip_table = Ip()
-    org_table = Organization()
-    ip_color_tag_table = IpColorTag()
-    ip_memo_table = IpMemo()
     aip = AssertInfoParser()
     ip_list = []
     json_data = {}
@@ -75,62 +75,58 @@ def ip_asset_view():
         session['session_org_id'] = org_id
 
         count = 0
-        ips = ip_table.gets_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port, content=content,
-                                      iplocation=iplocation,
-                                      port_status=port_status, color_tag=color_tag, memo_content=memo_content,
-                                      date_delta=date_delta,
-                                      page=(start // length) + 1, rows_per_page=length)
+        cursor = ''
+        search = dict(org_id=org_id, domain=domain_address, ip=ip_address, port=port, content=content,
+                      iplocation=iplocation, port_status=port_status, color_tag=color_tag,
+                      memo_content=memo_content, date_delta=date_delta)
+        # 顺序翻页时使用上一页返回的游标（键集分页），否则使用limit offset分页
+        after = decode_cursor(request.form.get('cursor'), start, search)
+        ips = ip_table.gets_by_search(**search, page=(start // length) + 1, rows_per_page=length, after=after)
         if ips:
+            # 批量读取本页所有IP的聚合信息及关联信息
+            ips_summary = aip.get_ips_summary(ips)
+            ips_relation_info = aip.get_ips_relation_info(ips)
             for ip_row in ips:
-                # 查询每一个IP的详细属性
-                port_list, title_set, banner_set, _, port_status_dict = aip.get_ip_port_info(
-                    ip_row['ip'], ip_row['id'])
+                summary = ips_summary[ip_row['id']]
+                port_status_dict = summary['port_status']
+                relation_info = ips_relation_info[ip_row['id']]
                 # 端口+HTTP状态码
                 port_with_status_list = []
-                for p in port_list:
+                for p in summary['port']:
                     if str(p) in port_status_dict and re.match(r'^\d{3}$', port_status_dict[str(p)]):
                         port_with_status_list.append(
                             "{}[{}]".format(p, port_status_dict[str(p)]))
                     else:
                         port_with_status_list.append(str(p))
-                # 获取颜色标记
-                color_tag_obj = ip_color_tag_table.get(ip_row['id'])
-                # 获取备忘录信息
-                memo_obj = ip_memo_table.get(ip_row['id'])
-                # 获取IP关联的漏洞信息：
-                vul_info = []
-                vul_results = Vulnerability().gets({'target': ip_row['ip']})
-                if vul_results and len(vul_results) > 0:
-                    for v in vul_results:
-                        vul_info.append('{}/{}'.format(v['poc_file'], v['source']))
                 # 显示的数据
                 ip_list.append({
                     'id': ip_row['id'],
                     "index": index + start,
-                    'color_tag': color_tag_obj['color'] if color_tag_obj else '',
-                    'memo_content': memo_obj['content'] if memo_obj else '',
-                    'vulnerability': '\r\n'.join(vul_info),
-                    "org_name": org_table.get(int(ip_row['org_id']))['org_name'] if ip_row['org_id'] else '',
+                    'color_tag': relation_info['color_tag'],
+                    'memo_content': relation_info['memo'],
+                    'vulnerability': '\r\n'.join(summary['vulnerability']),
+                    "org_name": relation_info['org_name'],
                     "ip": ip_row['ip'],
                     "status": ip_row['status'],
                     "location": ip_row['location'].split(',')[0] if ip_row['location'] else '',
                     "create_time": str(ip_row['create_datetime']),
                     "update_time": str(ip_row['update_datetime']),
                     "port": port_with_status_list,
-                    "title": ', '.join(list(title_set)),
-                    "banner": ', '.join(list(banner_set))
+                    "title": ', '.join(summary['title']),
+                    "banner": ', '.join(summary['banner'])
                 })
                 index += 1
             # 查询的记录数量
-            count = ip_table.count_by_search(org_id=org_id, domain=domain_address, ip=ip_address, port=port,
-                                             content=content,
-                                             iplocation=iplocation, port_status=port_status, color_tag=color_tag,
-                                             memo_content=memo_content, date_delta=date_delta)
+            count = ip_table.count_by_search(**search)
+            # 下一页的游标
+            if len(ips) == length:
+                cursor = encode_cursor(start + length, ip_table.keyset_value(ips[-1]), search)
         json_data = {
             'draw': draw,
             'recordsTotal': count,
             'recordsFiltered': count,
-            'data': ip_list
+            'data': ip_list,
+            'cursor': cursor
         }
 
     except Exception as e:
@@ -166,7 +162,14 @@ def ip_asset_info_view():
 def delete_port_attr_view(port_attr_id):
     '''删除一个端口的属性记录
     '''
-    rows = PortAttr().delete(port_attr_id)
+    port_attr_app = PortAttr()
+    port_attr_obj = port_attr_app.get(port_attr_id)
+    rows = port_attr_app.delete(port_attr_id)
+    # 更新IP的聚合信息
+    if port_attr_obj:
+        port_obj = Port().get(port_attr_obj['r_id'])
+        if port_obj:
+            AssertInfoParser().refresh_ips_summary([port_obj['ip_id']])
 
     return jsonify({'status': 'success', 'msg': rows})
 
@@ -176,7 +179,13 @@ def delete_port_attr_view(port_attr_id):
 def delete_ip_view(ip_id):
     '''删除一个IP
     '''
-    rows = Ip().delete(ip_id)
+    ip_app = Ip()
+    aip = AssertInfoParser()
+    ip_obj = ip_app.get(ip_id)
+    rows = ip_app.delete(ip_id)
+    # IP的聚合信息随IP删除，更新A记录为该IP的域名的聚合信息
+    if ip_obj:
+        aip.refresh_domains_summary(aip.get_ips_linked_domain_ids([ip_obj['ip']]), False)
 
     return jsonify({'status': 'success', 'msg': rows})
 
@@ -222,30 +231,31 @@ def ip_statistics_view():
     memo_content = request.args.get('memo_content')
     date_delta = request.args.get('date_delta')
 
-    ip_list, ip_c_set, port_set, port_count_dict, ip_port_list, location_dict = AssertInfoParser().statistics_ip(
+    ip_count, ip_list, ip_c_set, port_set, port_count_dict, ip_port_count, ip_port_list, location_dict = AssertInfoParser().statistics_ip(
         org_id, domain_address, ip_address, port, content, iplocation, port_status, color_tag, memo_content, date_delta)
-    data = ['Port: ({})'.format(len(port_set)), ','.join([str(x) for x in sorted(port_set)])]
-
-    port_count_list = sorted(port_count_dict.items(),
-                             key=lambda x: x[1], reverse=True)
-    data.append('\nPort Count:')
-    for pc in port_count_list:
-        data.append('{:<6}:{}'.format(pc[0], pc[1]))
-
-    data.append('\nNetwork: ({})'.format(len(ip_c_set)))
-    data.extend(sorted(ip_c_set))
-    data.append('\nIP: ({})'.format(len(ip_list)))
-    data.extend(ip_list)
-    data.append('\nTarget: ({})'.format(len(ip_port_list)))
-    data.extend(ip_port_list)
-
-    data.append('\nLocation: ({})'.format(len(location_dict)))
-    location_sorted = sorted(location_dict.items(), key=lambda d: d[1], reverse=True)
-    for d in location_sorted:
-        data.append("{} :{}".format(d[0], d[1]))
 
-    response = Response(
-        '\n'.join(data), content_type='application/octet-stream')
+    def generate():
+        '''逐行输出统计结果，IP及Target列表从数据库逐批读取
+        '''
+        yield 'Port: ({})\n'.format(len(port_set))
+        yield ','.join([str(x) for x in sorted(port_set)])
+        yield '\n\nPort Count:'
+        for pc in port_count_dict.items():
+            yield '\n{:<6}:{}'.format(pc[0], pc[1])
+        yield '\n\nNetwork: ({})'.format(len(ip_c_set))
+        for ip_c in sorted(ip_c_set):
+            yield '\n' + ip_c
+        yield '\n\nIP: ({})'.format(ip_count)
+        for ip in ip_list:
+            yield '\n' + ip
+        yield '\n\nTarget: ({})'.format(ip_port_count)
+        for ip_port in ip_port_list:
+            yield '\n' + ip_port
+        yield '\n\nLocation: ({})'.format(len(location_dict))
+        for d in location_dict.items():
+            yield "\n{} :{}".format(d[0], d[1])
+
+    response = Response(generate(), content_type='application/octet-stream')
     response.headers["Content-disposition"] = 'attachment; filename={}'.format(
         "ip-statistics.txt")
 
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from flask import Blueprint
+from flask import jsonify
+from flask import request
+
+from nemo.core.database import sqlmetrics
+from .authenticate import login_check
+
+metrics = Blueprint('metrics', __name__)
+
+
+@metrics.route('/metrics', methods=['GET'])
+@login_check
+def view_metrics():
+    '''web进程的数据库语句统计：按合计耗时倒序的语句指纹、耗时直方图、行数及获取连接的等待时间
+    top:       只返回合计耗时最多的top条语句
+    histogram: 是否返回耗时直方图，默认返回
+    '''
+    top = request.args.get('top', type=int)
+    histogram = request.args.get('histogram', '1') != '0'
+
+    return jsonify(sqlmetrics.snapshot(top, histogram))
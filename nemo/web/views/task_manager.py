@@ -13,6 +13,7 @@ from nemo.common.utils.config import load_config
 from nemo.common.utils.loggerutils import logger
 from nemo.core.database.task import Task
 from nemo.core.tasks.poc.pocsuite3 import Pocsuite3
+from nemo.core.tasks.planner import estimate, plan_shards
 from nemo.core.tasks.poc.xray import XRay
 from nemo.core.tasks.taskapi_v2 import TaskAPI
 from .authenticate import login_check
@@ -68,18 +69,21 @@ def task_start_portscan_view():
         fofasearch = request.form.get('fofasearch')
         shodansearch = request.form.get('shodansearch')
         subtask = request.form.get('subtask')
+        shard = request.form.get('shard')
         portscan_bin = request.form.get('bin')
         httpx = request.form.get('httpx')
         exclude = request.form.get('exclude')
 
         if not target:
             return jsonify({'status': 'fail', 'msg': 'no target or port'})
+        if _str2bool(portscan) and _str2bool(shard) and not taskapi.shard_enabled():
+            return jsonify({'status': 'fail', 'msg': 'sharded portscan requires MQ_RESULT_BACKEND'})
         result = {'status': 'success', 'result': {'task-id': 0}}
         # 格式化tatget
         target = list(set([x.strip() for x in target.split('\n')]))
-        # 子任务模式，将每一个目标拆按行成分成多个目标分别启动
+        # 子任务模式，将目标拆分为预计执行时长相近的多个分片分别启动（端口不拆分）
         if _str2bool(subtask):
-            task_target = [[x] for x in target]
+            task_target = [shard['target'] for shard in plan_shards(target, port, rate, split_port=False)]
         else:
             task_target = [target]
         for t in task_target:
@@ -89,10 +93,10 @@ def task_start_portscan_view():
                        'iplocation': _str2bool(iplocation), 'exclude': exclude,
                        'whatweb': _str2bool(whatweb), 'httpx': _str2bool(httpx),
                        }
-            # 启动portscan任务
+            # 启动portscan任务：分片模式将目标及端口拆分为多个分片由各worker并行扫描
             if _str2bool(portscan):
                 result = taskapi.start_task(
-                    'portscan', kwargs={'options': deepcopy(options)})
+                    'portscan_sharded' if _str2bool(shard) else 'portscan', kwargs={'options': deepcopy(options)})
             # IP归属地：如果有portscan任务，则在portscan启动，否则单独启动任务
             if _str2bool(iplocation) and not _str2bool(portscan):
                 result = taskapi.start_task(
@@ -113,6 +117,29 @@ def task_start_portscan_view():
         return jsonify({'status': 'fail', 'msg': str(e)})
 
 
+@task_manager.route('/task-estimate-portscan', methods=['POST'])
+@login_check
+def task_estimate_portscan_view():
+    '''估算IP端口扫描任务的执行时长
+    '''
+    config_datajson = load_config()
+    try:
+        target = request.form.get('target', default='')
+        port = request.form.get('port') or config_datajson['nmap']['port']
+        rate = request.form.get('rate') or config_datajson['nmap']['rate']
+        target = list(set([x.strip() for x in target.split('\n') if x.strip()]))
+        if not target:
+            return jsonify({'status': 'fail', 'msg': 'no target'})
+        result = estimate(target, port, rate)
+        result['runtime'] = _format_runtime(result['seconds'])
+        result['shard_runtime'] = _format_runtime(result['shard_seconds'])
+
+        return jsonify({'status': 'success', 'result': result})
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        return jsonify({'status': 'fail', 'msg': str(e)})
+
+
 @task_manager.route('/task-start-domainscan', methods=['POST'])
 @login_check
 def task_start_domainscan_view():
@@ -240,7 +267,8 @@ def task_list_view():
         for row in task_results:
             task = {'index': index + start, 'id': row['id'], 'task_id': row['task_id'],
                     'worker': row['worker'] if row['worker'] else '',
-                    'task_name': row['task_name'], 'state': row['state'], 'result': row['result']}
+                    'task_name': row['task_name'], 'state': row['state'], 'result': row['result'],
+                    'progress_message': row['progress_message'] if row['progress_message'] else ''}
             row_args = ''
             if row['kwargs']:
                 if len(row['kwargs']) > 200:
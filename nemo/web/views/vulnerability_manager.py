@@ -7,7 +7,9 @@ from flask import jsonify
 from flask import render_template
 from flask import request
 
+from nemo.common.utils.assertinfoparser import AssertInfoParser
 from nemo.common.utils.loggerutils import logger
+from nemo.common.utils.pagecursor import decode_cursor, encode_cursor
 from nemo.core.database.vulnerability import Vulnerability
 from .authenticate import login_check
 
@@ -40,9 +42,11 @@ def vulnerability_list_view():
         date_delta = request.form.get('date_delta')
 
         vul_app = Vulnerability()
-        vul_results = vul_app.gets_by_search(target=vul_target, poc_file=vul_poc_file, source=vul_source,
-                                             date_delta=date_delta,
-                                             page=(start // length) + 1, rows_per_page=length)
+        cursor = ''
+        search = dict(target=vul_target, poc_file=vul_poc_file, source=vul_source, date_delta=date_delta)
+        # 顺序翻页时使用上一页返回的游标（键集分页），否则使用limit offset分页
+        after = decode_cursor(request.form.get('cursor'), start, search)
+        vul_results = vul_app.gets_by_search(**search, page=(start // length) + 1, rows_per_page=length, after=after)
         for row in vul_results:
             vul = {'id': row['id'], 'index': index, 'target': row['target'], 'url': row['url'],
                    'poc_file': row['poc_file'], 'source': row['source']}
@@ -51,13 +55,16 @@ def vulnerability_list_view():
             vul_list.append(vul)
             index += 1
 
-        count = vul_app.count_by_search(target=vul_target, poc_file=vul_poc_file, source=vul_source,
-                                        date_delta=date_delta, )
+        count = vul_app.count_by_search(**search)
+        # 下一页的游标
+        if vul_results and len(vul_results) == length:
+            cursor = encode_cursor(start + length, vul_app.keyset_value(vul_results[-1]), search)
         json_data = {
             'draw': draw,
             'recordsTotal': count,
             'recordsFiltered': count,
-            'data': vul_list
+            'data': vul_list,
+            'cursor': cursor
         }
     except Exception as e:
         logger.error(traceback.format_exc())
@@ -95,6 +102,10 @@ def vulnerability_delete_view():
         return jsonify({'status': 'fail'})
 
     vul_app = Vulnerability()
+    vul_obj = vul_app.get(id)
     vul_app.delete(id)
+    # 更新漏洞目标的聚合信息
+    if vul_obj:
+        AssertInfoParser().refresh_targets_summary([vul_obj['target']])
 
     return jsonify({'status': 'success'})
@@ -39,7 +39,10 @@ CREATE TABLE `task` (
   `progress_message` varchar(100) DEFAULT NULL,
   `create_datetime` datetime NOT NULL,
   `update_datetime` datetime NOT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_task_task_id` (`task_id`),
+  KEY `index_task_state` (`state`),
+  KEY `index_task_update_datetime` (`update_datetime`)
 ) ENGINE=InnoDB AUTO_INCREMENT=89 DEFAULT CHARSET=utf8mb4;
 
 -- ----------------------------
@@ -56,7 +59,10 @@ CREATE TABLE `vulnerability` (
   `hash` char(32) NOT NULL,
   `create_datetime` datetime NOT NULL,
   `update_datetime` datetime NOT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `index_vulnerability_hash` (`hash`),
+  KEY `index_vulnerability_target` (`target`),
+  KEY `index_vulnerability_update_datetime` (`update_datetime`)
 ) ENGINE=InnoDB AUTO_INCREMENT=15 DEFAULT CHARSET=utf8mb4;
 
 SET FOREIGN_KEY_CHECKS = 1;